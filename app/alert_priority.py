@@ -0,0 +1,94 @@
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable
+
+from app.config import (
+    ALERT_PRIORITY_ENABLED,
+    ALERT_LANE,
+    ALERT_PROMOTE_FROM,
+    ALERT_MIN_LEVEL,
+    ALERT_SCORE_THRESHOLD,
+)
+from app.constants import COMMENT_TYPES, TOPIC_TYPES, NEWS_TOPIC_TYPE, NEGATIVE_LEXICON
+from app.fingerprint import normalize_keywords
+from app.metrics import ALERT_ESTIMATES, ALERT_OUTCOMES, TIME_TO_ALERT
+from app.nodes.format_output import calculate_log_level
+
+# Một regex cho cả lexicon, cụm dài match trước; \b theo unicode nên không match giữa từ
+_NEGATIVE_PATTERN = re.compile(
+    r"\b(?:" + "|".join(re.escape(w) for w in sorted(NEGATIVE_LEXICON, key=len, reverse=True)) + r")\b"
+)
+_PROMOTE_FROM = {lane.strip() for lane in ALERT_PROMOTE_FROM.split(",") if lane.strip()}
+_COMMENT_TYPES = set(COMMENT_TYPES)
+_TOPIC_TYPES = set(TOPIC_TYPES)
+
+# Số hit coi là "đủ mạnh"; nhiều hơn không tăng score
+_KEYWORD_HITS_CAP = 3
+_NEGATIVE_HITS_CAP = 3
+
+
+def potential_level(content_type: str) -> int:
+    """log_level cao nhất type này có thể đạt (khi LLM kết luận negative + targeted)"""
+    if content_type == NEWS_TOPIC_TYPE:
+        return 3
+    if content_type in _TOPIC_TYPES:
+        return 2
+    if content_type in _COMMENT_TYPES:
+        return 1
+    return 0
+
+
+@dataclass(frozen=True)
+class AlertEstimate:
+    """Ước tính khả năng thành cảnh báo trước khi gọi LLM"""
+    level: int
+    keyword_hits: int
+    negative_hits: int
+    score: float  # 0..1
+
+    @property
+    def high(self) -> bool:
+        return self.level >= ALERT_MIN_LEVEL and self.score >= ALERT_SCORE_THRESHOLD
+
+    @property
+    def priority(self) -> str:
+        return "high" if self.high else "normal"
+
+
+# Request không nhắc tới keyword (không gọi LLM, không thể thành cảnh báo)
+NO_ALERT = AlertEstimate(level=0, keyword_hits=0, negative_hits=0, score=0.0)
+
+
+def estimate_alert(text: str, content_type: str, keywords: Iterable[str]) -> AlertEstimate:
+    """
+    Pre-scoring rẻ (không gọi LLM): log_level tiềm năng theo type, độ mạnh keyword hit
+    (số lần nhắc) và số từ tiêu cực trong text
+    """
+    level = potential_level(content_type)
+    lowered = text.lower()
+    keyword_hits = sum(lowered.count(k) for k in normalize_keywords(keywords))
+    negative_hits = len(_NEGATIVE_PATTERN.findall(lowered)) if level and keyword_hits else 0
+
+    keyword_strength = min(keyword_hits, _KEYWORD_HITS_CAP) / _KEYWORD_HITS_CAP
+    negativity = min(negative_hits, _NEGATIVE_HITS_CAP) / _NEGATIVE_HITS_CAP
+    score = (level / 3) * (0.4 + 0.6 * keyword_strength) * negativity if keyword_hits else 0.0
+    estimate = AlertEstimate(level, keyword_hits, negative_hits, round(score, 3))
+    ALERT_ESTIMATES.labels(level=str(level), priority=estimate.priority).inc()
+    return estimate
+
+
+def alert_lane(lane: str, estimate: AlertEstimate) -> str:
+    """Nâng item có khả năng cảnh báo cao từ lane thường lên ALERT_LANE"""
+    if ALERT_PRIORITY_ENABLED and estimate.high and lane in _PROMOTE_FROM:
+        return ALERT_LANE
+    return lane
+
+
+def record_alert_outcome(estimate: AlertEstimate, content_type: str, result: Dict[str, Any], started_at: float) -> int:
+    """So ước tính với log_level thật; item log_level >= 2 ghi time-to-alert. Trả về log_level"""
+    log_level = calculate_log_level(result.get("sentiment"), content_type, result.get("targeted"))
+    ALERT_OUTCOMES.labels(priority=estimate.priority, log_level=str(log_level)).inc()
+    if log_level >= 2:
+        TIME_TO_ALERT.labels(log_level=str(log_level), priority=estimate.priority).observe(time.time() - started_at)
+    return log_level
@@ -0,0 +1,347 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import httpx
+import orjson
+
+from app.config import (
+    ALERT_STREAM_ENABLED,
+    ALERT_STREAM_BACKEND,
+    ALERT_STREAM_URL,
+    ALERT_STREAM_KEY,
+    ALERT_STREAM_MAXLEN,
+    ALERT_STREAM_MIN_LEVEL,
+    ALERT_STREAM_MAX_BUFFER,
+    ALERT_STREAM_BATCH_SIZE,
+    ALERT_WEBHOOK_URL,
+    ALERT_WEBHOOK_BATCH_SIZE,
+    ALERT_WEBHOOK_FLUSH_INTERVAL,
+    ALERT_WEBHOOK_TIMEOUT,
+    ALERT_DEDUPE_TTL,
+    ALERT_DEDUPE_MAX_KEYS,
+)
+from app.metrics import ALERT_EVENTS, ALERT_EVENTS_BUFFERED, ALERT_PUBLISH_LATENCY
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+# Redis lỗi → tạm ngưng gửi một lúc (event vẫn nằm trong buffer tới khi đầy)
+_RETRY_BACKOFF = 5.0
+
+
+class _Sink:
+    """
+    Buffer có giới hạn + background task gửi theo batch.
+    offer() không block: buffer đầy thì drop event và đếm metric
+    """
+
+    name = "sink"
+
+    def __init__(self, batch_size: int, flush_interval: float, eager: bool, max_buffer: int = ALERT_STREAM_MAX_BUFFER):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # eager: wake ngay khi có event (latency ms), batch = những gì dồn lại trong lúc gửi batch trước
+        self.eager = eager
+        self.max_buffer = max_buffer
+        self._buffer: Deque[Tuple[float, Dict[str, Any]]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._failed_at = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task = asyncio.create_task(self._run(), name=f"alert-{self.name}")
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        if self._task:
+            # Dừng bằng flag thay vì cancel: cancel trùng lúc wakeup được set có thể bị wait_for nuốt mất
+            self._closing = True
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(self._task, timeout=timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+            self._task = None
+        if self._buffer:
+            try:
+                await asyncio.wait_for(self._drain(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            if self._buffer:
+                ALERT_EVENTS.labels(sink=self.name, status="dropped").inc(len(self._buffer))
+                logger.error(f"Alert {self.name}: {len(self._buffer)} events lost on shutdown")
+                self._buffer.clear()
+        await self.close()
+
+    def offer(self, event: Dict[str, Any], created: float) -> bool:
+        if len(self._buffer) >= self.max_buffer:
+            ALERT_EVENTS.labels(sink=self.name, status="dropped").inc()
+            return False
+        self._buffer.append((created, event))
+        ALERT_EVENTS_BUFFERED.labels(sink=self.name).set(len(self._buffer))
+        if self._wakeup and (self.eager or len(self._buffer) >= self.batch_size):
+            self._wakeup.set()
+        return True
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._closing:
+                break
+            if time.monotonic() - self._failed_at < _RETRY_BACKOFF:
+                continue
+            try:
+                await self._drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Alert {self.name} flush error: {e}")
+
+    async def _drain(self) -> None:
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            ALERT_EVENTS_BUFFERED.labels(sink=self.name).set(len(self._buffer))
+            try:
+                await self._send([event for _, event in batch])
+            except asyncio.CancelledError:
+                self._requeue(batch)
+                raise
+            except Exception as e:
+                logger.warning(f"Alert {self.name} send failed ({len(batch)} events): {e}")
+                ALERT_EVENTS.labels(sink=self.name, status="failed").inc(len(batch))
+                self._failed_at = time.monotonic()
+                self._requeue(batch)
+                return
+            now = time.time()
+            ALERT_EVENTS.labels(sink=self.name, status="published").inc(len(batch))
+            for created, _ in batch:
+                ALERT_PUBLISH_LATENCY.labels(sink=self.name).observe(now - created)
+
+    def _requeue(self, batch: List[Tuple[float, Dict[str, Any]]]) -> None:
+        """Đưa batch lỗi lại đầu buffer nếu còn chỗ (giữ thứ tự event)"""
+        room = max(self.max_buffer - len(self._buffer), 0)
+        if len(batch) > room:
+            ALERT_EVENTS.labels(sink=self.name, status="dropped").inc(len(batch) - room)
+        self._buffer.extendleft(reversed(batch[:room]))
+        ALERT_EVENTS_BUFFERED.labels(sink=self.name).set(len(self._buffer))
+
+    async def _send(self, events: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"running": self.running, "buffered": len(self._buffer)}
+
+
+def _stream_fields(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Field phẳng cho XADD; keywords là JSON"""
+    return {
+        "id": event["id"],
+        "index": event["index"],
+        "type": event["type"],
+        "sentiment": event["sentiment"],
+        "level": event["level"],
+        "keywords": orjson.dumps(event["keywords"]),
+        "ts": event["ts"],
+    }
+
+
+class RedisStreamSink(_Sink):
+    """XADD từng batch trong một pipeline (MAXLEN ~ giới hạn độ dài stream)"""
+
+    name = "redis_stream"
+
+    def __init__(self, url: str = ALERT_STREAM_URL, key: str = ALERT_STREAM_KEY, maxlen: int = ALERT_STREAM_MAXLEN):
+        super().__init__(batch_size=ALERT_STREAM_BATCH_SIZE, flush_interval=1.0, eager=True)
+        self.url = url
+        self.key = key
+        self.maxlen = maxlen
+        self._redis = None
+
+    def _client(self):
+        if self._redis is None:
+            self._redis = aioredis.from_url(self.url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        return self._redis
+
+    async def _send(self, events: List[Dict[str, Any]]) -> None:
+        async with self._client().pipeline(transaction=False) as pipe:
+            for event in events:
+                pipe.xadd(self.key, _stream_fields(event), maxlen=self.maxlen, approximate=True)
+            await pipe.execute()
+
+    async def recent(self, count: int) -> List[Dict[str, Any]]:
+        entries = await self._client().xrevrange(self.key, count=count)
+        return [
+            {"stream_id": stream_id.decode(), **{k.decode(): v.decode() for k, v in fields.items()}}
+            for stream_id, fields in entries
+        ]
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "backend": "redis", "key": self.key}
+
+
+class MemoryStreamSink(_Sink):
+    """Stand-in cho Redis Stream trong process (dev / test): giữ ALERT_STREAM_MAXLEN event gần nhất"""
+
+    name = "memory_stream"
+
+    def __init__(self, maxlen: int = ALERT_STREAM_MAXLEN):
+        super().__init__(batch_size=ALERT_STREAM_BATCH_SIZE, flush_interval=1.0, eager=True)
+        self.entries: Deque[Dict[str, Any]] = deque(maxlen=maxlen)
+        self._sequence = 0
+
+    async def _send(self, events: List[Dict[str, Any]]) -> None:
+        millis = int(time.time() * 1000)
+        for event in events:
+            self._sequence += 1
+            self.entries.append({"stream_id": f"{millis}-{self._sequence}", **event})
+
+    async def recent(self, count: int) -> List[Dict[str, Any]]:
+        return list(self.entries)[-count:][::-1]
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "backend": "memory", "length": len(self.entries)}
+
+
+class WebhookSink(_Sink):
+    """POST JSON array các event tới ALERT_WEBHOOK_URL theo batch (size hoặc interval)"""
+
+    name = "webhook"
+
+    def __init__(self, url: str = ALERT_WEBHOOK_URL):
+        super().__init__(batch_size=ALERT_WEBHOOK_BATCH_SIZE, flush_interval=ALERT_WEBHOOK_FLUSH_INTERVAL, eager=False)
+        self.url = url
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def _send(self, events: List[Dict[str, Any]]) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=ALERT_WEBHOOK_TIMEOUT)
+        response = await self._client.post(
+            self.url, content=orjson.dumps(events), headers={"Content-Type": "application/json"}
+        )
+        response.raise_for_status()
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class AlertPublisher:
+    """
+    Output fan-out: kết quả cuối có log_level >= ALERT_STREAM_MIN_LEVEL được đẩy thành event gọn
+    (id, index, type, sentiment, keywords, level) ra Redis Stream và webhook optional.
+    publish() chỉ append vào buffer của từng sink, không chờ I/O trên request path.
+    Mỗi post (id, index) chỉ phát một lần trong dedupe_ttl: cùng text ở post / topic khác
+    (repost, cache hit) vẫn có event riêng, request lặp lại của cùng post thì không
+    """
+
+    def __init__(self, enabled: bool = ALERT_STREAM_ENABLED, backend: str = ALERT_STREAM_BACKEND):
+        self.enabled = enabled
+        self.min_level = ALERT_STREAM_MIN_LEVEL
+        self.dedupe_ttl = ALERT_DEDUPE_TTL
+        self.dedupe_max_keys = ALERT_DEDUPE_MAX_KEYS
+        # (id, index) → thời điểm publish, thứ tự cũ → mới
+        self._published: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self.stream: Optional[_Sink] = None
+        self.sinks: List[_Sink] = []
+        if not enabled:
+            return
+        if backend == "redis" and aioredis is None:
+            logger.warning("ALERT_STREAM_BACKEND=redis nhưng thiếu redis.asyncio, dùng memory stream")
+            backend = "memory"
+        self.stream = RedisStreamSink() if backend == "redis" else MemoryStreamSink()
+        self.sinks.append(self.stream)
+        if ALERT_WEBHOOK_URL:
+            self.sinks.append(WebhookSink())
+
+    async def start(self) -> None:
+        for sink in self.sinks:
+            await sink.start()
+        if self.sinks:
+            logger.info(f"Alert publisher started: sinks={[sink.name for sink in self.sinks]}, min_level={self.min_level}")
+
+    async def stop(self) -> None:
+        for sink in self.sinks:
+            await sink.stop()
+
+    def publish(self, request: Any, result: Dict[str, Any], log_level: int) -> bool:
+        """Đưa event vào buffer các sink; trả về False nếu không publish"""
+        if not self.enabled or log_level < self.min_level:
+            return False
+        created = time.time()
+        if self._seen(request.id, request.index or "", created):
+            ALERT_EVENTS.labels(sink="publisher", status="duplicate").inc()
+            return False
+        keywords = result.get("keywords") or {}
+        event = {
+            "id": request.id,
+            "index": request.index or "",
+            "type": request.type,
+            "sentiment": result.get("sentiment"),
+            "keywords": {"positive": keywords.get("positive", []), "negative": keywords.get("negative", [])},
+            "level": log_level,
+            "ts": round(created, 3),
+        }
+        accepted = False
+        for sink in self.sinks:
+            accepted = sink.offer(event, created) or accepted
+        return accepted
+
+    def _seen(self, post_id: str, index: str, now: float) -> bool:
+        """True nếu (id, index) đã publish trong dedupe_ttl; chưa thì ghi nhận"""
+        published = self._published
+        while published:
+            oldest_key, oldest_ts = next(iter(published.items()))
+            if now - oldest_ts < self.dedupe_ttl and len(published) < self.dedupe_max_keys:
+                break
+            del published[oldest_key]
+        key = (post_id, index)
+        if key in published:
+            return True
+        published[key] = now
+        return False
+
+    async def recent(self, count: int = 50) -> List[Dict[str, Any]]:
+        """Event mới nhất trong stream (debug / kiểm tra consumer)"""
+        if self.stream is None:
+            return []
+        return await self.stream.recent(count)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "min_level": self.min_level,
+            "dedupe_keys": len(self._published),
+            "sinks": {sink.name: sink.stats() for sink in self.sinks},
+        }
+
+
+# Global alert publisher instance
+alert_publisher = AlertPublisher()
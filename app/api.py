@@ -1,41 +1,64 @@
 import asyncio
+import hmac
 import logging
+import os
+import threading
 import time
 import uuid
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from typing import Annotated, Any, Dict, List, Optional
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from slowapi.middleware import SlowAPIMiddleware
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
-from fastapi.responses import Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from fastapi.responses import Response, JSONResponse, ORJSONResponse, PlainTextResponse
+from pydantic import Field, TypeAdapter
 
-from app.services.sentiment_service import sentiment_service
-from app.schemas import SentimentRequest, SentimentResponse, PostInput, AnalysisResult
+from app.services.sentiment_service import (
+    sentiment_service, PreparedRequest, NO_MENTION_RESULT, NO_MENTION_BODY, no_mention_result
+)
+from app.schemas import (
+    SentimentRequest, SentimentResponse, PostInput, AnalysisResult, TopicMatchRequest, TopicMatchResponse
+)
+from app.nodes.format_output import calculate_log_level
 from app.cache import cache
-from app.config import MAX_CONCURRENT_REQUESTS, REQUEST_TIMEOUT, RATE_LIMIT, ENVIRONMENT
-
-# Cấu hình logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from app.cache_migration import cache_rescorer
+from app.hotkeys import hot_keys
+from app.alert_priority import alert_lane, record_alert_outcome
+from app.alert_stream import alert_publisher
+from app.tracing import tracer
+from app.log import setup_logging, log_event
+from app.profiling import stack_sampler, loop_lag_monitor, ProfileBusy
+from app.topics import topic_registry
+from app.topic_index import topic_index
+from app.db import async_mongo
+from app.result_store import result_store
+from app.llm import llm_router
+from app.http_pool import http_pool
+from app.singleflight import single_flight
+from app.serialization import parse_body, body_schema, SelectiveGZipMiddleware
+from app.metrics import REQUEST_COUNT, REQUEST_DURATION, CACHE_HITS, CACHE_MISSES, TOPIC_MATCHES, SHORT_CIRCUITS
+from app.rate_limit import limiter, rate_limit, rate_limit_items
+from app.scheduler import scheduler, resolve_priority, LoadShedError
+from app.deadline import Deadline
+from app.metrics import CANCELLED_WORK
+from app.config import (
+    MAX_CONCURRENT_REQUESTS,
+    REQUEST_TIMEOUT,
+    RATE_LIMIT,
+    ENVIRONMENT,
+    CACHE_REFRESH_MIN_HITS,
+    BATCH_MAX_ITEMS,
+    BATCH_CONCURRENCY,
+    TOPIC_MATCH_MAX_ANALYZE,
+    GZIP_MIN_SIZE,
+    GZIP_LEVEL,
+    ADMIN_TOKEN,
+    PROFILE_INTERVAL,
 )
-logger = logging.getLogger(__name__)
-
-# Prometheus metrics
-REQUEST_COUNT = Counter('sentiment_requests_total', 'Total sentiment analysis requests', ['method', 'endpoint', 'status'])
-REQUEST_DURATION = Histogram('sentiment_request_duration_seconds', 'Request duration in seconds')
-CACHE_HITS = Counter('sentiment_cache_hits_total', 'Total cache hits')
-CACHE_MISSES = Counter('sentiment_cache_misses_total', 'Total cache misses')
 
-# Rate limiter
-limiter = Limiter(key_func=get_remote_address)
-
-# Semaphore để giới hạn concurrent requests
-request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+# Cấu hình logging (JSON / text, ghi qua queue + listener thread)
+setup_logging()
+logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -47,11 +70,36 @@ async def lifespan(app: FastAPI):
     logger.info(f"Request timeout: {REQUEST_TIMEOUT}s")
     logger.info(f"Rate limit: {RATE_LIMIT}")
     
+    # Preload topics để request path không phải query MongoDB
+    try:
+        await topic_registry.start()
+        # Build sẵn automaton cho /topics/match (sau đó build lại khi snapshot đổi version)
+        topic_index.get(topic_registry.snapshot)
+    except Exception as e:
+        logger.error(f"Topic registry preload failed: {str(e)}")
+    
+    await result_store.start()
+    await alert_publisher.start()
+    tracer.start_exporter()
+    await loop_lag_monitor.start()
+    
+    # Namespace cache theo prompt + model; đổi prompt/model → đọc namespace cũ trong migration window
+    cache.register_namespace(sentiment_service.cache_namespace)
+    await cache_rescorer.start()
+    
     yield
     
     # Shutdown
     logger.info("Shutting down Sentiment Analysis API...")
-    cache.clear()
+    await loop_lag_monitor.stop()
+    await topic_registry.stop()
+    await cache_rescorer.stop()
+    await result_store.stop()  # Flush kết quả còn trong buffer
+    await alert_publisher.stop()  # Gửi nốt alert event còn trong buffer
+    await asyncio.to_thread(tracer.shutdown)  # Export nốt trace đã sample
+    await limiter.close()
+    await http_pool.aclose()
+    async_mongo.close()
 
 # Tạo FastAPI app với lifecycle
 app = FastAPI(
@@ -59,13 +107,19 @@ app = FastAPI(
     description="High-performance API phân tích sentiment và keyword matching với Langfuse tracing",
     version="2.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url="/docs" if ENVIRONMENT != "production" else None,
     redoc_url="/redoc" if ENVIRONMENT != "production" else None
 )
 
 # Middleware stack (thứ tự quan trọng)
-app.add_middleware(GZipMiddleware, minimum_size=1000)  # Compression
-app.add_middleware(SlowAPIMiddleware)  # Rate limiting
+# Compression: endpoint single-item (response nhỏ) không qua gzip
+app.add_middleware(
+    SelectiveGZipMiddleware,
+    minimum_size=GZIP_MIN_SIZE,
+    compresslevel=GZIP_LEVEL,
+    exclude_paths=("/analyze", "/analyze/legacy", "/metrics")
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -75,9 +129,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Rate limit error handler
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+@app.exception_handler(LoadShedError)
+async def load_shed_handler(request: Request, exc: LoadShedError):
+    """Quá tải: trả 503 + Retry-After theo thời gian chờ ước tính"""
+    REQUEST_COUNT.labels(method=request.method, endpoint=request.url.path, status="503").inc()
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Server overloaded ({exc.lane} lane), retry later"},
+        headers={"Retry-After": str(int(exc.retry_after))}
+    )
 
 @app.get("/")
 def root():
@@ -89,129 +149,349 @@ def root():
         "cache_stats": cache.stats()
     }
 
-@app.post("/analyze", response_model=SentimentResponse)
-@limiter.limit(RATE_LIMIT)
-async def analyze_sentiment(request: Request, sentiment_request: SentimentRequest, background_tasks: BackgroundTasks):
+def fallback_result(explanation: str) -> Dict[str, Any]:
+    """Kết quả neutral khi timeout / lỗi (cùng shape với SentimentResponse)"""
+    return {
+        "targeted": False,
+        "sentiment": "neutral",
+        "confidence": 0.0,
+        "keywords": {"positive": [], "negative": []},
+        "explanation": explanation
+    }
+
+# Metric children bind sẵn cho keyword-miss path (không lookup labels mỗi request)
+_KEYWORD_MISS = SHORT_CIRCUITS.labels(reason="keyword_miss")
+_KEYWORD_MISS_OK = REQUEST_COUNT.labels(method="POST", endpoint="/analyze", status="200")
+
+async def run_analysis(
+    request: Request,
+    sentiment_request: SentimentRequest,
+    background_tasks: BackgroundTasks,
+    prepared: Optional[PreparedRequest] = None,
+    deadline: Optional[Deadline] = None
+) -> Dict[str, Any]:
     """
-    High-performance sentiment analysis với caching, concurrency control và Langfuse tracing
+    Phân tích một request với caching, concurrency control và Langfuse tracing.
+    deadline: budget dùng chung (batch); mặc định mỗi request có REQUEST_TIMEOUT riêng.
+    Trả về dict đúng shape SentimentResponse: kết quả cache đã được validate lúc ghi nên
+    không dựng lại pydantic model, endpoint serialize thẳng bằng orjson
     """
     start_time = time.time()
+    # Text + fingerprint + alert estimate tính một lần (trước khi chờ slot),
+    # dùng chung cho lane, cache, single-flight, result store, log
+    if prepared is None:
+        prepared = sentiment_service.prepare(sentiment_request)
+    if not prepared.mentioned:
+        # Keyword miss: kết quả cố định tính sẵn, không qua scheduler / cache / single-flight / trace
+        _KEYWORD_MISS.inc()
+        _KEYWORD_MISS_OK.inc()
+        return NO_MENTION_RESULT
+    
+    # Request budget: thời gian chờ slot, cache, DB và LLM đều trừ vào đây
+    deadline = deadline or Deadline(REQUEST_TIMEOUT)
+    lane, tenant = resolve_priority(request)
+    # Item có khả năng thành cảnh báo (log_level cao) được nâng lên lane nhanh
+    lane = alert_lane(lane, prepared.alert)
     
-    async with request_semaphore:  # Limit concurrent requests
+    # Chờ slot theo priority lane; quá tải thì shed sớm (LoadShedError → 503)
+    async with scheduler.slot(lane, tenant, deadline):
         try:
             with REQUEST_DURATION.time():
-                logger.info(f"Processing request for ID: {sentiment_request.id}")
+                fingerprint = prepared.fingerprint
+                cache_key = fingerprint.cache_key
+                log_event(
+                    logger, "request.start", "Processing request for ID: %s fp=%s",
+                    sentiment_request.id, fingerprint.short, id=sentiment_request.id, type=sentiment_request.type
+                )
                 
-                # Prepare cache data
-                if sentiment_request.type in {"fbPageComment", "fbGroupComment", "fbUserComment", "forumComment",
-                                            "newsComment", "youtubeComment", "tiktokComment", "snsComment",
-                                            "linkedinComment", "ecommerceComment", "threadsComment"}:
-                    merged_text = sentiment_request.content or ""
-                else:
-                    text_parts = [
-                        part for part in [
-                            sentiment_request.title or "",
-                            sentiment_request.content or "",
-                            sentiment_request.description or ""
-                        ] if part.strip()
-                    ]
-                    merged_text = " ".join(text_parts)
+                # Chỉ label bằng type (fingerprint có sẵn trong top-K): không giữ / trả text của user qua /cache/stats
+                hits = hot_keys.add(fingerprint.digest, {"type": sentiment_request.type})
                 
-                cache_data = {
-                    "index": sentiment_request.index or "",
-                    "merged_text": merged_text,
-                    "type": sentiment_request.type,
-                    "main_keywords": sentiment_request.main_keywords
-                }
-                
-                # Check cache first
-                cached_result = cache.get(cache_data)
-                if cached_result:
+                # Check cache first (trong migration window có thể lấy từ namespace prompt/model cũ)
+                entry = cache.lookup(fingerprint, deadline=deadline)
+                if entry:
+                    if entry.stale:
+                        cache_rescorer.note(sentiment_request, prepared)
+                    elif entry.refresh and hits >= CACHE_REFRESH_MIN_HITS:
+                        # Key hot sắp hết hạn: tính lại trong background, request vẫn trả kết quả cache
+                        cache_rescorer.refresh(sentiment_request, prepared)
                     CACHE_HITS.inc()
+                    log_level = record_alert_outcome(prepared.alert, sentiment_request.type, entry.result, start_time)
+                    alert_publisher.publish(sentiment_request, entry.result, log_level)
+                    # Mỗi post có record riêng dù kết quả dùng chung theo content hash
+                    result_store.record_occurrence(
+                        sentiment_request, fingerprint.digest,
+                        cache.previous_namespace if entry.stale else fingerprint.namespace,
+                        entry.result, log_level, "cache"
+                    )
                     REQUEST_COUNT.labels(method="POST", endpoint="/analyze", status="200").inc()
-                    logger.info(f"Cache hit - Response time: {time.time() - start_time:.3f}s")
-                    return SentimentResponse(**cached_result)
+                    elapsed = time.time() - start_time
+                    log_event(
+                        logger, "cache.hit", "Cache hit fp=%s - Response time: %.3fs",
+                        fingerprint.short, elapsed, fp=fingerprint.short, seconds=round(elapsed, 4), log_level=log_level
+                    )
+                    return entry.result
                 
                 CACHE_MISSES.inc()
                 
-                # Process with timeout
+                # Process with timeout: hết budget thì coroutine bị cancel (kể cả HTTP call tới LLM).
+                # Request trùng fingerprint đang chạy đồng thời dùng chung một lần phân tích
                 try:
+                    compute_started = time.perf_counter()
                     result = await asyncio.wait_for(
-                        asyncio.to_thread(sentiment_service.analyze, sentiment_request),
-                        timeout=REQUEST_TIMEOUT
+                        single_flight.do(
+                            cache_key,
+                            lambda: sentiment_service.analyze_async(
+                                sentiment_request,
+                                prepared=prepared,
+                                deadline=deadline
+                            )
+                        ),
+                        timeout=deadline.remaining()
                     )
+                    # Ghi theo namespace của model đã trả lời (endpoint / hedge có thể khác LLM_MODEL)
+                    namespace = sentiment_service.namespace_for_model(result._model)
+                    result_key = fingerprint.in_namespace(namespace).cache_key
+                    result = result.model_dump()
                     
-                    # Cache the result in background
-                    background_tasks.add_task(cache_result, cache_data, result.dict())
+                    # Cache the result in background (thời gian tính dùng cho XFetch early refresh)
+                    compute_time = time.perf_counter() - compute_started
+                    background_tasks.add_task(cache_result, result_key, result, compute_time)
+                    log_level = record_alert_outcome(prepared.alert, sentiment_request.type, result, start_time)
+                    # Fan-out kết quả cần cảnh báo (non-blocking, consumer không phải poll)
+                    alert_publisher.publish(sentiment_request, result, log_level)
+                    result_store.record_occurrence(
+                        sentiment_request, fingerprint.digest, namespace, result, log_level, "analysis"
+                    )
                     
                     processing_time = time.time() - start_time
                     REQUEST_COUNT.labels(method="POST", endpoint="/analyze", status="200").inc()
-                    logger.info(f"Analysis completed - Response time: {processing_time:.3f}s")
+                    log_event(
+                        logger, "request.completed", "Analysis completed fp=%s - Response time: %.3fs",
+                        fingerprint.short, processing_time,
+                        fp=fingerprint.short, seconds=round(processing_time, 4), lane=lane, log_level=log_level
+                    )
                     
                     return result
                     
                 except asyncio.TimeoutError:
                     REQUEST_COUNT.labels(method="POST", endpoint="/analyze", status="408").inc()
-                    logger.error(f"Request timeout after {REQUEST_TIMEOUT}s")
-                    return SentimentResponse(
-                        targeted=False,
-                        sentiment="neutral",
-                        confidence=0.0,
-                        keywords={"positive": [], "negative": []},
-                        explanation="Request timeout"
-                    )
+                    CANCELLED_WORK.labels(stage="request", reason="deadline").inc()
+                    logger.error(f"Request timeout after {deadline.elapsed():.1f}s (budget {REQUEST_TIMEOUT}s)")
+                    return fallback_result("Request timeout")
                     
         except Exception as e:
             REQUEST_COUNT.labels(method="POST", endpoint="/analyze", status="500").inc()
             logger.error(f"Internal error: {str(e)}")
-            return SentimentResponse(
-                targeted=False,
-                sentiment="neutral",
-                confidence=0.0,
-                keywords={"positive": [], "negative": []},
-                explanation=f"Internal error: {str(e)}"
-            )
+            return fallback_result(f"Internal error: {str(e)}")
 
-@app.post("/analyze/legacy", response_model=AnalysisResult)
-@limiter.limit(RATE_LIMIT)
-async def analyze_sentiment_legacy(request: Request, post: PostInput, background_tasks: BackgroundTasks):
+@app.post(
+    "/analyze",
+    response_model=SentimentResponse,
+    dependencies=[Depends(rate_limit)],
+    openapi_extra=body_schema(SentimentRequest)
+)
+async def analyze_sentiment(request: Request, background_tasks: BackgroundTasks):
     """
-    Legacy endpoint để backward compatibility với format cũ
+    High-performance sentiment analysis với caching, concurrency control và Langfuse tracing
+    """
+    sentiment_request = await parse_body(request, SentimentRequest)
+    result = await run_analysis(request, sentiment_request, background_tasks)
+    if result is NO_MENTION_RESULT:
+        # Body JSON tính sẵn, không serialize lại
+        return Response(content=NO_MENTION_BODY, media_type="application/json")
+    # Trả Response trực tiếp: FastAPI không validate / encode lại qua response_model
+    return ORJSONResponse(result)
+
+# Batch body: list item cùng format với endpoint single-item, validate một lần bằng pydantic-core
+_ANALYZE_BATCH = TypeAdapter(Annotated[List[SentimentRequest], Field(max_length=BATCH_MAX_ITEMS)])
+_LEGACY_BATCH = TypeAdapter(Annotated[List[PostInput], Field(max_length=BATCH_MAX_ITEMS)])
+
+async def run_batch(
+    request: Request, items: List[SentimentRequest], background_tasks: BackgroundTasks
+) -> List[Dict[str, Any]]:
+    """
+    Chạy các item của batch qua run_analysis. Item có alert score cao được đưa vào scheduler
+    trước (khi slot khan hiếm chúng không phải xếp sau cả batch); kết quả trả đúng thứ tự input.
+    Tối đa BATCH_CONCURRENCY item của batch chờ slot cùng lúc (không dồn cả batch vào queue của
+    một tenant), tất cả dùng chung một deadline. Item bị shed / hết deadline trả fallback riêng,
+    không làm hỏng cả batch
     """
-    # Convert PostInput to SentimentRequest
-    sentiment_request = SentimentRequest(
+    prepared = [sentiment_service.prepare(item) for item in items]
+    order = sorted(range(len(items)), key=lambda i: prepared[i].alert.score, reverse=True)
+    deadline = Deadline(REQUEST_TIMEOUT)
+    admission = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def run_item(i: int) -> Dict[str, Any]:
+        if not prepared[i].mentioned:
+            # Kết quả batch được serialize chung bằng orjson: copy thay vì mapping read-only dùng chung
+            await run_analysis(request, items[i], background_tasks, prepared=prepared[i])
+            return no_mention_result()
+        try:
+            async with admission:
+                return await run_analysis(
+                    request, items[i], background_tasks, prepared=prepared[i], deadline=deadline
+                )
+        except LoadShedError as e:
+            REQUEST_COUNT.labels(method="POST", endpoint="/analyze", status="503").inc()
+            return fallback_result(f"Server overloaded ({e.lane} lane: {e.reason})")
+        except asyncio.TimeoutError:
+            # DeadlineExceeded khi chờ slot / stage trước khi vào try của run_analysis
+            REQUEST_COUNT.labels(method="POST", endpoint="/analyze", status="408").inc()
+            return fallback_result("Request timeout")
+    
+    ordered = await asyncio.gather(*(run_item(i) for i in order))
+    results: List[Dict[str, Any]] = [None] * len(items)
+    for i, result in zip(order, ordered):
+        results[i] = result
+    return results
+
+def to_sentiment_request(post: PostInput) -> SentimentRequest:
+    """PostInput đã validate → SentimentRequest không validate lại (model_construct)"""
+    return SentimentRequest.model_construct(
         id=post.id,
         index=post.index,
+        topic=None,
         title=post.title,
         content=post.content,
         description=post.description,
         type=post.type or "",
         main_keywords=post.main_keywords
     )
-    
-    # Call main analyze function
-    result = await analyze_sentiment(request, sentiment_request, background_tasks)
-    
-    # Convert to legacy format
-    return AnalysisResult(
-        id=sentiment_request.id,
-        index=sentiment_request.index or "",
-        type=sentiment_request.type,
-        targeted=result.targeted,
-        sentiment=result.sentiment,
-        confidence=result.confidence,
-        keywords={
-            "positive": result.keywords.get("positive", []),
-            "negative": result.keywords.get("negative", [])
+
+def legacy_result(sentiment_request: SentimentRequest, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Kết quả core → shape AnalysisResult; log_level tính như format_output của pipeline"""
+    return {
+        "id": sentiment_request.id,
+        "index": sentiment_request.index or "",
+        "type": sentiment_request.type,
+        "targeted": result["targeted"],
+        "sentiment": result["sentiment"],
+        "confidence": result["confidence"],
+        "keywords": {
+            "positive": result["keywords"].get("positive", []),
+            "negative": result["keywords"].get("negative", [])
         },
-        explanation=result.explanation,
-        log_level=1 if result.targeted else 0
+        "explanation": result["explanation"],
+        "log_level": calculate_log_level(result["sentiment"], sentiment_request.type, result["targeted"]),
+        "processing_time": None,
+        "trace_id": None
+    }
+
+@app.post(
+    "/analyze/legacy",
+    response_model=AnalysisResult,
+    dependencies=[Depends(rate_limit)],
+    openapi_extra=body_schema(PostInput)
+)
+async def analyze_sentiment_legacy(request: Request, background_tasks: BackgroundTasks):
+    """
+    Legacy endpoint để backward compatibility với format cũ (cùng core với /analyze)
+    """
+    sentiment_request = to_sentiment_request(await parse_body(request, PostInput))
+    result = await run_analysis(request, sentiment_request, background_tasks)
+    return ORJSONResponse(legacy_result(sentiment_request, result))
+
+@app.post(
+    "/analyze/batch",
+    response_model=List[SentimentResponse],
+    dependencies=[Depends(rate_limit)],
+    openapi_extra=body_schema(_ANALYZE_BATCH)
+)
+async def analyze_sentiment_batch(request: Request, background_tasks: BackgroundTasks):
+    """
+    Batch: list SentimentRequest → list kết quả cùng thứ tự. Mỗi item đi qua cùng core
+    (cache, single-flight, scheduler) và tính như một request cho rate limit
+    """
+    items = await parse_body(request, _ANALYZE_BATCH)
+    await rate_limit_items(request, len(items))
+    return ORJSONResponse(await run_batch(request, items, background_tasks))
+
+@app.post(
+    "/analyze/legacy/batch",
+    response_model=List[AnalysisResult],
+    dependencies=[Depends(rate_limit)],
+    openapi_extra=body_schema(_LEGACY_BATCH)
+)
+async def analyze_sentiment_legacy_batch(request: Request, background_tasks: BackgroundTasks):
+    """
+    Batch cho crawler cũ: list PostInput (payload không đổi) → list AnalysisResult cùng thứ tự
+    """
+    items = [to_sentiment_request(post) for post in await parse_body(request, _LEGACY_BATCH)]
+    await rate_limit_items(request, len(items))
+    results = await run_batch(request, items, background_tasks)
+    return ORJSONResponse([legacy_result(item, result) for item, result in zip(items, results)])
+
+@app.post(
+    "/topics/match",
+    response_model=TopicMatchResponse,
+    dependencies=[Depends(rate_limit)],
+    openapi_extra=body_schema(TopicMatchRequest)
+)
+async def match_topics(request: Request, background_tasks: BackgroundTasks):
+    """
+    Reverse index: quét post một lần qua automaton chứa keywords của mọi topic trong qc_sentiment,
+    trả về các topic được nhắc tới (thay cho một API call cho mỗi topic). analyze=true → phân tích
+    sentiment cho từng topic match trong cùng request (tối đa TOPIC_MATCH_MAX_ANALYZE topic)
+    """
+    post = await parse_body(request, TopicMatchRequest)
+    snapshot = topic_registry.snapshot
+    base = SentimentRequest.model_construct(
+        id=post.id,
+        index=None,
+        topic=None,
+        title=post.title,
+        content=post.content,
+        description=post.description,
+        type=post.type,
+        main_keywords=[]
     )
+    text, _ = sentiment_service.select_text(base)
+    # Index có thể chậm một version so với snapshot khi đang build lại: bỏ topic đã bị xoá
+    index = topic_index.get(snapshot)
+    allowed = set(post.topic_ids) if post.topic_ids is not None else snapshot.topics
+    matches = {
+        topic_id: keywords
+        for topic_id, keywords in index.match(sentiment_service.normalize(text)).items()
+        if topic_id in allowed and topic_id in snapshot.topics
+    }
+    TOPIC_MATCHES.observe(len(matches))
+    
+    # Topic khớp nhiều keyword trước (được ưu tiên phân tích khi vượt giới hạn)
+    ordered = sorted(matches.items(), key=lambda item: (-len(item[1]), item[0]))
+    response = [
+        {
+            "topic_id": topic_id,
+            "topic_name": snapshot.topics[topic_id].topic_name,
+            "matched_keywords": keywords,
+            "result": None
+        }
+        for topic_id, keywords in ordered
+    ]
+    
+    analyzed = 0
+    if post.analyze and response:
+        items = [
+            base.model_copy(update={"index": match["topic_id"], "main_keywords": list(snapshot.topics[match["topic_id"]].keywords)})
+            for match in response[:TOPIC_MATCH_MAX_ANALYZE]
+        ]
+        await rate_limit_items(request, len(items))
+        results = await run_batch(request, items, background_tasks)
+        for match, item, result in zip(response, items, results):
+            match["result"] = legacy_result(item, result)
+        analyzed = len(items)
+    
+    return ORJSONResponse({
+        "id": post.id,
+        "topics_version": index.version,
+        "matches": response,
+        "analyzed": analyzed
+    })
 
-def cache_result(cache_data: dict, result: dict):
+def cache_result(cache_key: str, result: dict, compute_time: float = 0.0):
     """Background task để cache kết quả"""
     try:
-        cache.set(cache_data, result)
+        cache.set_key(cache_key, result, compute_time=compute_time)
     except Exception as e:
         logger.error(f"Cache error: {str(e)}")
 
@@ -228,8 +508,15 @@ def health_check():
             "environment": ENVIRONMENT,
             "cache": cache_stats,
             "concurrent_limit": MAX_CONCURRENT_REQUESTS,
+            "scheduler": scheduler.stats(),
+            "topics": {**topic_registry.stats(), "index": topic_index.stats()},
+            "result_store": result_store.stats(),
+            "alerts": alert_publisher.stats(),
+            "tracing": tracer.stats(),
+            "llm": llm_router.stats(),
+            "llm_http_pool": http_pool.stats(),
             "features": {
-                "langfuse_tracing": True,
+                "langfuse_tracing": tracer.enabled,
                 "redis_cache": cache_stats.get("type") == "redis",
                 "rate_limiting": True,
                 "prometheus_metrics": True
@@ -253,7 +540,7 @@ def metrics():
 @app.get("/cache/stats")
 def cache_stats():
     """Cache statistics endpoint"""
-    return cache.stats()
+    return {**cache.stats(), "rescorer": cache_rescorer.stats(), "hot_keys": hot_keys.stats()}
 
 @app.post("/cache/clear")
 def clear_cache():
@@ -261,6 +548,54 @@ def clear_cache():
     cache.clear()
     return {"message": "Cache cleared successfully"}
 
+async def require_admin(request: Request) -> None:
+    """Admin endpoints: X-Admin-Token phải khớp ADMIN_TOKEN; không cấu hình token thì chỉ mở ngoài production"""
+    if not ADMIN_TOKEN:
+        if ENVIRONMENT == "production":
+            raise HTTPException(status_code=403, detail="Admin endpoints disabled (ADMIN_TOKEN not set)")
+        return
+    token = request.headers.get("x-admin-token", "")
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.get("/alerts/recent", dependencies=[Depends(require_admin)])
+async def recent_alerts(count: int = 50):
+    """Alert event mới nhất trong stream (kiểm tra fan-out / consumer)"""
+    return {"events": await alert_publisher.recent(min(max(count, 1), 500)), **alert_publisher.stats()}
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def admin_profile(
+    seconds: float = 10.0, format: str = "collapsed", interval: float = PROFILE_INTERVAL, threads: str = "all"
+):
+    """
+    Sampling profile của worker nhận request trong `seconds` giây.
+    format=collapsed (flamegraph.pl / speedscope import) hoặc speedscope (file JSON);
+    threads=all (mọi thread) hoặc loop (chỉ thread chạy event loop)
+    """
+    if format not in ("collapsed", "speedscope"):
+        raise HTTPException(status_code=400, detail="format must be 'collapsed' or 'speedscope'")
+    if threads not in ("all", "loop"):
+        raise HTTPException(status_code=400, detail="threads must be 'all' or 'loop'")
+    thread_ids = {threading.get_ident()} if threads == "loop" else None
+    try:
+        profile = await asyncio.to_thread(stack_sampler.capture, seconds, interval, thread_ids)
+    except ProfileBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    headers = {
+        "X-Profile-Samples": str(profile.samples),
+        "X-Profile-Seconds": f"{profile.seconds:.3f}",
+        "X-Profile-Pid": str(os.getpid()),
+    }
+    if format == "speedscope":
+        headers["Content-Disposition"] = f'attachment; filename="profile-{os.getpid()}-{int(time.time())}.speedscope.json"'
+        return ORJSONResponse(profile.speedscope(), headers=headers)
+    return PlainTextResponse(profile.collapsed(), headers=headers)
+
+@app.get("/admin/loop-lag", dependencies=[Depends(require_admin)])
+def admin_loop_lag():
+    """Event loop lag monitor: lag lớn nhất + stack của các lần loop bị block gần nhất"""
+    return {**loop_lag_monitor.stats(), "pid": os.getpid()}
+
 # Debug endpoints (chỉ trong development)
 if ENVIRONMENT != "production":
     @app.post("/debug/validate")
@@ -1,18 +1,76 @@
-import json
-import hashlib
 import logging
-from typing import Optional, Dict, Any
+import math
+import random
+import time
+from typing import Optional, Dict, Any, NamedTuple, Tuple
 import redis
-from app.config import REDIS_URL, CACHE_TTL
+from app.config import (
+    REDIS_URL,
+    CACHE_TTL,
+    REDIS_SOCKET_TIMEOUT,
+    CACHE_MIGRATION_WINDOW,
+    CACHE_PREVIOUS_NAMESPACE,
+    CACHE_TTL_JITTER,
+    CACHE_XFETCH_BETA,
+)
+from app.cache_codec import cache_codec, CacheDecodeError
+from app.deadline import Deadline
+from app.fingerprint import Fingerprint
+from app.metrics import CANCELLED_WORK, CACHE_PREVIOUS_NAMESPACE_HITS, CACHE_DECODE_ERRORS
 
 logger = logging.getLogger(__name__)
 
+# Namespace hiện tại / trước đó dùng chung giữa các worker (ngoài pattern sentiment:* của clear())
+NAMESPACE_META_KEY = "sentiment_meta:namespace"
+
+# Đăng ký namespace atomic: namespace mới → namespace cũ thành 'previous' trong migration window.
+# Worker cũ restart giữa rolling deploy (namespace == previous) không được lật ngược lại
+_REGISTER_NAMESPACE_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], 'current')
+if current == ARGV[1] then
+    return {redis.call('HGET', KEYS[1], 'previous') or '', redis.call('HGET', KEYS[1], 'migrate_until') or '0'}
+end
+if current and redis.call('HGET', KEYS[1], 'previous') == ARGV[1] then
+    return {'', '0'}
+end
+local migrate_until = tostring(tonumber(ARGV[2]) + tonumber(ARGV[3]))
+redis.call('HSET', KEYS[1], 'current', ARGV[1], 'previous', current or '', 'migrate_until', migrate_until)
+return {current or '', migrate_until}
+"""
+
+
+class CacheEntry(NamedTuple):
+    result: Dict[str, Any]
+    stale: bool = False  # lấy từ namespace prompt/model cũ
+    refresh: bool = False  # XFetch: nên tính lại trước khi hết hạn
+
+
+def should_refresh_early(compute_time: float, expiry: float, beta: float = CACHE_XFETCH_BETA) -> bool:
+    """
+    XFetch (Vattani et al.): refresh với xác suất tăng dần khi gần hết hạn, sớm hơn với key tính lâu.
+    Key càng được đọc nhiều càng chắc chắn được refresh trước khi hết hạn
+    """
+    if beta <= 0 or compute_time <= 0 or expiry <= 0:
+        return False
+    return time.time() - compute_time * beta * math.log(1.0 - random.random()) >= expiry
+
+
+def jittered_ttl(ttl: int = CACHE_TTL, jitter: float = CACHE_TTL_JITTER) -> int:
+    """TTL ± jitter để các key ghi cùng lúc không hết hạn cùng lúc"""
+    return max(1, int(ttl * (1.0 + random.uniform(-jitter, jitter))))
+
 class CacheService:
     """Production Redis cache service với fallback to memory"""
     
     def __init__(self):
         try:
-            self.redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+            # Socket timeout ngắn: cache là best-effort, không được giữ request lâu
+            self.redis_client = redis.from_url(
+                REDIS_URL,
+                decode_responses=False,  # value là bytes (cache_codec)
+                socket_timeout=REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=REDIS_SOCKET_TIMEOUT
+            )
             # Test connection
             self.redis_client.ping()
             logger.info("Redis connection established")
@@ -20,52 +78,142 @@ class CacheService:
             logger.warning(f"Redis connection failed: {e}. Using in-memory cache.")
             self.redis_client = None
             self._memory_cache = {}
+        
+        self.namespace = ""
+        self.previous_namespace = ""
+        self.migrate_until = 0.0
     
-    def _generate_cache_key(self, data: Dict[str, Any]) -> str:
-        """Generate consistent cache key from request data"""
-        # Create a consistent string representation
-        cache_data = {
-            "index": data.get("index", ""),
-            "merged_text": data.get("merged_text", ""),
-            "type": data.get("type", ""),
-            "main_keywords": sorted(data.get("main_keywords", []))
-        }
+    def register_namespace(self, namespace: str) -> None:
+        """
+        Ghi nhận namespace (prompt + model) của worker lúc startup. Nếu khác namespace đang dùng
+        thì namespace cũ vẫn được đọc trong CACHE_MIGRATION_WINDOW giây thay vì phải /cache/clear
+        """
+        self.namespace = namespace
+        if not CACHE_MIGRATION_WINDOW:
+            return
+        if CACHE_PREVIOUS_NAMESPACE:
+            previous, migrate_until = CACHE_PREVIOUS_NAMESPACE, time.time() + CACHE_MIGRATION_WINDOW
+        elif self.redis_client:
+            try:
+                previous, migrate_until = (
+                    value.decode() for value in self.redis_client.eval(
+                        _REGISTER_NAMESPACE_SCRIPT, 1, NAMESPACE_META_KEY,
+                        namespace, time.time(), CACHE_MIGRATION_WINDOW
+                    )
+                )
+            except Exception as e:
+                logger.error(f"Cache namespace registration error: {e}")
+                return
+        else:
+            return
         
-        cache_string = json.dumps(cache_data, sort_keys=True)
-        return f"sentiment:{hashlib.md5(cache_string.encode()).hexdigest()}"
+        if previous and previous != namespace:
+            self.previous_namespace = previous
+            self.migrate_until = float(migrate_until)
+            if self.migrating:
+                logger.info(
+                    f"Cache namespace {namespace}: reading previous namespace {previous} "
+                    f"for {self.migrate_until - time.time():.0f}s"
+                )
+    
+    @property
+    def migrating(self) -> bool:
+        return bool(self.previous_namespace) and time.time() < self.migrate_until
+    
+    def _decode(self, raw: Optional[bytes]) -> Tuple[Optional[Dict[str, Any]], float, float]:
+        """Decode value (binary hoặc JSON cũ); value hỏng coi như miss"""
+        if not raw:
+            return None, 0.0, 0.0
+        try:
+            return cache_codec.decode(raw)
+        except (CacheDecodeError, ValueError) as e:
+            CACHE_DECODE_ERRORS.inc()
+            logger.debug(f"Cache decode error: {e}")
+            return None, 0.0, 0.0
+    
+    def _generate_cache_key(self, data: Dict[str, Any]) -> str:
+        """Cache key từ request data dạng dict (merged_text, type, main_keywords, namespace)"""
+        return Fingerprint.build(
+            data.get("merged_text", ""),
+            data.get("type", ""),
+            data.get("main_keywords", []),
+            namespace=data.get("namespace", ""),
+        ).cache_key
+    
+    def key_for(self, request_data: Dict[str, Any]) -> str:
+        """Public cache key cho request data dạng dict"""
+        return self._generate_cache_key(request_data)
+    
+    def get(self, request_data: Dict[str, Any], deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """Get cached result theo request data dạng dict"""
+        return self.get_key(self._generate_cache_key(request_data), deadline=deadline)
+    
+    def set(self, request_data: Dict[str, Any], result: Dict[str, Any]) -> None:
+        """Cache result theo request data dạng dict"""
+        self.set_key(self._generate_cache_key(request_data), result)
     
-    def get(self, request_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """Get cached result"""
+    def get_key(self, cache_key: str, deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """Get cached result theo key đã tính sẵn (bỏ qua nếu request đã hết deadline)"""
+        if deadline is not None and deadline.expired:
+            CANCELLED_WORK.labels(stage="cache.get", reason="deadline").inc()
+            return None
         try:
-            cache_key = self._generate_cache_key(request_data)
-            
             if self.redis_client:
-                cached = self.redis_client.get(cache_key)
-                if cached:
-                    return json.loads(cached)
+                return self._decode(self.redis_client.get(cache_key))[0]
             else:
                 # Fallback to memory cache
-                return self._memory_cache.get(cache_key)
+                return self._decode(self._memory_cache.get(cache_key))[0]
                 
         except Exception as e:
             logger.error(f"Cache get error: {e}")
         
         return None
     
-    def set(self, request_data: Dict[str, Any], result: Dict[str, Any]) -> None:
-        """Cache result"""
+    def lookup(self, fingerprint: Fingerprint, deadline: Optional[Deadline] = None) -> Optional[CacheEntry]:
+        """
+        Get theo fingerprint. Trong migration window, miss ở namespace hiện tại thì đọc tiếp namespace
+        cũ (cùng một round trip MGET). Entry có cờ stale (namespace cũ) và refresh (XFetch)
+        """
+        if deadline is not None and deadline.expired:
+            CANCELLED_WORK.labels(stage="cache.get", reason="deadline").inc()
+            return None
+        
+        keys = [fingerprint.cache_key]
+        if self.migrating:
+            keys.append(fingerprint.in_namespace(self.previous_namespace).cache_key)
         try:
-            cache_key = self._generate_cache_key(request_data)
-            
+            if self.redis_client:
+                raw = self.redis_client.mget(keys) if len(keys) > 1 else [self.redis_client.get(keys[0])]
+            else:
+                raw = [self._memory_cache.get(key) for key in keys]
+        except Exception as e:
+            logger.error(f"Cache get error: {e}")
+            return None
+        
+        result, compute_time, expiry = self._decode(raw[0])
+        if result is not None:
+            return CacheEntry(result, refresh=should_refresh_early(compute_time, expiry))
+        if len(raw) > 1:
+            previous = self._decode(raw[1])[0]
+            if previous is not None:
+                CACHE_PREVIOUS_NAMESPACE_HITS.inc()
+                return CacheEntry(previous, stale=True)
+        return None
+    
+    def set_key(self, cache_key: str, result: Dict[str, Any], compute_time: float = 0.0) -> None:
+        """Cache result theo key đã tính sẵn; compute_time (giây) dùng cho XFetch early refresh"""
+        try:
+            ttl = jittered_ttl()
+            value = cache_codec.encode(result, compute_time, time.time() + ttl)
             if self.redis_client:
                 self.redis_client.setex(
                     cache_key, 
-                    CACHE_TTL, 
-                    json.dumps(result)
+                    ttl, 
+                    value
                 )
             else:
                 # Fallback to memory cache with simple cleanup
-                self._memory_cache[cache_key] = result
+                self._memory_cache[cache_key] = value
                 if len(self._memory_cache) > 1000:  # Simple cleanup
                     # Remove oldest 100 items
                     keys_to_remove = list(self._memory_cache.keys())[:100]
@@ -85,18 +233,29 @@ class CacheService:
                     "connected_clients": info.get("connected_clients", 0),
                     "used_memory": info.get("used_memory_human", "0B"),
                     "keyspace_hits": info.get("keyspace_hits", 0),
-                    "keyspace_misses": info.get("keyspace_misses", 0)
+                    "keyspace_misses": info.get("keyspace_misses", 0),
+                    "namespace": self.namespace_stats(),
+                    "codec": cache_codec.stats()
                 }
             else:
                 return {
                     "type": "memory",
                     "size": len(self._memory_cache),
-                    "max_size": 1000
+                    "max_size": 1000,
+                    "namespace": self.namespace_stats(),
+                    "codec": cache_codec.stats()
                 }
         except Exception as e:
             logger.error(f"Cache stats error: {e}")
             return {"type": "error", "message": str(e)}
     
+    def namespace_stats(self) -> Dict[str, Any]:
+        return {
+            "current": self.namespace,
+            "previous": self.previous_namespace if self.migrating else None,
+            "migration_remaining": round(max(self.migrate_until - time.time(), 0.0)) if self.migrating else 0
+        }
+    
     def clear(self) -> None:
         """Clear cache"""
         try:
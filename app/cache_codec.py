@@ -0,0 +1,224 @@
+import json
+import logging
+import struct
+from typing import Any, Dict, Tuple
+
+from app.config import CACHE_COMPRESSION, CACHE_ZSTD_DICT, CACHE_ZSTD_LEVEL, CACHE_COMPRESS_MIN_BYTES
+
+# zstd (dictionary đã train trên explanations) là optional
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Byte đầu của value: 1 = format nhị phân dưới đây. Value JSON cũ bắt đầu bằng '{'
+FORMAT_VERSION = 1
+
+_FLAG_TARGETED = 0x01
+_FLAG_ZSTD = 0x02  # explanation nén zstd
+_FLAG_EXTRA = 0x04  # field ngoài schema cố định, lưu dạng JSON ở cuối
+
+_SENTIMENTS = ("neutral", "positive", "negative")
+_SENTIMENT_CODES = {name: code for code, name in enumerate(_SENTIMENTS)}
+_CUSTOM_SENTIMENT = 0xFF
+
+# version, flags, sentiment, confidence * 10000, compute_time (ms), expiry (epoch giây)
+_HEADER = struct.Struct("<BBBHHI")
+_CONFIDENCE_SCALE = 10000
+_KEYWORD_KINDS = ("positive", "negative")
+_FIELDS = {"targeted", "sentiment", "confidence", "keywords", "explanation"}
+
+
+class CacheDecodeError(ValueError):
+    pass
+
+
+def _put_varint(buffer: bytearray, value: int) -> None:
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _get_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _put_bytes(buffer: bytearray, data: bytes) -> None:
+    _put_varint(buffer, len(data))
+    buffer += data
+
+
+def _get_bytes(data: bytes, pos: int) -> Tuple[bytes, int]:
+    length, pos = _get_varint(data, pos)
+    end = pos + length
+    if end > len(data):
+        raise CacheDecodeError("truncated value")
+    return data[pos:end], end
+
+
+class CacheCodec:
+    """
+    Encoding nhị phân gọn cho SentimentResponse trong Redis (thay cho json.dumps):
+    header cố định (targeted/sentiment là small int, confidence lượng tử hoá 1e-4, metadata XFetch),
+    keywords là list string length-prefixed, explanation có thể nén zstd với dictionary đã train.
+    decode() vẫn đọc value JSON cũ để deploy không làm mất cache
+    """
+
+    def __init__(
+        self,
+        compression: str = CACHE_COMPRESSION,
+        dict_path: str = CACHE_ZSTD_DICT,
+        level: int = CACHE_ZSTD_LEVEL,
+        min_bytes: int = CACHE_COMPRESS_MIN_BYTES,
+    ):
+        self.min_bytes = min_bytes
+        self._compressor = None
+        self._decompressor = None
+        self.dictionary_id = 0
+        if compression == "zstd":
+            if not ZSTD_AVAILABLE:
+                logger.warning("CACHE_COMPRESSION=zstd nhưng thiếu package zstandard, không nén")
+            else:
+                dictionary = None
+                if dict_path:
+                    try:
+                        with open(dict_path, "rb") as f:
+                            dictionary = zstandard.ZstdCompressionDict(f.read())
+                        self.dictionary_id = dictionary.dict_id()
+                    except OSError as e:
+                        logger.warning(f"Không đọc được zstd dictionary {dict_path}: {e}")
+                self._compressor = zstandard.ZstdCompressor(
+                    level=level, dict_data=dictionary, write_content_size=True,
+                    write_checksum=False, write_dict_id=True
+                )
+                self._decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+
+    @property
+    def compression(self) -> str:
+        if self._compressor is None:
+            return "none"
+        return "zstd+dict" if self.dictionary_id else "zstd"
+
+    def encode(self, result: Dict[str, Any], compute_time: float = 0.0, expiry: float = 0.0) -> bytes:
+        flags = _FLAG_TARGETED if result.get("targeted") else 0
+        sentiment = result.get("sentiment", "neutral")
+        sentiment_code = _SENTIMENT_CODES.get(sentiment, _CUSTOM_SENTIMENT)
+        confidence = min(max(float(result.get("confidence", 0.0)), 0.0), 1.0)
+
+        keywords = result.get("keywords") or {}
+        extra = {k: v for k, v in result.items() if k not in _FIELDS}
+        if set(keywords) - set(_KEYWORD_KINDS):
+            extra["keywords"] = keywords
+
+        explanation = (result.get("explanation") or "").encode("utf-8")
+        if self._compressor is not None and len(explanation) >= self.min_bytes:
+            compressed = self._compressor.compress(explanation)
+            if len(compressed) < len(explanation):
+                explanation = compressed
+                flags |= _FLAG_ZSTD
+        if extra:
+            flags |= _FLAG_EXTRA
+
+        buffer = bytearray(_HEADER.pack(
+            FORMAT_VERSION,
+            flags,
+            sentiment_code,
+            round(confidence * _CONFIDENCE_SCALE),
+            min(int(compute_time * 1000), 0xFFFF),
+            min(int(expiry), 0xFFFFFFFF),
+        ))
+        if sentiment_code == _CUSTOM_SENTIMENT:
+            _put_bytes(buffer, sentiment.encode("utf-8"))
+        for kind in _KEYWORD_KINDS:
+            words = keywords.get(kind) or []
+            _put_varint(buffer, len(words))
+            for word in words:
+                _put_bytes(buffer, word.encode("utf-8"))
+        _put_bytes(buffer, explanation)
+        if extra:
+            _put_bytes(buffer, json.dumps(extra, ensure_ascii=False).encode("utf-8"))
+        return bytes(buffer)
+
+    def decode(self, data: bytes) -> Tuple[Dict[str, Any], float, float]:
+        """Trả về (result, compute_time, expiry); value JSON cũ → metadata = 0"""
+        if not data:
+            raise CacheDecodeError("empty value")
+        if data[0] != FORMAT_VERSION:
+            if data[:1] == b"{":
+                return self._decode_json(data)
+            raise CacheDecodeError(f"unknown cache format version {data[0]}")
+
+        try:
+            _, flags, sentiment_code, confidence, compute_ms, expiry = _HEADER.unpack_from(data)
+            pos = _HEADER.size
+            if sentiment_code == _CUSTOM_SENTIMENT:
+                raw, pos = _get_bytes(data, pos)
+                sentiment = raw.decode("utf-8")
+            else:
+                sentiment = _SENTIMENTS[sentiment_code]
+            keywords = {}
+            for kind in _KEYWORD_KINDS:
+                count, pos = _get_varint(data, pos)
+                words = []
+                for _ in range(count):
+                    raw, pos = _get_bytes(data, pos)
+                    words.append(raw.decode("utf-8"))
+                keywords[kind] = words
+            explanation, pos = _get_bytes(data, pos)
+            if flags & _FLAG_ZSTD:
+                if self._decompressor is None:
+                    raise CacheDecodeError("zstd value but compression disabled")
+                explanation = self._decompressor.decompress(explanation)
+            result = {
+                "targeted": bool(flags & _FLAG_TARGETED),
+                "sentiment": sentiment,
+                "confidence": confidence / _CONFIDENCE_SCALE,
+                "keywords": keywords,
+                "explanation": explanation.decode("utf-8"),
+            }
+            if flags & _FLAG_EXTRA:
+                raw, pos = _get_bytes(data, pos)
+                result.update(json.loads(raw))
+        except CacheDecodeError:
+            raise
+        except Exception as e:
+            # Value hỏng / dictionary khác → coi như cache miss
+            raise CacheDecodeError(str(e)) from e
+        return result, compute_ms / 1000, float(expiry)
+
+    @staticmethod
+    def _decode_json(data: bytes) -> Tuple[Dict[str, Any], float, float]:
+        value = json.loads(data)
+        if isinstance(value, dict) and "r" in value:
+            return value["r"], value.get("d", 0.0), value.get("e", 0.0)
+        return value, 0.0, 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "format_version": FORMAT_VERSION,
+            "compression": self.compression,
+            "dictionary_id": self.dictionary_id or None,
+        }
+
+
+def train_dictionary(samples, size: int = 16 * 1024) -> bytes:
+    """Train zstd dictionary từ các explanation mẫu (cần package zstandard)"""
+    if not ZSTD_AVAILABLE:
+        raise RuntimeError("zstandard chưa được cài")
+    encoded = [s.encode("utf-8") for s in samples if s]
+    return zstandard.train_dictionary(size, encoded).as_bytes()
+
+
+# Global cache codec instance
+cache_codec = CacheCodec()
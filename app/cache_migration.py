@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from app.cache import cache
+from app.config import (
+    CACHE_RESCORE_RATE,
+    CACHE_RESCORE_MAX_PENDING,
+    CACHE_REFRESH_MAX_INFLIGHT,
+    REQUEST_TIMEOUT,
+)
+from app.deadline import Deadline
+from app.metrics import CACHE_RESCORES, CACHE_RESCORE_PENDING, CACHE_EARLY_REFRESHES
+from app.scheduler import scheduler, LoadShedError
+from app.schemas import SentimentRequest
+from app.services.sentiment_service import sentiment_service, PreparedRequest
+from app.singleflight import single_flight
+
+logger = logging.getLogger(__name__)
+
+# Tenant riêng trong lane bulk: re-score không chiếm lượt của client thật
+RESCORE_TENANT = "cache-rescore"
+
+
+class _Pending:
+    __slots__ = ("request", "prepared", "hits")
+
+    def __init__(self, request: SentimentRequest, prepared: PreparedRequest):
+        self.request = request
+        self.prepared = prepared
+        self.hits = 1
+
+
+class CacheRescorer:
+    """
+    Re-score dần các key hot của namespace cũ sang namespace hiện tại trong migration window:
+    - Request được phục vụ từ namespace cũ → note() ghi nhận request gốc và số lần hit
+    - Background task mỗi 1/CACHE_RESCORE_RATE giây lấy key có nhiều hit nhất, phân tích lại
+      qua lane bulk của scheduler và ghi vào namespace mới
+    Key nguội hết hạn tự nhiên theo CACHE_TTL, không tốn LLM call.
+    refresh() dùng cùng đường tính lại cho XFetch early refresh của key hot (ngoài migration)
+    """
+
+    def __init__(
+        self,
+        rate: float = CACHE_RESCORE_RATE,
+        max_pending: int = CACHE_RESCORE_MAX_PENDING,
+        max_refreshing: int = CACHE_REFRESH_MAX_INFLIGHT,
+    ):
+        self.rate = rate
+        self.max_pending = max_pending
+        self.max_refreshing = max_refreshing
+        self._pending: Dict[str, _Pending] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.rate <= 0 or not cache.migrating or self.running:
+            return
+        self._task = asyncio.create_task(self._run(), name="cache-rescore")
+        logger.info(f"Cache rescorer started: {self.rate}/s until migration window ends")
+
+    async def stop(self) -> None:
+        for task in list(self._refreshing.values()):
+            task.cancel()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def note(self, request: SentimentRequest, prepared: PreparedRequest) -> None:
+        """Ghi nhận một hit từ namespace cũ (không block request)"""
+        if not self.running:
+            return
+        key = prepared.fingerprint.cache_key
+        pending = self._pending.get(key)
+        if pending is not None:
+            pending.hits += 1
+            return
+        if len(self._pending) >= self.max_pending:
+            CACHE_RESCORES.labels(status="dropped").inc()
+            return
+        self._pending[key] = _Pending(request, prepared)
+        CACHE_RESCORE_PENDING.set(len(self._pending))
+
+    def refresh(self, request: SentimentRequest, prepared: PreparedRequest) -> None:
+        """XFetch: tính lại key hot trong background trước khi hết hạn (request vẫn nhận kết quả cache)"""
+        key = prepared.fingerprint.cache_key
+        if key in self._refreshing:
+            return
+        if len(self._refreshing) >= self.max_refreshing:
+            CACHE_EARLY_REFRESHES.labels(status="dropped").inc()
+            return
+        task = asyncio.ensure_future(self._refresh(key, request, prepared))
+        self._refreshing[key] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+
+    async def _refresh(self, key: str, request: SentimentRequest, prepared: PreparedRequest) -> None:
+        try:
+            status = await self._recompute(key, request, prepared)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            status = "error"
+            logger.error(f"Cache early refresh error fp={prepared.fingerprint.short}: {e}")
+        CACHE_EARLY_REFRESHES.labels(status=status).inc()
+
+    async def _run(self) -> None:
+        interval = 1.0 / self.rate
+        while cache.migrating:
+            await asyncio.sleep(interval)
+            if not self._pending:
+                continue
+            key = max(self._pending, key=lambda k: self._pending[k].hits)
+            pending = self._pending.pop(key)
+            CACHE_RESCORE_PENDING.set(len(self._pending))
+            try:
+                # Request thật / worker khác đã ghi namespace mới
+                if cache.get_key(key) is not None:
+                    status = "skipped"
+                else:
+                    status = await self._recompute(key, pending.request, pending.prepared)
+                CACHE_RESCORES.labels(status=status).inc()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                CACHE_RESCORES.labels(status="error").inc()
+                logger.error(f"Cache rescore error fp={pending.prepared.fingerprint.short}: {e}")
+
+        self._pending.clear()
+        CACHE_RESCORE_PENDING.set(0)
+        logger.info("Cache migration window ended, rescorer stopped")
+
+    async def _recompute(self, key: str, request: SentimentRequest, prepared: PreparedRequest) -> str:
+        """Phân tích lại qua lane bulk của scheduler và ghi cache; trả về status cho metrics"""
+        deadline = Deadline(REQUEST_TIMEOUT)
+        try:
+            async with scheduler.slot(scheduler.lane_for("bulk"), RESCORE_TENANT, deadline):
+                started = time.perf_counter()
+                result = await asyncio.wait_for(
+                    single_flight.do(
+                        key,
+                        lambda: sentiment_service.analyze_async(request, prepared=prepared, deadline=deadline)
+                    ),
+                    timeout=deadline.remaining()
+                )
+                compute_time = time.perf_counter() - started
+        except LoadShedError:
+            # Đang quá tải: bỏ qua, request thật vẫn đọc được kết quả cũ
+            return "shed"
+
+        cache.set_key(sentiment_service.cache_key_for(prepared, result), result.dict(), compute_time=compute_time)
+        return "ok"
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "rate": self.rate,
+            "pending": len(self._pending),
+            "refreshing": len(self._refreshing),
+        }
+
+
+# Global cache rescorer instance
+cache_rescorer = CacheRescorer()
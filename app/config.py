@@ -13,6 +13,24 @@ MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
 MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "10"))
 MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "30000"))
 
+# Concurrency per worker (dùng cho cả pool sizing)
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "50"))
+
+# Async MongoDB (Motor) - pool size theo concurrency của mỗi worker
+MONGO_ASYNC_MAX_POOL_SIZE = int(os.getenv("MONGO_ASYNC_MAX_POOL_SIZE", str(MAX_CONCURRENT_REQUESTS)))
+MONGO_ASYNC_MIN_POOL_SIZE = int(os.getenv("MONGO_ASYNC_MIN_POOL_SIZE", "2"))
+MONGO_OP_TIMEOUT = float(os.getenv("MONGO_OP_TIMEOUT", "2.0"))  # cap cho mỗi DB call (giây)
+
+# Topic Registry (preload qc_sentiment + change stream / polling refresh)
+TOPIC_ACTIVE_FIELD = os.getenv("TOPIC_ACTIVE_FIELD", "active")
+TOPIC_UPDATED_AT_FIELD = os.getenv("TOPIC_UPDATED_AT_FIELD", "updated_at")
+TOPIC_CHANGE_STREAM_ENABLED = os.getenv("TOPIC_CHANGE_STREAM_ENABLED", "true").lower() == "true"
+TOPIC_POLL_INTERVAL = float(os.getenv("TOPIC_POLL_INTERVAL", "30"))
+TOPIC_FULL_RELOAD_INTERVAL = float(os.getenv("TOPIC_FULL_RELOAD_INTERVAL", "600"))
+TOPIC_WATCH_RETRY_INTERVAL = float(os.getenv("TOPIC_WATCH_RETRY_INTERVAL", "60"))
+# /topics/match: số topic tối đa được phân tích LLM cho một post (analyze=true)
+TOPIC_MATCH_MAX_ANALYZE = int(os.getenv("TOPIC_MATCH_MAX_ANALYZE", "20"))
+
 # OpenAI Configuration
 OPENAI_URI = os.getenv("OPENAI_URI", "")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -21,26 +39,162 @@ OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
 OPENAI_TIMEOUT = int(os.getenv("OPENAI_TIMEOUT", "30"))
 OPENAI_MAX_TOKENS = int(os.getenv("OPENAI_MAX_TOKENS", "500"))
 
+# HTTP connection pool dùng chung cho mọi LLM call (mỗi worker một pool, giữ keep-alive)
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", str(MAX_CONCURRENT_REQUESTS * 2)))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", str(MAX_CONCURRENT_REQUESTS)))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))  # giây
+LLM_HTTP_CONNECT_TIMEOUT = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "5"))
+LLM_HTTP2_ENABLED = os.getenv("LLM_HTTP2_ENABLED", "false").lower() == "true"  # cần package h2
+
+# LLM router: danh sách OpenAI-compatible endpoints (JSON), để trống = một endpoint từ OPENAI_URI/LLM_MODEL
+# [{"name": "deepinfra", "base_url": "...", "model": "...", "api_key_env": "DEEPINFRA_API_KEY",
+#   "weight": 2, "max_concurrency": 64}, {"name": "vllm", "base_url": "http://vllm:8000/v1", ...}]
+LLM_ENDPOINTS = os.getenv("LLM_ENDPOINTS", "")
+LLM_ROUTER_MAX_ATTEMPTS = int(os.getenv("LLM_ROUTER_MAX_ATTEMPTS", "2"))  # số endpoint thử khi failover
+LLM_ROUTER_FAILURE_THRESHOLD = int(os.getenv("LLM_ROUTER_FAILURE_THRESHOLD", "5"))  # lỗi liên tiếp → unhealthy
+LLM_ROUTER_COOLDOWN = float(os.getenv("LLM_ROUTER_COOLDOWN", "30"))  # giây trước khi thử lại endpoint unhealthy
+LLM_ROUTER_EWMA_ALPHA = float(os.getenv("LLM_ROUTER_EWMA_ALPHA", "0.2"))
+
+# Hedged LLM requests: gửi request thứ hai khi request đầu chậm hơn percentile latency gần đây
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.05"))  # tối đa 5% call thêm
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))  # giây
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "50"))
+LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "1000"))
+OPENAI_HEDGE_URI = os.getenv("OPENAI_HEDGE_URI", "")  # mặc định = OPENAI_URI
+LLM_HEDGE_MODEL = os.getenv("LLM_HEDGE_MODEL", "")  # mặc định = LLM_MODEL
+
 # Cache Configuration
 CACHE_TTL = int(os.getenv("CACHE_TTL", "3600"))  # 1 hour
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5"))  # giây
+
+# Cache namespace migration: sau khi đổi prompt/model vẫn đọc namespace cũ trong migration window,
+# background re-score dần các key hot sang namespace mới (không stampede LLM sau deploy)
+CACHE_MIGRATION_WINDOW = int(os.getenv("CACHE_MIGRATION_WINDOW", str(CACHE_TTL)))  # giây, 0 = tắt
+CACHE_PREVIOUS_NAMESPACE = os.getenv("CACHE_PREVIOUS_NAMESPACE", "")  # override, vd. khi không có Redis
+CACHE_RESCORE_RATE = float(os.getenv("CACHE_RESCORE_RATE", "1.0"))  # re-score / giây / worker, 0 = tắt
+CACHE_RESCORE_MAX_PENDING = int(os.getenv("CACHE_RESCORE_MAX_PENDING", "1000"))
+
+# Cache expiry: TTL jitter + refresh sớm kiểu XFetch cho key hot (không để key hot hết hạn cùng lúc)
+CACHE_TTL_JITTER = float(os.getenv("CACHE_TTL_JITTER", "0.1"))  # ± tỉ lệ của CACHE_TTL
+CACHE_XFETCH_BETA = float(os.getenv("CACHE_XFETCH_BETA", "1.0"))  # > 1 refresh sớm hơn, 0 = tắt
+CACHE_REFRESH_MIN_HITS = int(os.getenv("CACHE_REFRESH_MIN_HITS", "3"))  # chỉ refresh key đủ hot
+CACHE_REFRESH_MAX_INFLIGHT = int(os.getenv("CACHE_REFRESH_MAX_INFLIGHT", "4"))  # mỗi worker
+
+# Cache value encoding: binary gọn + zstd optional (dictionary train trên explanations)
+CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION", "none").lower()  # none | zstd
+CACHE_ZSTD_DICT = os.getenv("CACHE_ZSTD_DICT", "")  # file dictionary (benchmarks/cache_codec.py --train)
+CACHE_ZSTD_LEVEL = int(os.getenv("CACHE_ZSTD_LEVEL", "3"))
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "64"))  # explanation ngắn hơn thì không nén
+
+# Hot-key sketch (Count-Min + top-K, mỗi worker)
+HOT_KEYS_WIDTH = int(os.getenv("HOT_KEYS_WIDTH", "2048"))
+HOT_KEYS_DEPTH = int(os.getenv("HOT_KEYS_DEPTH", "4"))
+HOT_KEYS_TOP_K = int(os.getenv("HOT_KEYS_TOP_K", "20"))
+HOT_KEYS_DECAY_INTERVAL = float(os.getenv("HOT_KEYS_DECAY_INTERVAL", "300"))  # giây, 0 = không decay
+
+# Result Store (MongoDB sink + L3 cache theo content hash)
+RESULT_STORE_ENABLED = os.getenv("RESULT_STORE_ENABLED", "false").lower() == "true"
+RESULT_STORE_COLLECTION = os.getenv("RESULT_STORE_COLLECTION", "sentiment_results")
+# Một record / post (id, index) cho mọi kết quả cuối, kể cả cache hit (lịch sử cho analytics)
+RESULT_STORE_OCCURRENCE_COLLECTION = os.getenv("RESULT_STORE_OCCURRENCE_COLLECTION", "sentiment_occurrences")
+RESULT_STORE_BATCH_SIZE = int(os.getenv("RESULT_STORE_BATCH_SIZE", "500"))
+RESULT_STORE_FLUSH_INTERVAL = float(os.getenv("RESULT_STORE_FLUSH_INTERVAL", "2.0"))
+RESULT_STORE_MAX_BUFFER = int(os.getenv("RESULT_STORE_MAX_BUFFER", "10000"))
+RESULT_STORE_MAX_RETRIES = int(os.getenv("RESULT_STORE_MAX_RETRIES", "3"))
+RESULT_STORE_LOOKUP_TIMEOUT = float(os.getenv("RESULT_STORE_LOOKUP_TIMEOUT", "0.2"))
 
 # Performance Settings
-MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "50"))
 REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "60"))
 RATE_LIMIT = os.getenv("RATE_LIMIT", "100/minute")
 
+# Alert priority: ước tính log_level tiềm năng trước LLM, đưa item có khả năng cảnh báo lên lane nhanh
+ALERT_PRIORITY_ENABLED = os.getenv("ALERT_PRIORITY_ENABLED", "true").lower() == "true"
+ALERT_LANE = os.getenv("ALERT_LANE", "realtime")
+ALERT_PROMOTE_FROM = os.getenv("ALERT_PROMOTE_FROM", "default")  # các lane được nâng lên ALERT_LANE
+ALERT_MIN_LEVEL = int(os.getenv("ALERT_MIN_LEVEL", "2"))
+ALERT_SCORE_THRESHOLD = float(os.getenv("ALERT_SCORE_THRESHOLD", "0.2"))
+
+# Alert fan-out: kết quả log_level >= ALERT_STREAM_MIN_LEVEL được publish (non-blocking, buffer có giới hạn)
+# ra Redis Stream (backend "memory" = stand-in trong process) và webhook batch (optional)
+ALERT_STREAM_ENABLED = os.getenv("ALERT_STREAM_ENABLED", "false").lower() == "true"
+ALERT_STREAM_BACKEND = os.getenv("ALERT_STREAM_BACKEND", "redis")  # redis | memory
+ALERT_STREAM_URL = os.getenv("ALERT_STREAM_URL", "") or REDIS_URL
+ALERT_STREAM_KEY = os.getenv("ALERT_STREAM_KEY", "sentiment:alerts")
+ALERT_STREAM_MAXLEN = int(os.getenv("ALERT_STREAM_MAXLEN", "100000"))  # XADD MAXLEN ~
+ALERT_STREAM_MIN_LEVEL = int(os.getenv("ALERT_STREAM_MIN_LEVEL", "1"))
+ALERT_STREAM_MAX_BUFFER = int(os.getenv("ALERT_STREAM_MAX_BUFFER", "10000"))
+ALERT_STREAM_BATCH_SIZE = int(os.getenv("ALERT_STREAM_BATCH_SIZE", "200"))
+ALERT_WEBHOOK_URL = os.getenv("ALERT_WEBHOOK_URL", "")
+ALERT_WEBHOOK_BATCH_SIZE = int(os.getenv("ALERT_WEBHOOK_BATCH_SIZE", "100"))
+ALERT_WEBHOOK_FLUSH_INTERVAL = float(os.getenv("ALERT_WEBHOOK_FLUSH_INTERVAL", "1.0"))
+ALERT_WEBHOOK_TIMEOUT = float(os.getenv("ALERT_WEBHOOK_TIMEOUT", "5.0"))
+# Mỗi (id, index) chỉ publish một lần trong ALERT_DEDUPE_TTL giây (trong một worker)
+ALERT_DEDUPE_TTL = float(os.getenv("ALERT_DEDUPE_TTL", "3600"))
+ALERT_DEDUPE_MAX_KEYS = int(os.getenv("ALERT_DEDUPE_MAX_KEYS", "100000"))
+
+# Batch endpoints (/analyze/batch, /analyze/legacy/batch)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))  # item / batch được chờ scheduler slot cùng lúc
+
+# Response compression (chỉ cho endpoint có response lớn)
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1000"))  # bytes
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))  # 1-9, level cao tốn CPU hơn nhiều mà nén thêm ít
+
+# Request scheduler: priority lanes (name:weight:max_queue, theo thứ tự ưu tiên) + load shedding
+SCHEDULER_LANES = os.getenv("SCHEDULER_LANES", "realtime:16:200,default:4:500,bulk:1:1000")
+SCHEDULER_MAX_WAIT = float(os.getenv("SCHEDULER_MAX_WAIT", str(REQUEST_TIMEOUT / 2)))  # giây
+SCHEDULER_INITIAL_SERVICE_TIME = float(os.getenv("SCHEDULER_INITIAL_SERVICE_TIME", "1.5"))
+PRIORITY_API_KEYS = os.getenv("PRIORITY_API_KEYS", "")  # "apikey1=realtime,apikey2=bulk"
+SCHEDULER_TENANT_WEIGHTS = os.getenv("SCHEDULER_TENANT_WEIGHTS", "")  # "apikey1=4,apikey2=1"
+# IP / CIDR của reverse proxy (nginx): chỉ request đi qua đây mới được tin header X-Real-IP
+TRUSTED_PROXIES = os.getenv("TRUSTED_PROXIES", "127.0.0.1,::1")
+
+# Rate limiting (token bucket trong Redis, dùng chung giữa các worker/container)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "0"))  # 0 = bằng limit của RATE_LIMIT
+RATE_LIMIT_LEASE_MAX = int(os.getenv("RATE_LIMIT_LEASE_MAX", "16"))  # tokens tối đa lấy trước cho local bucket
+RATE_LIMIT_LEASE_TTL = float(os.getenv("RATE_LIMIT_LEASE_TTL", "1.0"))  # giây
+
 # Logging
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+_PRODUCTION_LOGS = os.getenv("ENVIRONMENT", "development") == "production"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json" if _PRODUCTION_LOGS else "text")  # json | text
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # queue → listener thread; đầy thì bỏ record
+# Sampling log INFO/DEBUG trong hot path (WARNING+ luôn ghi); production mặc định 1%
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01" if _PRODUCTION_LOGS else "1.0"))
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")  # override theo event: "cache.hit=0.001,request.completed=0.05"
 
 # Langfuse Configuration
 LANGFUSE_SECRET_KEY = os.getenv("LANGFUSE_SECRET_KEY", "")
 LANGFUSE_PUBLIC_KEY = os.getenv("LANGFUSE_PUBLIC_KEY", "")
 LANGFUSE_HOST = os.getenv("LANGFUSE_HOST", "https://api.langfuse.com")
+# Tracing: tail sampling lúc request kết thúc, trace giữ lại vào ring buffer và export theo batch ở thread nền
+LANGFUSE_SAMPLE_RATE = float(os.getenv("LANGFUSE_SAMPLE_RATE", "0.05"))  # tỉ lệ trace thường được giữ
+LANGFUSE_SAMPLE_ALWAYS_LEVEL = int(os.getenv("LANGFUSE_SAMPLE_ALWAYS_LEVEL", "2"))  # log_level >= → luôn giữ (lỗi cũng luôn giữ)
+LANGFUSE_BUFFER_SIZE = int(os.getenv("LANGFUSE_BUFFER_SIZE", "5000"))  # ring buffer, đầy thì bỏ trace cũ nhất
+LANGFUSE_EXPORT_BATCH = int(os.getenv("LANGFUSE_EXPORT_BATCH", "100"))
+LANGFUSE_EXPORT_INTERVAL = float(os.getenv("LANGFUSE_EXPORT_INTERVAL", "2.0"))  # giây
+# Giới hạn cứng cho mỗi trace (chi phí trên request path + bộ nhớ buffer)
+LANGFUSE_MAX_SPANS = int(os.getenv("LANGFUSE_MAX_SPANS", "8"))
+LANGFUSE_MAX_METADATA = int(os.getenv("LANGFUSE_MAX_METADATA", "24"))
+LANGFUSE_MAX_FIELD_CHARS = int(os.getenv("LANGFUSE_MAX_FIELD_CHARS", "2000"))
 
 # Production Settings
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+# Admin endpoints (/admin/*): header X-Admin-Token; không set token thì chỉ mở ngoài production
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Profiling: sampling profiler theo yêu cầu + event loop lag monitor
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))  # giây giữa hai sample (200 Hz)
+LOOP_LAG_MONITOR_ENABLED = os.getenv("LOOP_LAG_MONITOR_ENABLED", "true").lower() == "true"
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.05"))  # giây
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.1"))  # loop bị block lâu hơn → ghi stack + metric
 WORKERS = int(os.getenv("WORKERS", "4"))
 
 # Comment Types (từ sentiment_analysis_fixed.py)
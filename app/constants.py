@@ -17,4 +17,13 @@ TOPIC_TYPES = [
 ]
 
 # News topic type (có log_level riêng)
-NEWS_TOPIC_TYPE = "newsTopic"
\ No newline at end of file
+NEWS_TOPIC_TYPE = "newsTopic"
+
+# Từ ngữ tiêu cực thường gặp khi nội dung có khả năng thành cảnh báo (pre-scoring trước LLM,
+# không dùng để quyết định sentiment)
+NEGATIVE_LEXICON = [
+    "lừa đảo", "thất vọng", "bức xúc", "phẫn nộ", "tẩy chay", "phốt", "bóc phốt", "scam",
+    "đừng mua", "không bao giờ", "tệ", "tồi", "kém", "dởm", "rác", "lỗi", "hỏng", "hư",
+    "cháy", "nổ", "tai nạn", "sự cố", "thu hồi", "kiện", "khiếu nại", "bồi thường", "gian lận",
+    "chậm trễ", "vô trách nhiệm", "coi thường", "phản đối", "độc hại", "ngộ độc", "nguy hiểm",
+]
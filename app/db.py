@@ -1,4 +1,7 @@
+import asyncio
 import logging
+import time
+from typing import Any, Dict, List, Optional
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
 from app.config import (
@@ -6,8 +9,20 @@ from app.config import (
     DB_NAME, 
     MONGO_MAX_POOL_SIZE,
     MONGO_MIN_POOL_SIZE, 
-    MONGO_MAX_IDLE_TIME_MS
+    MONGO_MAX_IDLE_TIME_MS,
+    MONGO_ASYNC_MAX_POOL_SIZE,
+    MONGO_ASYNC_MIN_POOL_SIZE,
+    MONGO_OP_TIMEOUT
 )
+from app.deadline import Deadline, DeadlineExceeded
+from app.metrics import STAGE_LATENCY, STAGE_ERRORS
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    MOTOR_AVAILABLE = True
+except ImportError:
+    AsyncIOMotorClient = None
+    MOTOR_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
@@ -76,10 +91,6 @@ class MongoConnection:
                 self._initialized = True
                 logger.info(f"Database connection established: {DB_NAME}")
                 
-                # Test the topics collection
-                test_count = self._client[DB_NAME]["qc_sentiment"].count_documents({}, limit=1)
-                logger.info(f"Topics collection accessible, sample count: {test_count}")
-                
             except Exception as e:
                 logger.error(f"Failed to connect to MongoDB: {str(e)}")
                 self._initialized = False
@@ -101,8 +112,117 @@ class MongoConnection:
         self._ensure_connection()
         return self.db["qc_sentiment"]
 
+class AsyncMongoConnection:
+    """
+    Async data-access layer (Motor) cho API path.
+    - Pool size theo concurrency của worker (MONGO_ASYNC_MAX_POOL_SIZE)
+    - Mỗi call lấy timeout từ phần budget còn lại của request (Deadline)
+    - Latency từng call được ghi vào STAGE_LATENCY
+    """
+    
+    def __init__(self):
+        self._client = None
+    
+    def _create_client(self):
+        if not MOTOR_AVAILABLE:
+            raise RuntimeError("motor is not installed; async MongoDB access unavailable")
+        
+        # Client được tạo lazy trong event loop của worker (an toàn với preload_app + fork)
+        client = AsyncIOMotorClient(
+            MONGO_URI,
+            maxPoolSize=MONGO_ASYNC_MAX_POOL_SIZE,
+            minPoolSize=MONGO_ASYNC_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+            serverSelectionTimeoutMS=int(MONGO_OP_TIMEOUT * 1000),
+            connectTimeoutMS=int(MONGO_OP_TIMEOUT * 1000),
+            waitQueueTimeoutMS=int(MONGO_OP_TIMEOUT * 1000),
+            retryWrites=True,
+            retryReads=True,
+            readPreference='primary',
+            maxConnecting=4,
+            ssl=True,
+            tlsAllowInvalidCertificates=False
+        )
+        logger.info(f"Async MongoDB pool configured: max={MONGO_ASYNC_MAX_POOL_SIZE}, min={MONGO_ASYNC_MIN_POOL_SIZE}")
+        return client
+    
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._create_client()
+        return self._client
+    
+    @property
+    def db(self):
+        return self.client[DB_NAME]
+    
+    @property
+    def topics_col(self):
+        return self.db["qc_sentiment"]
+    
+    def collection(self, name: str):
+        return self.db[name]
+    
+    async def _run(self, stage: str, coro, deadline: Optional[Deadline], cap: Optional[float]):
+        """Chạy một DB call với timeout lấy từ deadline và ghi latency theo stage"""
+        timeout = deadline.timeout(cap) if deadline else cap
+        if timeout is not None and timeout <= 0:
+            coro.close()
+            STAGE_ERRORS.labels(stage=stage, error="deadline").inc()
+            raise DeadlineExceeded(f"Deadline exceeded before {stage}")
+        
+        started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(coro, timeout=timeout)
+        except asyncio.TimeoutError:
+            STAGE_ERRORS.labels(stage=stage, error="timeout").inc()
+            raise
+        except Exception as e:
+            STAGE_ERRORS.labels(stage=stage, error=type(e).__name__).inc()
+            raise
+        finally:
+            STAGE_LATENCY.labels(stage=stage).observe(time.perf_counter() - started)
+    
+    async def ping(self, deadline: Optional[Deadline] = None) -> bool:
+        await self._run("db.ping", self.client.admin.command('ping'), deadline, MONGO_OP_TIMEOUT)
+        return True
+    
+    async def find_one(
+        self,
+        collection: str,
+        filter: Dict[str, Any],
+        projection: Optional[Dict[str, Any]] = None,
+        deadline: Optional[Deadline] = None,
+        stage: Optional[str] = None,
+        cap: Optional[float] = MONGO_OP_TIMEOUT
+    ) -> Optional[Dict[str, Any]]:
+        max_time_ms = deadline.timeout_ms(cap) if deadline else int(cap * 1000) if cap else None
+        coro = self.collection(collection).find_one(filter, projection, max_time_ms=max_time_ms)
+        return await self._run(stage or f"db.{collection}.find_one", coro, deadline, cap)
+    
+    async def find(
+        self,
+        collection: str,
+        filter: Dict[str, Any],
+        projection: Optional[Dict[str, Any]] = None,
+        deadline: Optional[Deadline] = None,
+        stage: Optional[str] = None,
+        cap: Optional[float] = None,
+        batch_size: int = 1000
+    ) -> List[Dict[str, Any]]:
+        cursor = self.collection(collection).find(filter, projection, batch_size=batch_size)
+        if deadline or cap:
+            cursor = cursor.max_time_ms(deadline.timeout_ms(cap) if deadline else int(cap * 1000))
+        return await self._run(stage or f"db.{collection}.find", cursor.to_list(length=None), deadline, cap)
+    
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
 # Global instances - lazy initialization
-mongo_conn = MongoConnection()
+mongo_conn = MongoConnection()  # sync, dùng cho scripts / CLI
+async_mongo = AsyncMongoConnection()  # async, dùng cho API
 
 # Backward compatibility
 def get_client():
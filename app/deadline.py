@@ -0,0 +1,46 @@
+import asyncio
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Request budget đã hết trước khi thực hiện xong một stage"""
+
+
+class Deadline:
+    """
+    Request-scoped deadline. Tạo một lần ở endpoint, mỗi stage phía dưới lấy timeout
+    riêng từ phần budget còn lại thay vì dùng timeout cố định
+    """
+    __slots__ = ("budget", "started_at", "expires_at")
+
+    def __init__(self, budget: float, started_at: Optional[float] = None):
+        self.budget = budget
+        self.started_at = time.monotonic() if started_at is None else started_at
+        self.expires_at = self.started_at + budget
+
+    def remaining(self) -> float:
+        """Số giây còn lại của request budget (không âm)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """Timeout cho một call: phần budget còn lại, giới hạn bởi cap của stage"""
+        remaining = self.remaining()
+        if cap is not None:
+            remaining = min(remaining, cap)
+        return remaining
+
+    def timeout_ms(self, cap: Optional[float] = None) -> int:
+        return max(1, int(self.timeout(cap) * 1000))
+
+    def check(self, stage: str = "") -> None:
+        """Raise DeadlineExceeded nếu budget đã hết"""
+        if self.expired:
+            raise DeadlineExceeded(f"Deadline exceeded before {stage or 'stage'}")
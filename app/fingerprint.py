@@ -0,0 +1,80 @@
+import hashlib
+from dataclasses import dataclass
+from typing import Iterable
+
+# xxh3 nhanh hơn nhiều so với md5/blake2 với text dài; không có thì dùng blake2b (stdlib)
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+HASH_NAME = "xxh3_128" if XXHASH_AVAILABLE else "blake2b_128"
+
+# Tăng khi đổi format encoding để key cũ không bị hiểu nhầm
+_FORMAT_VERSION = b"\x01"
+
+
+def hash_bytes(data: bytes) -> str:
+    """Hash 128-bit non-crypto (hex)"""
+    if XXHASH_AVAILABLE:
+        return xxhash.xxh3_128_hexdigest(data)
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def normalize_keywords(keywords: Iterable[str]) -> list:
+    """Keywords không phân biệt hoa/thường, thứ tự và trùng lặp"""
+    normalized = {k.strip().lower() for k in keywords if k}
+    normalized.discard("")
+    return sorted(normalized)
+
+
+def _pack(parts: list, value: str) -> None:
+    data = value.encode("utf-8")
+    parts.append(len(data).to_bytes(4, "little"))
+    parts.append(data)
+
+
+def canonical_bytes(text: str, post_type: str, keywords: Iterable[str]) -> bytes:
+    """
+    Encoding nhị phân length-prefixed của các field quyết định kết quả LLM
+    (text được phân tích, type, keywords). Length prefix tránh va chạm kiểu
+    ("ab", "c") vs ("a", "bc") mà không cần escape / json.dumps.
+    Text giữ nguyên như LLM nhận (không normalize: split/join tốn hơn cả hash)
+    """
+    parts = [_FORMAT_VERSION]
+    _pack(parts, post_type or "")
+    _pack(parts, text or "")
+    # Keywords đã sort, nối bằng NUL và encode một lần (NUL không xuất hiện trong keyword)
+    _pack(parts, "\x00".join(normalize_keywords(keywords)))
+    return b"".join(parts)
+
+
+def namespace_for(prompt_version: str, model: str) -> str:
+    """Namespace ngắn theo prompt + model + thuật toán hash"""
+    return hashlib.blake2b(f"{prompt_version}|{model}|{HASH_NAME}".encode(), digest_size=4).hexdigest()
+
+
+@dataclass(frozen=True)
+class Fingerprint:
+    """Fingerprint của một request, tính một lần và dùng chung cho cache, single-flight, result store, log"""
+    digest: str
+    namespace: str = ""
+
+    @classmethod
+    def build(cls, text: str, post_type: str, keywords: Iterable[str], namespace: str = "") -> "Fingerprint":
+        return cls(digest=hash_bytes(canonical_bytes(text, post_type, keywords)), namespace=namespace)
+
+    @property
+    def cache_key(self) -> str:
+        if self.namespace:
+            return f"sentiment:{self.namespace}:{self.digest}"
+        return f"sentiment:{self.digest}"
+
+    def in_namespace(self, namespace: str) -> "Fingerprint":
+        return Fingerprint(digest=self.digest, namespace=namespace)
+
+    @property
+    def short(self) -> str:
+        """Dạng ngắn cho log"""
+        return self.digest[:12]
@@ -0,0 +1,90 @@
+import time
+from array import array
+from typing import Any, Dict, List, Optional
+
+from app.config import HOT_KEYS_WIDTH, HOT_KEYS_DEPTH, HOT_KEYS_TOP_K, HOT_KEYS_DECAY_INTERVAL
+
+
+class HotKeySketch:
+    """
+    Count-Min sketch + top-K theo fingerprint digest (trong một worker):
+    - Bộ nhớ cố định depth * width counters, không phụ thuộc số key khác nhau
+    - Index lấy thẳng từ các đoạn 32-bit của digest (đã là hash) → không hash lại
+    - Counters giảm một nửa sau mỗi HOT_KEYS_DECAY_INTERVAL giây để phản ánh traffic gần đây
+    """
+
+    def __init__(
+        self,
+        width: int = HOT_KEYS_WIDTH,
+        depth: int = HOT_KEYS_DEPTH,
+        top_k: int = HOT_KEYS_TOP_K,
+        decay_interval: float = HOT_KEYS_DECAY_INTERVAL,
+    ):
+        self.width = width
+        self.depth = min(depth, 4)  # digest 128-bit → tối đa 4 đoạn 32-bit
+        self.top_k = top_k
+        self.decay_interval = decay_interval
+        self._rows = [array("L", [0]) * width for _ in range(self.depth)]
+        self._top: Dict[str, Dict[str, Any]] = {}
+        self._last_decay = time.monotonic()
+        self.total = 0
+
+    def _indexes(self, digest: str) -> List[int]:
+        return [int(digest[i * 8:(i + 1) * 8], 16) % self.width for i in range(self.depth)]
+
+    def add(self, digest: str, label: Optional[Dict[str, Any]] = None) -> int:
+        """Đếm một lần truy cập, trả về số lần ước tính (chặn trên) của key"""
+        if self.decay_interval and time.monotonic() - self._last_decay >= self.decay_interval:
+            self._decay()
+
+        estimate = None
+        for row, index in zip(self._rows, self._indexes(digest)):
+            row[index] += 1
+            estimate = row[index] if estimate is None else min(estimate, row[index])
+        self.total += 1
+
+        entry = self._top.get(digest)
+        if entry is not None:
+            entry["count"] = estimate
+        elif len(self._top) < self.top_k:
+            self._top[digest] = {"count": estimate, **(label or {})}
+        else:
+            coldest = min(self._top, key=lambda k: self._top[k]["count"])
+            if estimate > self._top[coldest]["count"]:
+                del self._top[coldest]
+                self._top[digest] = {"count": estimate, **(label or {})}
+        return estimate
+
+    def estimate(self, digest: str) -> int:
+        return min(row[index] for row, index in zip(self._rows, self._indexes(digest)))
+
+    def _decay(self) -> None:
+        for row in self._rows:
+            for i, value in enumerate(row):
+                if value:
+                    row[i] = value >> 1
+        for digest in list(self._top):
+            self._top[digest]["count"] >>= 1
+            if not self._top[digest]["count"]:
+                del self._top[digest]
+        self.total >>= 1
+        self._last_decay = time.monotonic()
+
+    def top(self, n: Optional[int] = None) -> List[Dict[str, Any]]:
+        ranked = sorted(self._top.items(), key=lambda item: item[1]["count"], reverse=True)
+        return [
+            {"fingerprint": digest[:12], "share": round(entry["count"] / max(self.total, 1), 4), **entry}
+            for digest, entry in ranked[:n or self.top_k]
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "width": self.width,
+            "depth": self.depth,
+            "total": self.total,
+            "top": self.top(),
+        }
+
+
+# Global hot-key sketch instance
+hot_keys = HotKeySketch()
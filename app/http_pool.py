@@ -0,0 +1,152 @@
+import logging
+import time
+from typing import Optional
+
+import httpx
+
+from app.config import (
+    OPENAI_TIMEOUT,
+    LLM_HTTP_MAX_CONNECTIONS,
+    LLM_HTTP_MAX_KEEPALIVE,
+    LLM_HTTP_KEEPALIVE_EXPIRY,
+    LLM_HTTP_CONNECT_TIMEOUT,
+    LLM_HTTP2_ENABLED,
+)
+from app.metrics import LLM_HTTP_REQUESTS, LLM_HTTP_CONNECT_TIME
+
+# HTTP/2 cần package h2 (httpx[http2])
+try:
+    import h2  # noqa: F401
+    H2_AVAILABLE = True
+except ImportError:
+    H2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class _ConnectionTrace:
+    """
+    Theo dõi một request qua httpcore trace extension: request có mở connection mới
+    (TCP/TLS handshake) hay dùng lại connection keep-alive, và HTTP version
+    """
+
+    def __init__(self, client: str):
+        self.client = client
+        self.new_connection = False
+        self.connect_started = 0.0
+        self.connect_time = 0.0
+        self.http_version = "unknown"
+
+    def on_event(self, name: str, info: dict) -> None:
+        if name == "connection.connect_tcp.started":
+            self.new_connection = True
+            self.connect_started = time.perf_counter()
+        elif name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            self.connect_time = time.perf_counter() - self.connect_started
+        elif name.startswith("http2.send_request_headers"):
+            self.http_version = "2"
+        elif name.startswith("http11.send_request_headers"):
+            self.http_version = "1.1"
+
+    async def aon_event(self, name: str, info: dict) -> None:
+        self.on_event(name, info)
+
+    def record(self) -> None:
+        connection = "new" if self.new_connection else "reused"
+        LLM_HTTP_REQUESTS.labels(client=self.client, connection=connection, http_version=self.http_version).inc()
+        if self.new_connection:
+            LLM_HTTP_CONNECT_TIME.labels(client=self.client).observe(self.connect_time)
+
+
+class _TracedTransport(httpx.HTTPTransport):
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        trace = _ConnectionTrace("sync")
+        request.extensions["trace"] = trace.on_event
+        try:
+            return super().handle_request(request)
+        finally:
+            trace.record()
+
+
+class _TracedAsyncTransport(httpx.AsyncHTTPTransport):
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        trace = _ConnectionTrace("async")
+        request.extensions["trace"] = trace.aon_event
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            trace.record()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(OPENAI_TIMEOUT, connect=LLM_HTTP_CONNECT_TIMEOUT)
+
+
+def _http2() -> bool:
+    if LLM_HTTP2_ENABLED and not H2_AVAILABLE:
+        logger.warning("LLM_HTTP2_ENABLED nhưng chưa cài h2 (httpx[http2]), dùng HTTP/1.1")
+    return LLM_HTTP2_ENABLED and H2_AVAILABLE
+
+
+class LLMHttpPool:
+    """
+    HTTP clients dùng chung cho mọi code path gọi LLM provider (ChatOpenAI sync/async,
+    router endpoints, script cũ) thay vì mỗi client tự tạo pool mặc định:
+    - Pool size / keep-alive cấu hình được, connection được giữ và dùng lại giữa các request
+    - HTTP/2 multiplexing tuỳ chọn (nhiều request song song trên một connection)
+    - Metrics connection mới vs dùng lại qua httpcore trace extension
+    httpx không mở connection khi khởi tạo client, nên tạo lúc import vẫn an toàn với
+    gunicorn preload_app (connection chỉ được mở trong từng worker sau fork)
+    """
+
+    def __init__(self):
+        self._sync: Optional[httpx.Client] = None
+        self._async: Optional[httpx.AsyncClient] = None
+
+    @property
+    def sync_client(self) -> httpx.Client:
+        if self._sync is None or self._sync.is_closed:
+            http2 = _http2()
+            self._sync = httpx.Client(
+                transport=_TracedTransport(http2=http2, limits=_limits()),
+                timeout=_timeout(),
+            )
+        return self._sync
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        if self._async is None or self._async.is_closed:
+            http2 = _http2()
+            self._async = httpx.AsyncClient(
+                transport=_TracedAsyncTransport(http2=http2, limits=_limits()),
+                timeout=_timeout(),
+            )
+        return self._async
+
+    async def aclose(self) -> None:
+        if self._async is not None:
+            await self._async.aclose()
+            self._async = None
+        if self._sync is not None:
+            self._sync.close()
+            self._sync = None
+
+    def stats(self) -> dict:
+        return {
+            "max_connections": LLM_HTTP_MAX_CONNECTIONS,
+            "max_keepalive": LLM_HTTP_MAX_KEEPALIVE,
+            "keepalive_expiry": LLM_HTTP_KEEPALIVE_EXPIRY,
+            "http2": LLM_HTTP2_ENABLED and H2_AVAILABLE,
+        }
+
+
+# Global HTTP pool instance
+http_pool = LLMHttpPool()
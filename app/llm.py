@@ -1,4 +1,7 @@
 import asyncio
+import math
+import time
+from collections import deque
 from langchain_openai import ChatOpenAI
 
 from .config import (
@@ -8,25 +11,22 @@ from .config import (
     OPENAI_TIMEOUT,
     OPENAI_MAX_TOKENS,
     LLM_MODEL,
-    LANGFUSE_SECRET_KEY,
-    LANGFUSE_PUBLIC_KEY,
-    LANGFUSE_HOST
+    LLM_HEDGE_ENABLED,
+    LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_MAX_RATIO,
+    LLM_HEDGE_MIN_DELAY,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_WINDOW,
+    OPENAI_HEDGE_URI,
+    LLM_HEDGE_MODEL,
+    LLM_ENDPOINTS
 )
+from .metrics import LLM_CALLS, LLM_HEDGE_WINS, LLM_HEDGE_SKIPPED, LLM_HEDGE_DELAY
+from .llm_router import LLMRouter, load_endpoints
+from .http_pool import http_pool
 
-# Try to import Langfuse callback handler
-try:
-    from langfuse.callback import CallbackHandler
-    langfuse_handler = CallbackHandler(
-        secret_key=LANGFUSE_SECRET_KEY,
-        public_key=LANGFUSE_PUBLIC_KEY,
-        host=LANGFUSE_HOST
-    ) if LANGFUSE_SECRET_KEY and LANGFUSE_PUBLIC_KEY else None
-except ImportError:
-    print("Warning: Langfuse not available. Continuing without tracing.")
-    langfuse_handler = None
-
-# Prepare callbacks
-callbacks = [langfuse_handler] if langfuse_handler else []
+# Không gắn LangChain callbacks (Langfuse CallbackHandler) vào client: LLM span được ghi qua
+# app.tracing (sampling + ring buffer + batched export), không trace từng call trên request path
 
 # Synchronous LLM for current workflow
 llm = ChatOpenAI(
@@ -38,7 +38,8 @@ llm = ChatOpenAI(
     timeout=OPENAI_TIMEOUT,
     max_tokens=OPENAI_MAX_TOKENS,
     streaming=False,
-    callbacks=callbacks, 
+    http_client=http_pool.sync_client,
+    http_async_client=http_pool.async_client,
 )
 
 # Async LLM for high-performance scenarios
@@ -51,5 +52,155 @@ async_llm = ChatOpenAI(
     timeout=OPENAI_TIMEOUT,
     max_tokens=OPENAI_MAX_TOKENS,
     streaming=False,
-    callbacks=callbacks
-)
\ No newline at end of file
+    http_client=http_pool.sync_client,
+    http_async_client=http_pool.async_client,
+)
+
+# Router cho nhiều OpenAI-compatible endpoints (mặc định chỉ có async_llm)
+llm_router = LLMRouter(load_endpoints(LLM_ENDPOINTS, async_llm))
+
+# Secondary LLM cho hedged requests (có thể là endpoint / model khác)
+hedge_llm = ChatOpenAI(
+    model=LLM_HEDGE_MODEL or LLM_MODEL,
+    temperature=0,
+    base_url=OPENAI_HEDGE_URI or OPENAI_URI,
+    api_key=OPENAI_API_KEY,
+    max_retries=0,  # hedge chỉ là bản sao, không retry
+    timeout=OPENAI_TIMEOUT,
+    max_tokens=OPENAI_MAX_TOKENS,
+    streaming=False,
+    http_client=http_pool.sync_client,
+    http_async_client=http_pool.async_client,
+) if LLM_HEDGE_ENABLED and (OPENAI_HEDGE_URI or LLM_HEDGE_MODEL) else None
+
+
+class LatencyTracker:
+    """Ring buffer latency gần đây, percentile được tính lại định kỳ (không sort mỗi call)"""
+    
+    def __init__(self, window: int = LLM_HEDGE_WINDOW, recompute_every: int = 20):
+        self._samples = deque(maxlen=window)
+        self._recompute_every = recompute_every
+        self._since_recompute = 0
+        self._cached = {}
+    
+    def record(self, latency: float) -> None:
+        self._samples.append(latency)
+        self._since_recompute += 1
+        if self._since_recompute >= self._recompute_every:
+            self._cached = {}
+            self._since_recompute = 0
+    
+    def __len__(self) -> int:
+        return len(self._samples)
+    
+    def percentile(self, p: float) -> float:
+        if p not in self._cached:
+            ordered = sorted(self._samples)
+            if not ordered:
+                return math.inf
+            index = min(len(ordered) - 1, max(0, int(math.ceil(p / 100 * len(ordered))) - 1))
+            self._cached[p] = ordered[index]
+        return self._cached[p]
+
+
+class HedgeBudget:
+    """Giới hạn số hedge: mỗi primary call tích luỹ `ratio` token, mỗi hedge tiêu 1 token"""
+    
+    def __init__(self, ratio: float = LLM_HEDGE_MAX_RATIO, burst: float = 10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = 1.0
+    
+    def on_primary(self) -> None:
+        self._tokens = min(self.burst, self._tokens + self.ratio)
+    
+    def try_acquire(self) -> bool:
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+
+class HedgedLLM:
+    """
+    Hedged requests cho tail latency: nếu call đầu chưa trả về sau percentile latency gần đây
+    (adaptive, tối thiểu LLM_HEDGE_MIN_DELAY) thì gửi thêm một request giống hệt (có thể tới
+    OPENAI_HEDGE_URI / LLM_HEDGE_MODEL). Kết quả về trước thắng, request còn lại bị cancel.
+    Số hedge bị giới hạn bởi HedgeBudget (mặc định ≤ 5% số call)
+    """
+    
+    def __init__(self, primary, secondary=None, enabled: bool = LLM_HEDGE_ENABLED):
+        self.primary = primary
+        self.secondary = secondary or primary
+        self.enabled = enabled
+        self.latency = LatencyTracker()
+        self.budget = HedgeBudget()
+    
+    def hedge_delay(self) -> float:
+        if len(self.latency) < LLM_HEDGE_MIN_SAMPLES:
+            return math.inf
+        return max(LLM_HEDGE_MIN_DELAY, self.latency.percentile(LLM_HEDGE_PERCENTILE))
+    
+    async def _timed(self, client, prompt, role: str):
+        LLM_CALLS.labels(role=role).inc()
+        started = time.perf_counter()
+        try:
+            response = await client.ainvoke(prompt)
+        except asyncio.CancelledError:
+            # Primary thua hedge / bị cancel chính là phần đuôi chậm: ghi thời gian đã chờ (cận dưới của
+            # latency thật), nếu bỏ qua thì percentile trôi xuống và hedge delay co lại dần
+            if role == "primary":
+                self.latency.record(time.perf_counter() - started)
+            raise
+        if role == "primary":
+            self.latency.record(time.perf_counter() - started)
+        # Router đã ghi model của endpoint; hedge client trực tiếp (LLM_HEDGE_MODEL) thì ghi ở đây
+        metadata = getattr(response, "response_metadata", None)
+        if isinstance(metadata, dict) and "model" not in metadata:
+            metadata["model"] = getattr(client, "model_name", None)
+        return response
+    
+    async def ainvoke(self, prompt):
+        if not self.enabled:
+            LLM_CALLS.labels(role="primary").inc()
+            return await self.primary.ainvoke(prompt)
+        
+        self.budget.on_primary()
+        delay = self.hedge_delay()
+        LLM_HEDGE_DELAY.set(delay if delay != math.inf else 0)
+        
+        primary = asyncio.create_task(self._timed(self.primary, prompt, "primary"))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=None if delay == math.inf else delay)
+            if done:
+                return primary.result()
+            
+            if not self.budget.try_acquire():
+                LLM_HEDGE_SKIPPED.labels(reason="budget").inc()
+                return await primary
+            
+            hedge = asyncio.create_task(self._timed(self.secondary, prompt, "hedge"))
+            tasks.add(hedge)
+            
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        LLM_HEDGE_WINS.labels(winner="primary" if task is primary else "hedge").inc()
+                        return task.result()
+                    error = task.exception()
+            # Cả hai đều lỗi
+            raise error
+        finally:
+            # Cancel request thua / request đang chạy khi caller bị cancel
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+
+# Async LLM có hedging qua router, dùng cho API path.
+# Không cấu hình OPENAI_HEDGE_URI thì hedge cũng đi qua router (ưu tiên endpoint đang ít tải hơn)
+hedged_llm = HedgedLLM(llm_router, hedge_llm or llm_router)
@@ -0,0 +1,252 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+from langchain_openai import ChatOpenAI
+
+from app.config import (
+    OPENAI_API_KEY,
+    OPENAI_TIMEOUT,
+    OPENAI_MAX_TOKENS,
+    LLM_MODEL,
+    LLM_ROUTER_MAX_ATTEMPTS,
+    LLM_ROUTER_FAILURE_THRESHOLD,
+    LLM_ROUTER_COOLDOWN,
+    LLM_ROUTER_EWMA_ALPHA,
+)
+from app.http_pool import http_pool
+from app.metrics import (
+    LLM_BACKEND_REQUESTS,
+    LLM_BACKEND_LATENCY,
+    LLM_BACKEND_OUTSTANDING,
+    LLM_BACKEND_HEALTHY,
+    LLM_FAILOVERS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Lỗi do chính request (endpoint khác cũng sẽ trả lỗi tương tự) → không failover
+_NON_RETRYABLE_STATUS = {400, 413, 422}
+
+
+def should_failover(error: Exception) -> bool:
+    status = getattr(error, "status_code", None)
+    return status not in _NON_RETRYABLE_STATUS
+
+
+class Endpoint:
+    """Một OpenAI-compatible backend cùng trạng thái routing: in-flight, latency EWMA, error rate, health"""
+
+    def __init__(self, name: str, client: Any, model: str, weight: float = 1.0, max_concurrency: int = 0):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.weight = max(weight, 1e-3)
+        self.max_concurrency = max_concurrency  # 0 = không giới hạn
+        self.outstanding = 0
+        self.latency: Optional[float] = None  # EWMA, giây
+        self.error_rate = 0.0  # EWMA của tỉ lệ lỗi
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        LLM_BACKEND_HEALTHY.labels(backend=name).set(1)
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def has_capacity(self) -> bool:
+        return not self.max_concurrency or self.outstanding < self.max_concurrency
+
+    def score(self, default_latency: float) -> float:
+        """Thời gian chờ kỳ vọng ~ (in-flight + 1) * latency, chia theo weight và phạt theo error rate"""
+        latency = self.latency if self.latency is not None else default_latency
+        return (self.outstanding + 1) * latency / (self.weight * max(1.0 - self.error_rate, 0.05))
+
+    def on_success(self, latency: float) -> None:
+        alpha = LLM_ROUTER_EWMA_ALPHA
+        self.latency = latency if self.latency is None else (1 - alpha) * self.latency + alpha * latency
+        self.error_rate *= 1 - alpha
+        self.consecutive_failures = 0
+        if self.unhealthy_until:
+            logger.info(f"LLM backend {self.name} recovered")
+            self.unhealthy_until = 0.0
+            LLM_BACKEND_HEALTHY.labels(backend=self.name).set(1)
+
+    def on_failure(self) -> None:
+        alpha = LLM_ROUTER_EWMA_ALPHA
+        self.error_rate = (1 - alpha) * self.error_rate + alpha
+        self.consecutive_failures += 1
+        # Sau cooldown endpoint được thử lại (half-open); lỗi tiếp thì mở lại ngay
+        if self.consecutive_failures >= LLM_ROUTER_FAILURE_THRESHOLD:
+            if self.healthy:
+                logger.warning(
+                    f"LLM backend {self.name} marked unhealthy for {LLM_ROUTER_COOLDOWN}s "
+                    f"after {self.consecutive_failures} consecutive failures"
+                )
+            self.unhealthy_until = time.monotonic() + LLM_ROUTER_COOLDOWN
+            LLM_BACKEND_HEALTHY.labels(backend=self.name).set(0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "model": self.model,
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "max_concurrency": self.max_concurrency,
+            "latency_ewma": round(self.latency, 4) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 4),
+            "healthy": self.healthy,
+        }
+
+
+class LLMRouter:
+    """
+    Router cho nhiều OpenAI-compatible endpoints (DeepInfra, vLLM self-hosted, ...):
+    - Chọn endpoint có thời gian chờ kỳ vọng nhỏ nhất (least outstanding * latency EWMA / weight)
+    - Tôn trọng max_concurrency từng endpoint; hết slot ở mọi endpoint thì chờ slot trống
+    - Lỗi → failover sang endpoint tốt nhất kế tiếp; lỗi liên tiếp → endpoint unhealthy trong cooldown
+    - Backend và model phục vụ được ghi vào response.response_metadata["backend"] / ["model"]
+    """
+
+    def __init__(self, endpoints: List[Endpoint], max_attempts: int = LLM_ROUTER_MAX_ATTEMPTS):
+        if not endpoints:
+            raise ValueError("LLMRouter cần ít nhất một endpoint")
+        self.endpoints = endpoints
+        self.max_attempts = max(1, min(max_attempts, len(endpoints)))
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def select(self, exclude: Iterable[str] = ()) -> Optional[Endpoint]:
+        candidates = [e for e in self.endpoints if e.name not in exclude]
+        # Tất cả unhealthy → vẫn thử, không fail toàn bộ request
+        healthy = [e for e in candidates if e.healthy] or candidates
+        available = [e for e in healthy if e.has_capacity()]
+        if not available:
+            return None
+        # Endpoint chưa có mẫu latency được coi như nhanh nhất để được thử
+        default_latency = min((e.latency for e in self.endpoints if e.latency is not None), default=1.0)
+        return min(available, key=lambda e: e.score(default_latency))
+
+    async def _acquire(self, exclude: List[str]) -> Optional[Endpoint]:
+        while True:
+            endpoint = self.select(exclude)
+            if endpoint is not None:
+                endpoint.outstanding += 1
+                LLM_BACKEND_OUTSTANDING.labels(backend=endpoint.name).set(endpoint.outstanding)
+                return endpoint
+            if all(e.name in exclude for e in self.endpoints):
+                return None
+
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Đã được đánh thức nhưng bị cancel → nhường lượt cho waiter kế tiếp
+                    self._wake()
+                else:
+                    try:
+                        self._waiters.remove(waiter)
+                    except ValueError:
+                        pass
+                raise
+
+    def _release(self, endpoint: Endpoint) -> None:
+        endpoint.outstanding -= 1
+        LLM_BACKEND_OUTSTANDING.labels(backend=endpoint.name).set(endpoint.outstanding)
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    async def ainvoke(self, prompt):
+        tried: List[str] = []
+        last_error: Optional[Exception] = None
+
+        for attempt in range(self.max_attempts):
+            endpoint = await self._acquire(tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint.name)
+
+            started = time.perf_counter()
+            try:
+                response = await endpoint.client.ainvoke(prompt)
+            except asyncio.CancelledError:
+                # Bị cancel (deadline / hedge thua) không tính là lỗi của backend
+                LLM_BACKEND_REQUESTS.labels(backend=endpoint.name, status="cancelled").inc()
+                raise
+            except Exception as e:
+                endpoint.on_failure()
+                LLM_BACKEND_REQUESTS.labels(backend=endpoint.name, status="error").inc()
+                last_error = e
+                if not should_failover(e):
+                    raise
+                if attempt + 1 < self.max_attempts:
+                    LLM_FAILOVERS.labels(from_backend=endpoint.name).inc()
+                    logger.warning(f"LLM backend {endpoint.name} failed, failing over: {e}")
+                continue
+            finally:
+                self._release(endpoint)
+
+            latency = time.perf_counter() - started
+            endpoint.on_success(latency)
+            LLM_BACKEND_REQUESTS.labels(backend=endpoint.name, status="ok").inc()
+            LLM_BACKEND_LATENCY.labels(backend=endpoint.name).observe(latency)
+
+            metadata = getattr(response, "response_metadata", None)
+            if isinstance(metadata, dict):
+                metadata["backend"] = endpoint.name
+                metadata["model"] = endpoint.model
+            return response
+
+        raise last_error or RuntimeError("No LLM endpoint available")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_attempts": self.max_attempts,
+            "waiting": len(self._waiters),
+            "endpoints": [e.stats() for e in self.endpoints],
+        }
+
+
+def load_endpoints(spec: str, default_client: Any) -> List[Endpoint]:
+    """
+    Parse LLM_ENDPOINTS (JSON list). Để trống → một endpoint 'default' dùng client có sẵn.
+    API key lấy từ 'api_key', biến môi trường 'api_key_env', hoặc OPENAI_API_KEY
+    """
+    if not spec.strip():
+        return [Endpoint("default", default_client, LLM_MODEL)]
+
+    endpoints = []
+    for item in json.loads(spec):
+        model = item.get("model", LLM_MODEL)
+        api_key = item.get("api_key") or os.getenv(item.get("api_key_env", ""), "") or OPENAI_API_KEY
+        client = ChatOpenAI(
+            model=model,
+            temperature=0,
+            base_url=item["base_url"],
+            api_key=api_key,
+            max_retries=int(item.get("max_retries", 0)),  # router tự failover
+            timeout=float(item.get("timeout", OPENAI_TIMEOUT)),
+            max_tokens=OPENAI_MAX_TOKENS,
+            streaming=False,
+            http_client=http_pool.sync_client,
+            http_async_client=http_pool.async_client,
+        )
+        endpoints.append(Endpoint(
+            item["name"],
+            client,
+            model,
+            weight=float(item.get("weight", 1.0)),
+            max_concurrency=int(item.get("max_concurrency", 0)),
+        ))
+    return endpoints
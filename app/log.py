@@ -0,0 +1,140 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from typing import Any, Dict, Optional
+
+import orjson
+
+from app.config import LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_SAMPLE_RATE, LOG_SAMPLE_RATES
+from app.metrics import LOG_RECORDS
+
+# Format text giữ nguyên như trước (fields có cấu trúc chỉ xuất hiện trong JSON)
+_TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_SAMPLED_OUT = LOG_RECORDS.labels(outcome="sampled_out")
+_QUEUE_FULL = LOG_RECORDS.labels(outcome="queue_full")
+
+
+def _parse_rates(spec: str) -> Dict[str, float]:
+    """"cache.hit=0.001,request.completed=0.01" → {event: rate}"""
+    rates = {}
+    for item in spec.split(","):
+        event, _, rate = item.partition("=")
+        if event.strip() and rate.strip():
+            rates[event.strip()] = float(rate)
+    return rates
+
+
+_EVENT_RATES = _parse_rates(LOG_SAMPLE_RATES)
+
+
+class JsonFormatter(logging.Formatter):
+    """Một dòng JSON / record: ts, level, logger, msg, event + fields có cấu trúc"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        event = getattr(record, "event", None)
+        if event:
+            entry["event"] = event
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode()
+
+
+class _AsyncQueueHandler(logging.handlers.QueueHandler):
+    """
+    Đưa record nguyên trạng vào queue: format (getMessage, JSON) chạy ở listener thread,
+    không trên request path. Queue đầy → bỏ record, không block event loop
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _QUEUE_FULL.inc()
+
+
+class _LogPipeline:
+    """Root logger → QueueHandler → QueueListener thread → stdout handler"""
+
+    def __init__(self):
+        self.handler: Optional[_AsyncQueueHandler] = None
+        self.listener: Optional[logging.handlers.QueueListener] = None
+        self.output: Optional[logging.Handler] = None
+
+    def install(self, level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> None:
+        self.output = logging.StreamHandler(sys.stdout)
+        self.output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(_TEXT_FORMAT))
+        self.handler = _AsyncQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(level.upper())
+        self._start_listener()
+        atexit.register(self.stop)
+        # gunicorn preload_app: thread listener không sống qua fork, worker cần listener + queue mới
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _start_listener(self) -> None:
+        self.listener = logging.handlers.QueueListener(self.handler.queue, self.output, respect_handler_level=True)
+        self.listener.start()
+
+    def _after_fork(self) -> None:
+        self.handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+        self._start_listener()
+
+    def stop(self) -> None:
+        """Ghi nốt record còn trong queue"""
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+
+_pipeline = _LogPipeline()
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> None:
+    """Cấu hình root logger (một lần / process): JSON hoặc text, ghi qua queue + thread riêng"""
+    if _pipeline.handler is None:
+        _pipeline.install(level, fmt)
+
+
+def log_event(
+    logger: logging.Logger,
+    event: str,
+    msg: str,
+    *args: Any,
+    level: int = logging.INFO,
+    **fields: Any
+) -> None:
+    """
+    Log một event có cấu trúc cho hot path. Format lazy (msg % args chỉ chạy khi record được ghi),
+    INFO / DEBUG được sample theo event (LOG_SAMPLE_RATES, mặc định LOG_SAMPLE_RATE);
+    WARNING trở lên luôn ghi. Record được sample có field sample_rate để scale lại khi đếm
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if level < logging.WARNING:
+        rate = _EVENT_RATES.get(event, LOG_SAMPLE_RATE)
+        if rate < 1.0:
+            if random.random() >= rate:
+                _SAMPLED_OUT.inc()
+                return
+            fields["sample_rate"] = rate
+    logger.log(level, msg, *args, extra={"event": event, "fields": fields})
@@ -4,12 +4,10 @@ from app.state import AgentState
 from app.nodes.merge_text import merge_text
 from app.nodes.analyze_with_llm import analyze_with_llm
 from app.nodes.format_output import format_output
+from app.log import setup_logging
 
 # Cấu hình logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+setup_logging()
 
 logger = logging.getLogger(__name__)
 
@@ -0,0 +1,147 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Prometheus metrics
+REQUEST_COUNT = Counter('sentiment_requests_total', 'Total sentiment analysis requests', ['method', 'endpoint', 'status'])
+REQUEST_DURATION = Histogram('sentiment_request_duration_seconds', 'Request duration in seconds')
+CACHE_HITS = Counter('sentiment_cache_hits_total', 'Total cache hits')
+CACHE_MISSES = Counter('sentiment_cache_misses_total', 'Total cache misses')
+SHORT_CIRCUITS = Counter('sentiment_short_circuit_total', 'Requests answered before cache / scheduler / LLM', ['reason'])
+
+# Per-stage latency (db, cache, llm, ...)
+STAGE_LATENCY = Histogram(
+    'sentiment_stage_duration_seconds',
+    'Latency of individual processing stages in seconds',
+    ['stage'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+STAGE_ERRORS = Counter('sentiment_stage_errors_total', 'Errors of individual processing stages', ['stage', 'error'])
+
+# Work bị cancel / bỏ dở vì hết deadline hoặc client ngắt kết nối
+CANCELLED_WORK = Counter('sentiment_cancelled_work_total', 'Work cancelled because of deadlines or disconnects', ['stage', 'reason'])
+
+# Result store (MongoDB sink / L3 cache)
+RESULT_STORE_WRITES = Counter('sentiment_result_store_writes_total', 'Result records flushed to MongoDB', ['status'])
+RESULT_STORE_DROPPED = Counter('sentiment_result_store_dropped_total', 'Result records dropped', ['reason'])
+RESULT_STORE_BUFFERED = Gauge('sentiment_result_store_buffered', 'Result records waiting to be flushed')
+RESULT_STORE_LOOKUPS = Counter('sentiment_result_store_lookups_total', 'L3 result store lookups', ['result'])
+
+# Rate limiting
+RATE_LIMIT_DECISIONS = Counter('sentiment_rate_limit_decisions_total', 'Rate limit decisions', ['result', 'source'])
+RATE_LIMIT_REJECTIONS = Counter('sentiment_rate_limit_rejections_total', 'Requests rejected by the rate limiter', ['key_type'])
+RATE_LIMIT_REMAINING = Histogram(
+    'sentiment_rate_limit_remaining_ratio',
+    'Remaining token budget (fraction of bucket capacity) observed on shared bucket checks',
+    ['key_type'],
+    buckets=(0.0, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+)
+
+# Request scheduler
+SCHEDULER_QUEUE_DEPTH = Gauge('sentiment_scheduler_queue_depth', 'Requests waiting for a processing slot', ['lane'])
+SCHEDULER_WAIT = Histogram(
+    'sentiment_scheduler_wait_seconds',
+    'Time spent waiting for a processing slot',
+    ['lane'],
+    buckets=(0.0, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+SCHEDULER_SHED = Counter('sentiment_scheduler_shed_total', 'Requests rejected early by load shedding', ['lane', 'reason'])
+
+# LLM hedging
+LLM_CALLS = Counter('sentiment_llm_calls_total', 'LLM calls sent', ['role'])
+LLM_HEDGE_WINS = Counter('sentiment_llm_hedge_wins_total', 'Winner of hedged LLM calls', ['winner'])
+LLM_HEDGE_SKIPPED = Counter('sentiment_llm_hedge_skipped_total', 'Hedges not sent', ['reason'])
+LLM_HEDGE_DELAY = Gauge('sentiment_llm_hedge_delay_seconds', 'Current adaptive hedge delay')
+
+# LLM router (per-backend)
+LLM_BACKEND_REQUESTS = Counter('sentiment_llm_backend_requests_total', 'LLM requests per backend', ['backend', 'status'])
+LLM_BACKEND_LATENCY = Histogram(
+    'sentiment_llm_backend_duration_seconds',
+    'LLM call latency per backend',
+    ['backend'],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 20.0, 30.0)
+)
+LLM_BACKEND_OUTSTANDING = Gauge('sentiment_llm_backend_outstanding', 'In-flight LLM requests per backend', ['backend'])
+LLM_BACKEND_HEALTHY = Gauge('sentiment_llm_backend_healthy', 'Whether the backend is currently routable (1/0)', ['backend'])
+LLM_FAILOVERS = Counter('sentiment_llm_failovers_total', 'LLM requests retried on another backend', ['from_backend'])
+
+# LLM HTTP connection pool
+LLM_HTTP_REQUESTS = Counter(
+    'sentiment_llm_http_requests_total',
+    'LLM HTTP requests by connection reuse',
+    ['client', 'connection', 'http_version']
+)
+LLM_HTTP_CONNECT_TIME = Histogram(
+    'sentiment_llm_http_connect_seconds',
+    'TCP + TLS handshake time of new LLM connections',
+    ['client'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+# Single-flight: request trùng nội dung đang xử lý dùng chung một LLM call
+SINGLE_FLIGHT = Counter('sentiment_single_flight_total', 'Analyses started (leader) or joined (follower)', ['role'])
+
+# Cache namespace migration (đổi prompt / model)
+CACHE_PREVIOUS_NAMESPACE_HITS = Counter(
+    'sentiment_cache_previous_namespace_hits_total',
+    'Cache hits served from the previous prompt/model namespace'
+)
+CACHE_RESCORES = Counter('sentiment_cache_rescores_total', 'Background re-scores into the new namespace', ['status'])
+CACHE_RESCORE_PENDING = Gauge('sentiment_cache_rescore_pending', 'Old-namespace keys waiting to be re-scored')
+
+# XFetch early refresh cho key hot
+CACHE_EARLY_REFRESHES = Counter('sentiment_cache_early_refreshes_total', 'XFetch early refreshes of hot keys', ['status'])
+
+# Cache value codec
+CACHE_DECODE_ERRORS = Counter('sentiment_cache_decode_errors_total', 'Cache values that could not be decoded (treated as miss)')
+
+# Alert priority (ước tính trước LLM vs log_level thật)
+ALERT_ESTIMATES = Counter('sentiment_alert_estimates_total', 'Pre-LLM alert estimates', ['level', 'priority'])
+ALERT_OUTCOMES = Counter(
+    'sentiment_alert_outcomes_total',
+    'Estimated priority vs actual log_level',
+    ['priority', 'log_level']
+)
+TIME_TO_ALERT = Histogram(
+    'sentiment_time_to_alert_seconds',
+    'Time from request arrival to result for items with log_level >= 2',
+    ['log_level', 'priority'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 20.0, 30.0, 60.0)
+)
+
+# Alert fan-out (Redis Stream / webhook)
+ALERT_EVENTS = Counter('sentiment_alert_events_total', 'Alert events by sink and outcome', ['sink', 'status'])
+ALERT_EVENTS_BUFFERED = Gauge('sentiment_alert_events_buffered', 'Alert events waiting to be sent', ['sink'])
+ALERT_PUBLISH_LATENCY = Histogram(
+    'sentiment_alert_publish_seconds',
+    'Time from result to alert event acknowledged by the sink',
+    ['sink'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+# Topic reverse index (/topics/match)
+TOPIC_INDEX_BUILD_SECONDS = Gauge('sentiment_topic_index_build_seconds', 'Time to build the topic keyword automaton')
+TOPIC_INDEX_KEYWORDS = Gauge('sentiment_topic_index_keywords', 'Distinct keywords in the topic keyword automaton')
+TOPIC_MATCHES = Histogram(
+    'sentiment_topic_matches',
+    'Topics matched per post by /topics/match',
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+
+# Langfuse tracing (sampling + batched export)
+TRACES = Counter('sentiment_traces_total', 'Traces by sampling / export outcome', ['status'])
+TRACE_SPANS_DROPPED = Counter('sentiment_trace_spans_dropped_total', 'Trace spans / fields dropped instead of exported', ['reason'])
+TRACE_BUFFERED = Gauge('sentiment_traces_buffered', 'Sampled traces waiting for export')
+
+# Logging (sampled hot-path events, queue handler)
+LOG_RECORDS = Counter('sentiment_log_records_total', 'Log records not written', ['outcome'])
+
+# Event loop lag / blocking (profiling)
+EVENT_LOOP_LAG = Histogram(
+    'sentiment_event_loop_lag_seconds',
+    'Delay of the loop lag heartbeat beyond its sleep interval',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+EVENT_LOOP_BLOCKED = Counter(
+    'sentiment_event_loop_blocked_total',
+    'Times the event loop was blocked longer than LOOP_LAG_THRESHOLD, by innermost app frame',
+    ['site']
+)
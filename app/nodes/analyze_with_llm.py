@@ -1,9 +1,12 @@
 import json
 import logging
 import re
+import time
 from app.llm import llm
 from app.prompts import TARGETED_ANALYSIS_PROMPT
 from app.constants import COMMENT_TYPES
+from app.log import log_event
+from app.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
@@ -26,22 +29,11 @@ def check_keyword_mention(text: str, main_keywords: list) -> bool:
         
         # Check exact match và partial match
         if keyword_lower in text_lower:
-            logger.info(f"Found mention of keyword: '{keyword}' in text")
+            logger.debug("Found mention of keyword: '%s' in text", keyword)
             return True
     
     return False
 
-def get_invoke_config():
-    """
-    Trả về config cho llm.invoke nếu langfuse_handler khả dụng.
-    Nếu không, trả về {} để tránh NameError.
-    """
-    try:
-        from app.langfuse import langfuse_handler  # noqa: WPS433 (dynamic import)
-        return {"callbacks": [langfuse_handler]}
-    except Exception:
-        return {}
-
 def analyze_with_llm(state):
     """
     Sử dụng LLM để xác định targeted và phân tích sentiment với logic mới:
@@ -58,7 +50,7 @@ def analyze_with_llm(state):
         
         # Nếu không có main_keywords, trả về targeted = False
         if not main_keywords:
-            logger.info("Không có main_keywords, targeted = False")
+            logger.debug("Không có main_keywords, targeted = False")
             return {**state, "llm_analysis": {
                 "sentiment": "neutral",
                 "targeted": False,
@@ -76,18 +68,18 @@ def analyze_with_llm(state):
         if post_type in comment_types and content:
             # Comment type + có content → chỉ check content
             text_to_check = content
-            logger.info(f"Comment type với content, check mention trong content: {len(content)} ký tự")
+            logger.debug("Comment type với content, check mention trong content: %d ký tự", len(content))
         else:
             # Các type khác → check merged text
             text_to_check = merged_text
-            logger.info(f"Non-comment type hoặc không có content, check mention trong merged text: {len(merged_text)} ký tự")
+            logger.debug("Non-comment type hoặc không có content, check mention trong merged text: %d ký tự", len(merged_text))
         
         # Check mention keyword trước khi gọi LLM
         has_mention = check_keyword_mention(text_to_check, main_keywords)
         
         if not has_mention:
             # Không mention → trả về neutral ngay, không cần gọi LLM
-            logger.info(f"Không có mention main keywords trong text, trả về neutral")
+            logger.debug("Không có mention main keywords trong text, trả về neutral")
             return {**state, "llm_analysis": {
                 "sentiment": "neutral",
                 "targeted": False,
@@ -98,7 +90,7 @@ def analyze_with_llm(state):
             }}
         
         # Có mention → gọi LLM để đánh sentiment
-        logger.info(f"Có mention main keywords, tiến hành phân tích sentiment với LLM")
+        logger.debug("Có mention main keywords, tiến hành phân tích sentiment với LLM")
         prompt = TARGETED_ANALYSIS_PROMPT.format(
             main_keywords=", ".join(main_keywords),
             text=merged_text,  # Vẫn dùng merged_text cho LLM để có context đầy đủ
@@ -106,8 +98,9 @@ def analyze_with_llm(state):
         )
         
         # Gọi LLM
-        config = get_invoke_config()
-        response = llm.invoke(prompt, config=config)
+        started = time.time()
+        response = llm.invoke(prompt)
+        tracer.span("llm", started)
         analysis_result = parse_llm_response(response.content)
         
         # Đảm bảo targeted = True vì đã check mention
@@ -117,9 +110,12 @@ def analyze_with_llm(state):
         # Nếu sentiment là neutral, không trả về keywords
         if analysis_result.get("sentiment") == "neutral":
             analysis_result["keywords"] = {"positive": [], "negative": []}
-            logger.info("Sentiment neutral, xóa keywords")
+            logger.debug("Sentiment neutral, xóa keywords")
         
-        logger.info(f"LLM analysis completed - targeted: True, sentiment: {analysis_result.get('sentiment')}, type: {post_type}")
+        log_event(
+            logger, "llm.completed", "LLM analysis completed - targeted: True, sentiment: %s, type: %s",
+            analysis_result.get("sentiment"), post_type, sentiment=analysis_result.get("sentiment"), type=post_type
+        )
         
         return {**state, "llm_analysis": analysis_result}
         
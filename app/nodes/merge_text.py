@@ -1,5 +1,6 @@
 import logging
 from app.constants import COMMENT_TYPES
+from app.text_merge import merge_sentences, sentence_spans
 
 logger = logging.getLogger(__name__)
 
@@ -11,6 +12,8 @@ def merge_text(state):
     - Comment types + có content: analyze_with_llm sẽ check mention trong content trước
     - Các type khác: analyze_with_llm sẽ check mention trong merged_text
     - Merged_text vẫn được tạo để cung cấp context đầy đủ cho LLM
+    - Các type khác dùng cùng merger với API (bỏ câu trùng) nên merged_text / cache key giống nhau;
+      merged_sentences là offsets câu trong merged_text
     """
     try:
         input_data = state["input_data"]
@@ -37,15 +40,16 @@ def merge_text(state):
             else:
                 # Nếu không có content, dùng title và description
                 text_parts = [part for part in [title, description] if part]
+            merged = sentence_spans(" ".join(text_parts))
         else:
-            # Với các type khác: gộp bình thường
-            text_parts = [part for part in [title, content, description] if part]
+            # Với các type khác: gộp + bỏ câu trùng trong một lượt (giống SentimentAnalysisService)
+            merged = merge_sentences(title, content, description)
         
-        merged_text = " ".join(text_parts)
+        merged_text = merged.text
         
-        logger.info(f"Đã gộp text (type={post_type}): {len(merged_text)} ký tự")
+        logger.debug("Đã gộp text (type=%s): %d ký tự, %d câu", post_type, len(merged_text), len(merged.sentences))
         
-        return {**state, "merged_text": merged_text}
+        return {**state, "merged_text": merged_text, "merged_sentences": list(merged.sentences)}
         
     except Exception as e:
         logger.error(f"Lỗi khi merge text: {str(e)}")
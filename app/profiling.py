@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.config import (
+    PROFILE_MAX_SECONDS,
+    PROFILE_INTERVAL,
+    LOOP_LAG_MONITOR_ENABLED,
+    LOOP_LAG_INTERVAL,
+    LOOP_LAG_THRESHOLD,
+)
+from app.metrics import EVENT_LOOP_LAG, EVENT_LOOP_BLOCKED
+from app.log import log_event
+
+logger = logging.getLogger(__name__)
+
+# Frame trong package app/ dùng để đặt tên "site" của một lần block (label metric)
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_MAX_DEPTH = 128
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(_APP_DIR):
+        filename = "app" + filename[len(_APP_DIR):]
+    else:
+        filename = os.path.basename(filename)
+    # ";" là separator của collapsed stacks
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _stack(frame) -> Tuple[str, ...]:
+    """Stack root → leaf của một thread"""
+    labels = []
+    while frame is not None and len(labels) < _MAX_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return tuple(labels)
+
+
+def _app_site(frame) -> str:
+    """Frame sâu nhất nằm trong app/ (vd. app/cache.py:get), 'other' nếu không có"""
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename.startswith(_APP_DIR):
+            return f"app{code.co_filename[len(_APP_DIR):]}:{code.co_name}"
+        frame = frame.f_back
+    return "other"
+
+
+class ProfileBusy(Exception):
+    """Đang có một profile khác chạy trong worker"""
+
+
+class StackProfile:
+    """Kết quả sampling: stack (tuple frame labels, root → leaf) → số sample"""
+
+    def __init__(self, stacks: Counter, samples: int, seconds: float, interval: float):
+        self.stacks = stacks
+        self.samples = samples
+        self.seconds = seconds
+        self.interval = interval
+
+    def collapsed(self) -> str:
+        """Brendan Gregg collapsed format (flamegraph.pl, speedscope, inferno)"""
+        return "\n".join(
+            f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()
+        ) + "\n"
+
+    def speedscope(self, name: str = "sentiment-api") -> Dict[str, Any]:
+        """File format speedscope (https://www.speedscope.app/file-format-schema.json), profile kiểu sampled"""
+        frame_index: Dict[str, int] = {}
+        frames: List[Dict[str, str]] = []
+        samples: List[List[int]] = []
+        weights: List[float] = []
+        for stack, count in self.stacks.items():
+            indexes = []
+            for label in stack:
+                index = frame_index.get(label)
+                if index is None:
+                    index = frame_index[label] = len(frames)
+                    frames.append({"name": label})
+                indexes.append(index)
+            samples.append(indexes)
+            weights.append(round(count * self.interval, 6))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "sentiment-api",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": f"{name} pid={os.getpid()}",
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 6),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+
+class StackSampler:
+    """
+    Statistical profiler: thread riêng đọc sys._current_frames() mỗi `interval` giây và đếm stack
+    của các thread khác. Không cần tracing hook (sys.setprofile), chi phí tỉ lệ với tần số sample.
+    Mỗi worker chỉ chạy một profile tại một thời điểm
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def capture(self, seconds: float, interval: float = PROFILE_INTERVAL, thread_ids: Optional[set] = None) -> StackProfile:
+        """Chạy blocking trong thread gọi (endpoint dùng asyncio.to_thread)"""
+        if not self._lock.acquire(blocking=False):
+            raise ProfileBusy("A profile is already running in this worker")
+        try:
+            seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+            interval = max(interval, 0.001)
+            me = threading.get_ident()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks: Counter = Counter()
+            samples = 0
+            started = time.perf_counter()
+            deadline = started + seconds
+            next_sample = started
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == me or (thread_ids and thread_id not in thread_ids):
+                        continue
+                    name = names.get(thread_id)
+                    if name is None:
+                        names = {thread.ident: thread.name for thread in threading.enumerate()}
+                        name = names.get(thread_id, str(thread_id))
+                    stacks[(f"thread {name}",) + _stack(frame)] += 1
+                samples += 1
+                next_sample += interval
+                delay = next_sample - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # Sample chậm hơn interval (nhiều thread / stack sâu): không dồn sample bù
+                    next_sample = time.perf_counter()
+            return StackProfile(stacks, samples, time.perf_counter() - started, interval)
+        finally:
+            self._lock.release()
+
+
+class LoopLagMonitor:
+    """
+    Đo event loop lag: coroutine heartbeat ngủ `interval`, độ trễ thực tế so với interval là lag
+    (histogram). Watchdog thread thấy heartbeat trễ quá `threshold` → loop đang bị block: chụp stack
+    của loop thread ngay lúc đó (vd. call Redis sync trong CacheService), đếm metric theo site
+    và giữ các stack gần nhất cho /admin/loop-lag
+    """
+
+    def __init__(
+        self,
+        enabled: bool = LOOP_LAG_MONITOR_ENABLED,
+        interval: float = LOOP_LAG_INTERVAL,
+        threshold: float = LOOP_LAG_THRESHOLD
+    ):
+        self.enabled = enabled
+        self.interval = interval
+        self.threshold = threshold
+        self.blocks: Deque[Dict[str, Any]] = deque(maxlen=50)
+        self.max_lag = 0.0
+        self._heartbeat = 0.0
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._closing = threading.Event()
+
+    async def start(self) -> None:
+        if not self.enabled or self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.perf_counter()
+        self._closing.clear()
+        self._task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"Event loop lag monitor started: interval={self.interval}s, threshold={self.threshold}s")
+
+    async def stop(self) -> None:
+        self._closing.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join, 1.0)
+            self._watchdog = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(now - expected, 0.0)
+            self._heartbeat = now
+            EVENT_LOOP_LAG.observe(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+
+    def _watch(self) -> None:
+        """Thread: phát hiện loop bị block trong lúc đang block (stack còn chỉ đúng thủ phạm)"""
+        reported = 0.0
+        while not self._closing.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            stalled = time.perf_counter() - heartbeat - self.interval
+            if stalled < self.threshold or heartbeat == reported:
+                continue
+            # Mỗi lần block chỉ ghi một lần (heartbeat chưa đổi)
+            reported = heartbeat
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            site = _app_site(frame)
+            EVENT_LOOP_BLOCKED.labels(site=site).inc()
+            self.blocks.append({
+                "ts": round(time.time(), 3),
+                "stalled_seconds": round(stalled, 4),
+                "site": site,
+                "stack": list(_stack(frame)),
+            })
+            log_event(
+                logger, "loop.blocked", "Event loop blocked %.3fs at %s",
+                stalled, site, level=logging.WARNING, site=site, seconds=round(stalled, 4)
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "running": self._task is not None and not self._task.done(),
+            "interval": self.interval,
+            "threshold": self.threshold,
+            "max_lag_seconds": round(self.max_lag, 4),
+            "recent_blocks": list(self.blocks)[::-1],
+        }
+
+
+# Global profiler / loop lag monitor instances
+stack_sampler = StackSampler()
+loop_lag_monitor = LoopLagMonitor()
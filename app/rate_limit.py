@@ -0,0 +1,355 @@
+import hashlib
+import ipaddress
+import logging
+import math
+import re
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Tuple
+
+from fastapi import HTTPException, Request
+
+from app.config import (
+    REDIS_URL,
+    RATE_LIMIT,
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_LEASE_MAX,
+    RATE_LIMIT_LEASE_TTL,
+    PRIORITY_API_KEYS,
+    SCHEDULER_TENANT_WEIGHTS,
+    TRUSTED_PROXIES,
+)
+from app.metrics import RATE_LIMIT_DECISIONS, RATE_LIMIT_REJECTIONS, RATE_LIMIT_REMAINING
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+_PERIODS = {
+    "second": 1, "sec": 1, "s": 1,
+    "minute": 60, "min": 60, "m": 60,
+    "hour": 3600, "h": 3600,
+    "day": 86400, "d": 86400,
+}
+
+# Token bucket atomic: refill theo thời gian Redis (TIME), cộng lại `refund` tokens (phần lease cũ chưa dùng)
+# rồi cấp tối đa `requested` tokens.
+# Trả về {granted, tokens còn lại} - tokens là string vì Lua number bị truncate khi trả về
+TOKEN_BUCKET_LUA = """
+local key = KEYS[1]
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+local refund = tonumber(ARGV[5]) or 0
+
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local state = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+    tokens = capacity
+    ts = now
+end
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate + refund)
+local granted = math.min(requested, math.floor(tokens))
+tokens = tokens - granted
+
+redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', key, ttl)
+return {granted, tostring(tokens)}
+"""
+
+
+def parse_rate(rate: str) -> Tuple[int, int]:
+    """Parse '100/minute' hoặc '100 per minute' → (limit, period_seconds)"""
+    match = re.match(r"^\s*(\d+)\s*(?:/|per)\s*(\d*)\s*([a-zA-Z]+)\s*$", rate)
+    if not match:
+        raise ValueError(f"Invalid rate limit: {rate}")
+    limit, multiplier, unit = match.groups()
+    unit = unit.lower()
+    if unit not in _PERIODS and unit.endswith("s"):
+        unit = unit[:-1]
+    if unit not in _PERIODS:
+        raise ValueError(f"Invalid rate limit period: {rate}")
+    return int(limit), _PERIODS[unit] * int(multiplier or 1)
+
+
+def parse_mapping(spec: str) -> Dict[str, str]:
+    """Parse 'a=b,c=d' → {'a': 'b', 'c': 'd'}"""
+    mapping = {}
+    for item in spec.split(","):
+        if "=" in item:
+            key, value = item.split("=", 1)
+            mapping[key.strip()] = value.strip()
+    return mapping
+
+
+def tenant_key(credential: str) -> str:
+    """
+    Tenant key cho một credential (API key hoặc client id), không đưa giá trị gốc vào Redis key / metrics.
+    Rate limiter, WFQ weights và priority lane đều dùng key này
+    """
+    return "key:" + hashlib.sha1(credential.encode()).hexdigest()[:16]
+
+
+# Tenant đã cấu hình (PRIORITY_API_KEYS / SCHEDULER_TENANT_WEIGHTS). Header khác do client tự đặt
+# nên không được dùng làm key: đổi giá trị mỗi request là có bucket mới / lượt WFQ mới
+_TENANT_KEYS = frozenset(
+    tenant_key(key)
+    for key in {**parse_mapping(PRIORITY_API_KEYS), **parse_mapping(SCHEDULER_TENANT_WEIGHTS)}
+)
+
+_TRUSTED_PROXIES = tuple(
+    ipaddress.ip_network(item.strip(), strict=False) for item in TRUSTED_PROXIES.split(",") if item.strip()
+)
+
+
+@lru_cache(maxsize=1024)
+def _is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in _TRUSTED_PROXIES)
+
+
+def client_key(request: Request) -> Tuple[str, str]:
+    """
+    Xác định client để rate limit: API key / client id đã cấu hình > IP thật của client
+    (X-Real-IP chỉ khi request đến từ nginx trong TRUSTED_PROXIES). Trả về (key, key_type)
+    """
+    api_key = request.headers.get("x-api-key")
+    if not api_key:
+        authorization = request.headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            api_key = authorization[7:].strip()
+    if api_key:
+        key = tenant_key(api_key)
+        if key in _TENANT_KEYS:
+            return key, "api_key"
+
+    client_id = request.headers.get("x-client-id")
+    if client_id:
+        key = tenant_key(client_id)
+        if key in _TENANT_KEYS:
+            return key, "client_id"
+
+    ip = request.client.host if request.client else "unknown"
+    if _is_trusted_proxy(ip):
+        ip = request.headers.get("x-real-ip") or ip
+    return "ip:" + ip, "ip"
+
+
+@dataclass
+class _Lease:
+    """Tokens đã lấy trước từ Redis cho một client trong worker này"""
+    tokens: int = 0
+    size: int = 1
+    expires_at: float = 0.0
+
+
+@dataclass
+class _LocalBucket:
+    """Token bucket trong memory, dùng khi Redis không khả dụng"""
+    tokens: float
+    updated_at: float
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("Rate limit exceeded")
+        self.retry_after = retry_after
+
+
+class TokenBucketLimiter:
+    """
+    Rate limiter dùng chung giữa các worker/container:
+    - Token bucket trong Redis, mỗi lần check là một Lua script atomic
+    - Client gửi nhiều request được cấp lease nhiều tokens một lần (local bucket),
+      nên không phải gọi Redis cho mỗi request; lease size tăng gấp đôi khi dùng hết
+      trước khi hết hạn, reset khi client nguội đi. Tokens của lease hết hạn mà chưa dùng (đã trừ
+      trong Redis lúc cấp) được trả lại bucket trong lần gọi Redis kế tiếp của client
+    - Fallback token bucket theo worker nếu Redis lỗi
+    """
+
+    def __init__(self, rate: str = RATE_LIMIT):
+        self.limit, self.period = parse_rate(rate)
+        self.capacity = RATE_LIMIT_BURST or self.limit
+        self.refill_rate = self.limit / self.period
+        self.key_ttl = max(int(math.ceil(self.capacity / self.refill_rate)) * 2, 1)
+        self._leases: Dict[str, _Lease] = {}
+        self._fallback: Dict[str, _LocalBucket] = {}
+        self._redis = None
+        self._script = None
+        self._redis_failed_at = 0.0
+
+    def _get_script(self):
+        if self._script is None and aioredis is not None:
+            self._redis = aioredis.from_url(REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+            self._script = self._redis.register_script(TOKEN_BUCKET_LUA)
+        return self._script
+
+    async def check(self, key: str, key_type: str = "ip") -> float:
+        """Tiêu thụ một token; trả về số tokens còn lại hoặc raise RateLimitExceeded"""
+        now = time.monotonic()
+        lease = self._leases.get(key)
+
+        if lease and lease.tokens > 0 and now < lease.expires_at:
+            lease.tokens -= 1
+            RATE_LIMIT_DECISIONS.labels(result="allowed", source="local").inc()
+            return float(lease.tokens)
+
+        refund = 0
+        if lease is None:
+            lease = _Lease()
+            self._leases[key] = lease
+            self._evict_leases(now)
+        elif lease.tokens > 0:
+            # Lease hết hạn khi còn tokens → trả lại phần chưa dùng, client nguội nên bắt đầu lại từ lease nhỏ
+            refund = lease.tokens
+            lease.tokens = 0
+            lease.size = 1
+        elif now < lease.expires_at:
+            lease.size = min(lease.size * 2, RATE_LIMIT_LEASE_MAX)
+
+        granted, remaining = await self._acquire(key, lease.size, refund)
+        RATE_LIMIT_REMAINING.labels(key_type=key_type).observe(remaining / self.capacity)
+
+        if granted <= 0:
+            lease.tokens = 0
+            lease.size = 1
+            RATE_LIMIT_DECISIONS.labels(result="rejected", source="redis").inc()
+            RATE_LIMIT_REJECTIONS.labels(key_type=key_type).inc()
+            raise RateLimitExceeded(retry_after=max((1 - remaining) / self.refill_rate, 0.001))
+
+        lease.tokens = granted - 1
+        lease.expires_at = now + RATE_LIMIT_LEASE_TTL
+        RATE_LIMIT_DECISIONS.labels(result="allowed", source="redis").inc()
+        return remaining + lease.tokens
+
+    async def check_many(self, key: str, count: int, key_type: str = "ip") -> float:
+        """
+        Tiêu thụ `count` tokens (batch): dùng lease local trước, phần còn lại lấy trong một lần gọi
+        Redis (Lua script với requested = count) thay vì một call / item
+        """
+        now = time.monotonic()
+        lease = self._leases.get(key)
+        if lease is None:
+            lease = _Lease()
+            self._leases[key] = lease
+            self._evict_leases(now)
+
+        refund = 0
+        if now < lease.expires_at:
+            local = min(lease.tokens, count)
+            lease.tokens -= local
+            count -= local
+        elif lease.tokens > 0:
+            refund = lease.tokens
+            lease.tokens = 0
+            lease.size = 1
+        if count <= 0:
+            RATE_LIMIT_DECISIONS.labels(result="allowed", source="local").inc()
+            return float(lease.tokens)
+
+        granted, remaining = await self._acquire(key, count, refund)
+        RATE_LIMIT_REMAINING.labels(key_type=key_type).observe(remaining / self.capacity)
+
+        if granted < count:
+            # Không đủ cho cả batch: tokens đã cấp giữ trong lease (trả lại bucket khi lease hết hạn)
+            lease.tokens += granted
+            lease.expires_at = now + RATE_LIMIT_LEASE_TTL
+            RATE_LIMIT_DECISIONS.labels(result="rejected", source="redis").inc()
+            RATE_LIMIT_REJECTIONS.labels(key_type=key_type).inc()
+            raise RateLimitExceeded(retry_after=max((count - granted - remaining) / self.refill_rate, 0.001))
+
+        RATE_LIMIT_DECISIONS.labels(result="allowed", source="redis").inc()
+        return remaining + lease.tokens
+
+    async def _acquire(self, key: str, requested: int, refund: int = 0) -> Tuple[int, float]:
+        # Sau khi Redis lỗi, dùng fallback một lúc rồi mới thử lại
+        if time.monotonic() - self._redis_failed_at > 5.0:
+            try:
+                script = self._get_script()
+                if script is not None:
+                    granted, remaining = await script(
+                        keys=[f"ratelimit:{key}"],
+                        args=[self.capacity, self.refill_rate, requested, self.key_ttl, refund],
+                    )
+                    return int(granted), float(remaining)
+            except Exception as e:
+                logger.warning(f"Redis rate limiter unavailable, using local fallback: {e}")
+                self._redis_failed_at = time.monotonic()
+        return self._acquire_local(key, requested, refund)
+
+    def _acquire_local(self, key: str, requested: int, refund: int = 0) -> Tuple[int, float]:
+        now = time.monotonic()
+        bucket = self._fallback.get(key)
+        if bucket is None:
+            bucket = self._fallback[key] = _LocalBucket(tokens=self.capacity, updated_at=now)
+        bucket.tokens = min(self.capacity, bucket.tokens + (now - bucket.updated_at) * self.refill_rate + refund)
+        bucket.updated_at = now
+        granted = min(requested, int(bucket.tokens))
+        bucket.tokens -= granted
+        return granted, bucket.tokens
+
+    def _evict_leases(self, now: float) -> None:
+        """Giới hạn số lease giữ trong memory"""
+        if len(self._leases) <= 10000:
+            return
+        for lease_key in [k for k, v in self._leases.items() if v.expires_at < now]:
+            del self._leases[lease_key]
+        if len(self._fallback) > 10000:
+            self._fallback.clear()
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+            self._script = None
+
+
+# Global limiter instance
+limiter = TokenBucketLimiter()
+
+
+def _rate_limit_error(e: RateLimitExceeded) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=f"Rate limit exceeded: {RATE_LIMIT}",
+        headers={"Retry-After": str(max(1, int(math.ceil(e.retry_after))))},
+    )
+
+
+async def rate_limit(request: Request) -> None:
+    """FastAPI dependency cho các endpoint cần rate limit"""
+    if not RATE_LIMIT_ENABLED:
+        return
+    key, key_type = client_key(request)
+    try:
+        await limiter.check(key, key_type)
+    except RateLimitExceeded as e:
+        raise _rate_limit_error(e)
+
+
+async def rate_limit_items(request: Request, count: int) -> None:
+    """
+    Batch endpoint: mỗi item tính như một request (dependency rate_limit đã trừ token đầu),
+    count - 1 tokens còn lại lấy trong một lần gọi Redis
+    """
+    if not RATE_LIMIT_ENABLED or count <= 1:
+        return
+    key, key_type = client_key(request)
+    try:
+        await limiter.check_many(key, count - 1, key_type)
+    except RateLimitExceeded as e:
+        raise _rate_limit_error(e)
@@ -0,0 +1,331 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError, NetworkTimeout, PyMongoError
+
+from app.config import (
+    RESULT_STORE_ENABLED,
+    RESULT_STORE_COLLECTION,
+    RESULT_STORE_OCCURRENCE_COLLECTION,
+    RESULT_STORE_BATCH_SIZE,
+    RESULT_STORE_FLUSH_INTERVAL,
+    RESULT_STORE_MAX_BUFFER,
+    RESULT_STORE_MAX_RETRIES,
+    RESULT_STORE_LOOKUP_TIMEOUT,
+)
+from app.db import async_mongo
+from app.deadline import Deadline
+from app.metrics import (
+    RESULT_STORE_WRITES,
+    RESULT_STORE_DROPPED,
+    RESULT_STORE_BUFFERED,
+    RESULT_STORE_LOOKUPS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Lỗi mạng / failover có thể retry
+TRANSIENT_ERRORS = (AutoReconnect, NetworkTimeout)
+
+def record_key(content_hash: str, model: str, prompt_version: str) -> str:
+    """_id của record: mỗi (content hash, model, prompt version) một document, giữ lịch sử khi đổi prompt / model"""
+    return f"{content_hash}:{model}:{prompt_version}"
+
+
+# Key trong buffer: (kind, id). ANALYSIS = kết quả dedupe theo content hash (L3 cache),
+# OCCURRENCE = một post (id, index) đã nhận kết quả nào
+ANALYSIS = "analysis"
+OCCURRENCE = "occurrence"
+
+
+# Write error codes có thể retry trong BulkWriteError (duplicate key khi upsert song song, ...)
+_RETRYABLE_WRITE_CODES = {11000, 91, 189, 11600, 11602, 10107, 13435, 13436}
+
+
+class ResultStore:
+    """
+    Optional MongoDB sink cho kết quả phân tích:
+    - submit() không block: đưa record vào buffer có giới hạn (drop khi đầy)
+    - Background task flush bằng bulk_write(ordered=False) upserts theo size/time trigger
+    - lookup() dùng collection như L3 cache lâu dài theo content hash + model + prompt version
+    - record_occurrence() ghi mỗi post (id, index) vào collection riêng, kể cả khi kết quả lấy từ cache
+      (nhiều post cùng text dùng chung một analysis nhưng mỗi post có record của mình)
+    """
+
+    def __init__(self, enabled: bool = RESULT_STORE_ENABLED):
+        self.enabled = enabled
+        self._buffer: "OrderedDict[Tuple[str, Any], Dict[str, Any]]" = OrderedDict()
+        self._flush_event: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._closing = False
+
+    @property
+    def collection(self):
+        return async_mongo.collection(RESULT_STORE_COLLECTION)
+
+    @property
+    def occurrences(self):
+        return async_mongo.collection(RESULT_STORE_OCCURRENCE_COLLECTION)
+
+    async def start(self) -> None:
+        if not self.enabled or (self._task and not self._task.done()):
+            return
+        self._flush_event = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._closing = False
+        try:
+            await self.collection.create_index([("content_hash", 1), ("created_at", -1)])
+            await self.occurrences.create_index([("index", 1), ("updated_at", -1)])
+            await self.occurrences.create_index([("content_hash", 1)])
+        except Exception as e:
+            logger.warning(f"Result store index creation failed: {e}")
+        self._task = asyncio.create_task(self._run(), name="result-store-flush")
+        logger.info(f"Result store started: collection={RESULT_STORE_COLLECTION}, batch={RESULT_STORE_BATCH_SIZE}")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """
+        Dừng background task và flush phần còn lại trong buffer (gọi từ lifespan shutdown).
+        Không cancel giữa chừng: báo cho loop dừng, loop drain buffer (kể cả bulk_write đang chạy) rồi thoát
+        """
+        if self._task:
+            self._closing = True
+            self._flush_event.set()
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+            except asyncio.TimeoutError:
+                # Quá timeout: cancel, batch đang ghi được requeue và tính là mất bên dưới
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+            self._task = None
+        if self._buffer:
+            logger.error(f"Result store shutdown flush incomplete, {len(self._buffer)} records lost")
+            RESULT_STORE_DROPPED.labels(reason="shutdown").inc(len(self._buffer))
+            self._buffer.clear()
+            RESULT_STORE_BUFFERED.set(0)
+
+    def submit(
+        self,
+        content_hash: str,
+        request: Any,
+        result: Dict[str, Any],
+        model: str,
+        prompt_version: str,
+        backend: Optional[str] = None,
+    ) -> bool:
+        """Đưa kết quả phân tích (dedupe theo content hash) vào buffer; trả về False nếu bị drop"""
+        return self._enqueue((ANALYSIS, record_key(content_hash, model, prompt_version)), {
+            "content_hash": content_hash,
+            "type": request.type,
+            "prompt_version": prompt_version,
+            "model": model,
+            "backend": backend,
+            "result": result,
+            "updated_at": datetime.now(timezone.utc),
+        })
+
+    def record_occurrence(
+        self,
+        request: Any,
+        content_hash: str,
+        namespace: str,
+        result: Dict[str, Any],
+        log_level: int,
+        source: str,
+    ) -> bool:
+        """
+        Ghi kết quả cuối của một post (id, index): một record / post, request sau của cùng post ghi đè.
+        source: analysis (LLM / result store) hoặc cache (Redis)
+        """
+        index = request.index or ""
+        return self._enqueue((OCCURRENCE, (index, request.id)), {
+            "id": request.id,
+            "index": index,
+            "type": request.type,
+            "content_hash": content_hash,
+            "namespace": namespace,
+            "source": source,
+            "sentiment": result.get("sentiment"),
+            "log_level": log_level,
+            "result": result,
+            "updated_at": datetime.now(timezone.utc),
+        })
+
+    def _enqueue(self, key: Tuple[str, Any], record: Dict[str, Any]) -> bool:
+        if not self.enabled or self._task is None:
+            return False
+
+        if key not in self._buffer and len(self._buffer) >= RESULT_STORE_MAX_BUFFER:
+            RESULT_STORE_DROPPED.labels(reason="buffer_full").inc()
+            return False
+
+        self._buffer[key] = record
+        RESULT_STORE_BUFFERED.set(len(self._buffer))
+
+        if len(self._buffer) >= RESULT_STORE_BATCH_SIZE and self._flush_event:
+            self._flush_event.set()
+        return True
+
+    async def lookup(
+        self,
+        content_hash: str,
+        model: str,
+        prompt_version: str,
+        deadline: Optional[Deadline] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """L3 lookup: kết quả đã lưu cho cùng content hash + prompt/model"""
+        if not self.enabled:
+            return None
+
+        key = record_key(content_hash, model, prompt_version)
+        pending = self._buffer.get((ANALYSIS, key))
+        if pending:
+            RESULT_STORE_LOOKUPS.labels(result="hit").inc()
+            return pending["result"]
+
+        try:
+            # _id = content_hash là format cũ (một document / hash), vẫn đọc được trong cùng query
+            doc = await async_mongo.find_one(
+                RESULT_STORE_COLLECTION,
+                {"_id": {"$in": [key, content_hash]}, "model": model, "prompt_version": prompt_version},
+                {"result": 1, "_id": 0},
+                deadline=deadline,
+                stage="db.result_store.lookup",
+                cap=RESULT_STORE_LOOKUP_TIMEOUT,
+            )
+        except Exception as e:
+            # L3 là best-effort: lỗi/timeout thì coi như miss
+            RESULT_STORE_LOOKUPS.labels(result="error").inc()
+            logger.debug(f"Result store lookup failed: {e}")
+            return None
+
+        if doc and doc.get("result"):
+            RESULT_STORE_LOOKUPS.labels(result="hit").inc()
+            return doc["result"]
+        RESULT_STORE_LOOKUPS.labels(result="miss").inc()
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "running": self._task is not None and not self._task.done(),
+            "buffered": len(self._buffer),
+            "max_buffer": RESULT_STORE_MAX_BUFFER,
+        }
+
+    # ------------------------------------------------------------------
+    # Flushing
+    # ------------------------------------------------------------------
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=RESULT_STORE_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            try:
+                await self._drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Result store flush error: {e}")
+
+    async def _drain(self) -> None:
+        while self._buffer:
+            if not await self.flush():
+                break
+
+    async def flush(self) -> int:
+        """Flush tối đa một batch (analysis + occurrence ghi song song); trả về số record đã ghi"""
+        async with self._flush_lock:
+            batch = self._take_batch()
+            if not batch:
+                return 0
+            writes = [
+                self._write(collection, [item for item in batch if item[0][0] == kind])
+                for kind, collection in ((ANALYSIS, self.collection), (OCCURRENCE, self.occurrences))
+                if any(item[0][0] == kind for item in batch)
+            ]
+            return sum(await asyncio.gather(*writes))
+
+    @staticmethod
+    def _operation(key: Tuple[str, Any], record: Dict[str, Any]) -> UpdateOne:
+        kind, record_id = key
+        if kind == OCCURRENCE:
+            index, post_id = record_id
+            record_id = {"index": index, "id": post_id}
+        return UpdateOne(
+            {"_id": record_id},
+            {"$set": record, "$setOnInsert": {"created_at": record["updated_at"]}},
+            upsert=True,
+        )
+
+    async def _write(self, collection, batch: List) -> int:
+        """bulk_write một batch vào collection với retry; phần không ghi được đưa lại buffer"""
+        operations = [self._operation(key, record) for key, record in batch]
+        try:
+            for attempt in range(RESULT_STORE_MAX_RETRIES + 1):
+                started = time.perf_counter()
+                try:
+                    await collection.bulk_write(operations, ordered=False)
+                    RESULT_STORE_WRITES.labels(status="ok").inc(len(operations))
+                    logger.debug(f"Result store flushed {len(operations)} records in {time.perf_counter() - started:.3f}s")
+                    return len(operations)
+                except BulkWriteError as e:
+                    # ordered=False: các op thành công vẫn được ghi, chỉ retry op lỗi tạm thời
+                    errors = e.details.get("writeErrors", [])
+                    retryable = [err for err in errors if err.get("code") in _RETRYABLE_WRITE_CODES]
+                    RESULT_STORE_WRITES.labels(status="ok").inc(len(operations) - len(errors))
+                    RESULT_STORE_WRITES.labels(status="failed").inc(len(errors) - len(retryable))
+                    if not retryable:
+                        return len(operations) - len(errors)
+                    operations = [operations[err["index"]] for err in retryable]
+                    batch = [batch[err["index"]] for err in retryable]
+                except TRANSIENT_ERRORS as e:
+                    logger.warning(f"Result store transient error (attempt {attempt + 1}): {e}")
+                except PyMongoError as e:
+                    logger.error(f"Result store write failed: {e}")
+                    break
+
+                if attempt < RESULT_STORE_MAX_RETRIES:
+                    await asyncio.sleep(min(0.1 * (2 ** attempt), 2.0))
+        except asyncio.CancelledError:
+            # Không mất batch đã lấy ra khỏi buffer (upsert idempotent nếu thật ra đã ghi)
+            self._requeue(batch)
+            raise
+
+        self._requeue(batch)
+        return 0
+
+    def _take_batch(self) -> List:
+        batch = []
+        while self._buffer and len(batch) < RESULT_STORE_BATCH_SIZE:
+            batch.append(self._buffer.popitem(last=False))
+        RESULT_STORE_BUFFERED.set(len(self._buffer))
+        return batch
+
+    def _requeue(self, batch: List) -> None:
+        """Đưa batch lỗi lại buffer nếu còn chỗ (record mới hơn cùng key được ưu tiên)"""
+        dropped = 0
+        for key, record in batch:
+            if key in self._buffer:
+                continue
+            if len(self._buffer) >= RESULT_STORE_MAX_BUFFER:
+                dropped += 1
+                continue
+            self._buffer[key] = record
+        if dropped:
+            RESULT_STORE_DROPPED.labels(reason="write_failed").inc(dropped)
+        RESULT_STORE_BUFFERED.set(len(self._buffer))
+
+
+# Global result store instance
+result_store = ResultStore()
@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+
+from fastapi import Request
+
+from app.config import (
+    MAX_CONCURRENT_REQUESTS,
+    SCHEDULER_LANES,
+    SCHEDULER_MAX_WAIT,
+    SCHEDULER_INITIAL_SERVICE_TIME,
+    PRIORITY_API_KEYS,
+    SCHEDULER_TENANT_WEIGHTS,
+)
+from app.deadline import Deadline
+from app.metrics import SCHEDULER_QUEUE_DEPTH, SCHEDULER_WAIT, SCHEDULER_SHED, CANCELLED_WORK
+from app.rate_limit import client_key, tenant_key, parse_mapping
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANE = "default"
+
+
+def parse_lanes(spec: str) -> List[Tuple[str, float, int]]:
+    """Parse 'realtime:16:200,default:4:500,bulk:1:1000' → [(name, weight, max_queue)] theo thứ tự ưu tiên"""
+    lanes = []
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, weight, max_queue = item.strip().split(":")
+        lanes.append((name, float(weight), int(max_queue)))
+    return lanes
+
+
+class LoadShedError(Exception):
+    """Request bị từ chối sớm vì queue đầy hoặc thời gian chờ ước tính quá lâu"""
+
+    def __init__(self, lane: str, reason: str, retry_after: float):
+        super().__init__(f"Load shed ({lane}: {reason})")
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Lane:
+    """Một priority lane: queue riêng cho từng tenant, chia lượt theo weighted fair queuing"""
+
+    def __init__(self, name: str, priority: int, weight: float, max_queue: int):
+        self.name = name
+        self.priority = priority
+        self.weight = weight
+        self.max_queue = max_queue
+        self.size = 0
+        self.pass_value = 0.0  # stride scheduling giữa các lane
+        self.clock = 0.0  # virtual time của lane
+        self.tenants: Dict[str, Deque[asyncio.Future]] = {}
+        self.tenant_vtime: Dict[str, float] = {}
+
+    def push(self, tenant: str, waiter: asyncio.Future) -> None:
+        queue = self.tenants.get(tenant)
+        if queue is None:
+            queue = self.tenants[tenant] = deque()
+            # Tenant mới active không được cộng dồn "credit" từ lúc idle
+            self.tenant_vtime[tenant] = max(self.tenant_vtime.get(tenant, 0.0), self.clock)
+        queue.append(waiter)
+        self.size += 1
+
+    def remove(self, tenant: str, waiter: asyncio.Future) -> bool:
+        queue = self.tenants.get(tenant)
+        if queue is None:
+            return False
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            return False
+        self.size -= 1
+        if not queue:
+            self._drop_tenant(tenant)
+        return True
+
+    def pop(self, tenant_weights: Dict[str, float]) -> Optional[asyncio.Future]:
+        """Lấy waiter của tenant có virtual finish time nhỏ nhất"""
+        if not self.tenants:
+            return None
+        tenant = min(self.tenants, key=self.tenant_vtime.__getitem__)
+        queue = self.tenants[tenant]
+        waiter = queue.popleft()
+        self.size -= 1
+        self.clock = self.tenant_vtime[tenant]
+        self.tenant_vtime[tenant] += 1.0 / tenant_weights.get(tenant, 1.0)
+        if not queue:
+            self._drop_tenant(tenant)
+        return waiter
+
+    def _drop_tenant(self, tenant: str) -> None:
+        del self.tenants[tenant]
+        # Giữ vtime của tenant idle trong giới hạn để tránh memory leak
+        if len(self.tenant_vtime) > 10000:
+            self.tenant_vtime = {t: v for t, v in self.tenant_vtime.items() if t in self.tenants}
+
+
+class PriorityScheduler:
+    """
+    Thay cho semaphore chung: giới hạn số request xử lý đồng thời, nhưng khi hết slot thì
+    - Request xếp hàng theo priority lane (realtime > default > bulk, chia lượt theo weight)
+    - Trong mỗi lane, các tenant được chia lượt bằng weighted fair queuing
+    - Mỗi lane có queue giới hạn; request bị shed sớm (503 + Retry-After) nếu queue đầy
+      hoặc thời gian chờ ước tính vượt SCHEDULER_MAX_WAIT, thay vì giữ slot tới khi timeout
+    """
+
+    def __init__(self, slots: int = MAX_CONCURRENT_REQUESTS, lanes_spec: str = SCHEDULER_LANES):
+        self.slots = slots
+        self._in_use = 0
+        self._queued = 0
+        self._lanes: Dict[str, _Lane] = {}
+        for priority, (name, weight, max_queue) in enumerate(parse_lanes(lanes_spec)):
+            self._lanes[name] = _Lane(name, priority, weight, max_queue)
+        if DEFAULT_LANE not in self._lanes:
+            self._lanes[DEFAULT_LANE] = _Lane(DEFAULT_LANE, len(self._lanes), 1.0, 500)
+        self._service_time = SCHEDULER_INITIAL_SERVICE_TIME
+        self._tenant_weights = {
+            tenant_key(key): float(weight) for key, weight in parse_mapping(SCHEDULER_TENANT_WEIGHTS).items()
+        }
+
+    @property
+    def lanes(self) -> List[str]:
+        return list(self._lanes)
+
+    def lane_for(self, name: Optional[str]) -> str:
+        return name if name in self._lanes else DEFAULT_LANE
+
+    def estimate_wait(self, lane_name: str) -> float:
+        """Ước tính thời gian chờ = số request đứng trước * service time trung bình / số slot"""
+        lane = self._lanes[lane_name]
+        ahead = sum(l.size for l in self._lanes.values() if l.priority <= lane.priority)
+        return (ahead + 1) * self._service_time / max(self.slots, 1)
+
+    async def acquire(self, lane_name: str, tenant: str, deadline: Optional[Deadline] = None) -> None:
+        lane = self._lanes[self.lane_for(lane_name)]
+
+        # Fast path: còn slot và không ai đang chờ
+        if self._in_use < self.slots and self._queued == 0:
+            self._in_use += 1
+            SCHEDULER_WAIT.labels(lane=lane.name).observe(0.0)
+            return
+
+        if lane.size >= lane.max_queue:
+            self._shed(lane, "queue_full", self.estimate_wait(lane.name))
+        estimated_wait = self.estimate_wait(lane.name)
+        max_wait = min(SCHEDULER_MAX_WAIT, deadline.remaining()) if deadline else SCHEDULER_MAX_WAIT
+        if estimated_wait > max_wait:
+            self._shed(lane, "estimated_wait", estimated_wait)
+
+        waiter = asyncio.get_running_loop().create_future()
+        if not lane.tenants:
+            # Lane vừa active lại: không cho cộng dồn lượt từ lúc idle
+            active = [l.pass_value for l in self._lanes.values() if l.size > 0]
+            lane.pass_value = max(lane.pass_value, min(active) if active else 0.0)
+        lane.push(tenant, waiter)
+        self._queued += 1
+        SCHEDULER_QUEUE_DEPTH.labels(lane=lane.name).set(lane.size)
+
+        enqueued_at = time.monotonic()
+        try:
+            if deadline is None:
+                await waiter
+            else:
+                # Không chờ slot quá deadline của request
+                await asyncio.wait_for(waiter, timeout=deadline.remaining())
+        except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Slot đã được chuyển cho request này ngay trước khi bị cancel → trả lại
+                self.release()
+            elif lane.remove(tenant, waiter):
+                self._queued -= 1
+                SCHEDULER_QUEUE_DEPTH.labels(lane=lane.name).set(lane.size)
+            if isinstance(e, asyncio.TimeoutError):
+                CANCELLED_WORK.labels(stage="scheduler", reason="deadline").inc()
+                self._shed(lane, "deadline", self.estimate_wait(lane.name))
+            raise
+        SCHEDULER_WAIT.labels(lane=lane.name).observe(time.monotonic() - enqueued_at)
+
+    def release(self) -> None:
+        """Trả slot: chuyển thẳng cho waiter kế tiếp nếu có, không thì giảm số slot đang dùng"""
+        while self._queued:
+            lane = min(
+                (l for l in self._lanes.values() if l.size > 0),
+                key=lambda l: (l.pass_value + 1.0 / l.weight, l.priority),
+            )
+            lane.pass_value += 1.0 / lane.weight
+            waiter = lane.pop(self._tenant_weights)
+            self._queued -= 1
+            SCHEDULER_QUEUE_DEPTH.labels(lane=lane.name).set(lane.size)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+                return
+        self._in_use -= 1
+
+    @asynccontextmanager
+    async def slot(self, lane: str, tenant: str, deadline: Optional[Deadline] = None):
+        await self.acquire(lane, tenant, deadline)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            # EWMA service time cho ước tính thời gian chờ
+            self._service_time = 0.9 * self._service_time + 0.1 * (time.monotonic() - started)
+            self.release()
+
+    def _shed(self, lane: _Lane, reason: str, estimated_wait: float) -> None:
+        SCHEDULER_SHED.labels(lane=lane.name, reason=reason).inc()
+        raise LoadShedError(lane.name, reason, retry_after=max(1.0, math.ceil(estimated_wait)))
+
+    def stats(self) -> Dict:
+        return {
+            "slots": self.slots,
+            "in_use": self._in_use,
+            "queued": self._queued,
+            "avg_service_time": round(self._service_time, 4),
+            "lanes": {
+                name: {"queued": lane.size, "max_queue": lane.max_queue, "weight": lane.weight}
+                for name, lane in self._lanes.items()
+            },
+        }
+
+
+# Global scheduler instance
+scheduler = PriorityScheduler()
+
+_PRIORITY_API_KEYS = {tenant_key(key): lane for key, lane in parse_mapping(PRIORITY_API_KEYS).items()}
+
+
+def resolve_priority(request: Request) -> Tuple[str, str]:
+    """
+    Xác định (lane, tenant) cho request: lane theo API key đã cấu hình, sau đó tới
+    header X-Priority, mặc định 'default'. Tenant dùng chung key với rate limiter
+    """
+    tenant, _ = client_key(request)
+    lane = _PRIORITY_API_KEYS.get(tenant) or request.headers.get("x-priority", DEFAULT_LANE).lower()
+    return scheduler.lane_for(lane), tenant
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 from typing import Optional, Dict, List
 
 class SentimentRequest(BaseModel):
@@ -33,6 +33,8 @@ class SentimentResponse(BaseModel):
     confidence: float
     keywords: Dict[str, List[str]]
     explanation: str
+    # Model đã sinh kết quả (router / hedge có thể dùng model khác LLM_MODEL), không nằm trong response
+    _model: Optional[str] = PrivateAttr(default=None)
 
 class AnalysisResult(BaseModel):
     """Extended result với metadata"""
@@ -46,4 +48,26 @@ class AnalysisResult(BaseModel):
     explanation: str
     log_level: int = 0
     processing_time: Optional[float] = None
-    trace_id: Optional[str] = None
\ No newline at end of file
+    trace_id: Optional[str] = None
+
+class TopicMatchRequest(BaseModel):
+    """Post thô từ crawler: tìm các topic trong qc_sentiment được nhắc tới"""
+    id: str
+    title: Optional[str] = ""
+    content: Optional[str] = ""
+    description: Optional[str] = ""
+    type: str
+    analyze: bool = False  # true → phân tích sentiment cho từng topic match
+    topic_ids: Optional[List[str]] = None  # chỉ xét các topic này (mặc định tất cả)
+
+class TopicMatch(BaseModel):
+    topic_id: str
+    topic_name: str
+    matched_keywords: List[str]
+    result: Optional[AnalysisResult] = None
+
+class TopicMatchResponse(BaseModel):
+    id: str
+    topics_version: int
+    matches: List[TopicMatch]
+    analyzed: int = 0
@@ -0,0 +1,53 @@
+from typing import Any, Dict, Iterable, Type, TypeVar, Union
+
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from starlette.middleware.gzip import GZipMiddleware
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+async def parse_body(request: Request, model: Union[Type[ModelT], TypeAdapter]) -> Any:
+    """
+    Parse + validate JSON body thẳng bằng pydantic-core (model_validate_json), không qua
+    json.loads → dict → model như body param mặc định của FastAPI. Lỗi vẫn trả 422 cùng format.
+    model là BaseModel hoặc TypeAdapter (vd. list item cho batch endpoint)
+    """
+    body = await request.body()
+    try:
+        if isinstance(model, TypeAdapter):
+            return model.validate_json(body)
+        return model.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+        ) from e
+
+
+def body_schema(model: Union[Type[BaseModel], TypeAdapter]) -> Dict[str, Any]:
+    """openapi_extra cho endpoint tự parse body (giữ request schema trong /docs)"""
+    schema = model.json_schema() if isinstance(model, TypeAdapter) else model.model_json_schema()
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": schema}},
+        }
+    }
+
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """
+    GZip chỉ cho endpoint có response lớn (batch, stats, ...). Endpoint single-item trả JSON
+    vài trăm bytes đi thẳng vào app, không qua wrapper send / buffer của GZipMiddleware
+    """
+
+    def __init__(self, app, minimum_size: int = 1000, compresslevel: int = 6, exclude_paths: Iterable[str] = ()):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.exclude_paths = frozenset(exclude_paths)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http" and scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
@@ -1,51 +1,62 @@
+import asyncio
+import hashlib
 import json
+import logging
 import re
 import time
 import uuid
-from typing import Dict, List, Optional
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, List, Optional, Tuple
 
-# Try to import Langfuse with proper error handling
-try:
-    from langfuse import Langfuse
-    from langfuse.decorators import observe, langfuse_context
-    LANGFUSE_AVAILABLE = True
-except ImportError:
-    print("Warning: Langfuse not available. Continuing without tracing.")
-    LANGFUSE_AVAILABLE = False
-    # Create dummy decorators
-    def observe(name=None):
-        def decorator(func):
-            return func
-        return decorator
-    
-    class DummyLangfuseContext:
-        def update_current_trace(self, **kwargs):
-            pass
-    
-    langfuse_context = DummyLangfuseContext()
+import orjson
 
 from app.config import (
-    LANGFUSE_SECRET_KEY, LANGFUSE_PUBLIC_KEY, LANGFUSE_HOST,
-    COMMENT_TYPES, LLM_MODEL, OPENAI_API_KEY, OPENAI_URI
+    COMMENT_TYPES, LLM_MODEL, OPENAI_TIMEOUT
 )
 from app.schemas import SentimentRequest, SentimentResponse
-from app.llm import llm
+from app.llm import llm, hedged_llm
+from app.result_store import result_store
+from app.deadline import Deadline, DeadlineExceeded
+from app.fingerprint import Fingerprint, namespace_for
+from app.text_merge import MergedText, Span, merge_sentences, sentence_spans
+from app.alert_priority import AlertEstimate, NO_ALERT, estimate_alert
+from app.metrics import STAGE_LATENCY, CANCELLED_WORK
+from app.nodes.format_output import calculate_log_level
+from app.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Kết quả keyword-miss (path phổ biến nhất): mapping + JSON bytes tính sẵn một lần và dùng chung
+# cho mọi request. Read-only (MappingProxyType, tuple) để caller không sửa được kết quả của request khác;
+# path cần dict thường (batch, serialize cùng kết quả khác) dùng no_mention_result()
+NO_MENTION_RESULT = MappingProxyType({
+    "targeted": False,
+    "sentiment": "neutral",
+    "confidence": 0.3,
+    "keywords": MappingProxyType({"positive": (), "negative": ()}),
+    "explanation": "Không nhắc đến chủ thể"
+})
+
+
+def no_mention_result() -> Dict[str, Any]:
+    """Bản copy (dict, list) của NO_MENTION_RESULT"""
+    return {**NO_MENTION_RESULT, "keywords": {"positive": [], "negative": []}}
+
+
+NO_MENTION_BODY = orjson.dumps(no_mention_result())
+
+
+@dataclass(frozen=True)
+class PreparedRequest:
+    """Text được phân tích + fingerprint + ước tính alert priority, tính một lần cho mỗi request"""
+    text: str
+    analysis_scope: str
+    fingerprint: Fingerprint
+    alert: AlertEstimate
+    sentences: Tuple[Span, ...] = ()  # offsets câu trong text (truncate / keyword window)
+    mentioned: bool = True  # False → keyword miss, trả NO_MENTION_RESULT không cần LLM
 
-# Initialize Langfuse if available
-if LANGFUSE_AVAILABLE and LANGFUSE_SECRET_KEY and LANGFUSE_PUBLIC_KEY:
-    try:
-        langfuse = Langfuse(
-            secret_key=LANGFUSE_SECRET_KEY,
-            public_key=LANGFUSE_PUBLIC_KEY,
-            host=LANGFUSE_HOST
-        )
-        print("Langfuse initialized successfully")
-    except Exception as e:
-        print(f"Warning: Failed to initialize Langfuse: {e}")
-        LANGFUSE_AVAILABLE = False
-else:
-    print("Langfuse not configured or not available")
-    LANGFUSE_AVAILABLE = False
 
 class SentimentAnalysisService:
     """Production-ready sentiment analysis service với optional Langfuse tracing"""
@@ -53,6 +64,10 @@ class SentimentAnalysisService:
     def __init__(self):
         self.comment_types = COMMENT_TYPES
         self.sentiment_prompt = self._get_sentiment_prompt()
+        # Version ngắn của prompt, dùng để phân biệt kết quả lưu trong result store
+        self.prompt_version = hashlib.md5(self.sentiment_prompt.encode()).hexdigest()[:12]
+        # Namespace cache theo prompt + model: đổi prompt/model không đọc nhầm kết quả cũ
+        self.cache_namespace = namespace_for(self.prompt_version, LLM_MODEL)
     
     def _get_sentiment_prompt(self) -> str:
         """Simplified and robust prompt for all cases"""
@@ -211,19 +226,8 @@ Return JSON only:
     
     @staticmethod
     def dedup_merge_text(*parts: str) -> str:
-        """Merge text parts with deduplication"""
-        seen = set()
-        merged = []
-        for part in parts:
-            if not part:
-                continue
-            sentences = re.split(r"[.!?]", part)
-            for s in sentences:
-                s_clean = SentimentAnalysisService.normalize(s)
-                if s_clean and s_clean not in seen:
-                    seen.add(s_clean)
-                    merged.append(s.strip())
-        return ". ".join(merged)
+        """Merge text parts with deduplication (xem app/text_merge.merge_sentences)"""
+        return merge_sentences(*parts).text
     
     def extract_json(self, text: str) -> dict:
         """Extract JSON from LLM response với error handling"""
@@ -270,147 +274,240 @@ Return JSON only:
             "explanation": explanation
         }
     
-    def call_llm(self, prompt: str, text: str, keywords: List[str], post_type: str) -> dict:
-        """Call LLM với optional Langfuse tracing"""
+    def _format_prompt(self, prompt: str, text: str, keywords: List[str], post_type: str) -> str:
+        """Format prompt with all parameters - using named placeholders"""
         try:
-            # Add trace metadata if Langfuse is available
-            if LANGFUSE_AVAILABLE:
-                try:
-                    langfuse_context.update_current_trace(
-                        name="sentiment_analysis_llm_call",
-                        metadata={
-                            "model": LLM_MODEL,
-                            "prompt_length": len(prompt),
-                            "keywords": keywords,
-                            "post_type": post_type
-                        }
-                    )
-                except Exception as e:
-                    print(f"Langfuse trace update failed: {e}")
-            
-            # Format prompt with all parameters - using named placeholders
-            try:
-                formatted_prompt = prompt.format(
-                    text=text,
-                    keywords=", ".join(keywords),
-                    post_type=post_type
-                )
-            except KeyError as e:
-                print(f"Prompt formatting error: {e}")
-                # Fallback to simple format
-                formatted_prompt = f"""
+            return prompt.format(
+                text=text,
+                keywords=", ".join(keywords),
+                post_type=post_type
+            )
+        except KeyError as e:
+            logger.warning("Prompt formatting error: %s", e)
+            # Fallback to simple format
+            return f"""
 Analyze sentiment for: {text}
 Keywords: {', '.join(keywords)}
 Type: {post_type}
 Return JSON with targeted, sentiment, confidence, keywords, explanation.
 """
-            
+    
+    def _trace_llm_call(self, prompt: str, keywords: List[str], post_type: str) -> None:
+        """Ghi metadata LLM call vào trace hiện tại (no-op nếu không trace)"""
+        tracer.update(
+            model=LLM_MODEL,
+            prompt_length=len(prompt),
+            keywords=keywords,
+            post_type=post_type
+        )
+    
+    def _parse_llm_content(self, content: str) -> dict:
+        """Extract and validate JSON, ghi raw response length vào trace"""
+        result = self.extract_json(content)
+        tracer.update(raw_response_length=len(content))
+        return result
+    
+    def _llm_error_result(self, error: Exception) -> dict:
+        """Đánh dấu trace lỗi (luôn được sample), trả về default result có flag error"""
+        tracer.update(error=True, error_message=f"LLM call failed: {str(error)}")
+        error_result = self._get_default_result(f"Lỗi LLM: {str(error)}")
+        error_result["error"] = True
+        return error_result
+    
+    def call_llm(self, prompt: str, text: str, keywords: List[str], post_type: str) -> dict:
+        """Call LLM với optional Langfuse tracing (sync, dùng cho scripts)"""
+        try:
+            self._trace_llm_call(prompt, keywords, post_type)
+            formatted_prompt = self._format_prompt(prompt, text, keywords, post_type)
+            started = time.time()
             response = llm.invoke(formatted_prompt)
-            content = response.content
-            
-            # Extract and validate JSON
-            result = self.extract_json(content)
-            
-            # Update trace with result if Langfuse is available
-            if LANGFUSE_AVAILABLE:
-                try:
-                    langfuse_context.update_current_trace(
-                        output=result,
-                        metadata={
-                            "raw_response_length": len(content),
-                            "targeted": result.get("targeted"),
-                            "sentiment": result.get("sentiment"),
-                            "confidence": result.get("confidence")
-                        }
-                    )
-                except Exception as e:
-                    print(f"Langfuse trace update failed: {e}")
-            
-            return result
-            
+            tracer.span("llm", started)
+            return self._parse_llm_content(response.content)
+        except Exception as e:
+            return self._llm_error_result(e)
+    
+    async def call_llm_async(
+        self,
+        prompt: str,
+        text: str,
+        keywords: List[str],
+        post_type: str,
+        deadline: Optional[Deadline] = None
+    ) -> dict:
+        """
+        Async LLM call với timeout lấy từ phần budget còn lại của request.
+        Khi hết deadline hoặc request bị cancel, HTTP call đang chạy bị cancel thật
+        (không để lại thread mồ côi tiếp tục gọi LLM)
+        """
+        self._trace_llm_call(prompt, keywords, post_type)
+        formatted_prompt = self._format_prompt(prompt, text, keywords, post_type)
+        
+        timeout = deadline.timeout(OPENAI_TIMEOUT) if deadline else OPENAI_TIMEOUT
+        if timeout <= 0:
+            CANCELLED_WORK.labels(stage="llm", reason="deadline").inc()
+            raise DeadlineExceeded("Deadline exceeded before LLM call")
+        
+        started = time.perf_counter()
+        span_started = time.time()
+        try:
+            response = await asyncio.wait_for(hedged_llm.ainvoke(formatted_prompt), timeout=timeout)
+        except asyncio.TimeoutError:
+            CANCELLED_WORK.labels(stage="llm", reason="deadline").inc()
+            raise DeadlineExceeded(f"LLM call exceeded request deadline ({timeout:.2f}s)")
+        except asyncio.CancelledError:
+            CANCELLED_WORK.labels(stage="llm", reason="cancelled").inc()
+            raise
         except Exception as e:
-            # Log error to Langfuse if available
-            if LANGFUSE_AVAILABLE:
-                try:
-                    langfuse_context.update_current_trace(
-                        metadata={
-                            "error": True,
-                            "error_message": f"LLM call failed: {str(e)}"
-                        }
-                    )
-                except Exception as trace_error:
-                    print(f"Langfuse trace update failed: {trace_error}")
-            return self._get_default_result(f"Lỗi LLM: {str(e)}")
+            return self._llm_error_result(e)
+        finally:
+            STAGE_LATENCY.labels(stage="llm").observe(time.perf_counter() - started)
+        
+        result = self._parse_llm_content(response.content)
+        # Backend + model đã phục vụ (do LLM router / hedge ghi vào response metadata)
+        metadata = getattr(response, "response_metadata", None) or {}
+        result["backend"] = metadata.get("backend")
+        result["model"] = metadata.get("model") or LLM_MODEL
+        tracer.span("llm", span_started, backend=result["backend"], model=result["model"])
+        return result
+    
+    def _select_merged(self, request: SentimentRequest) -> Tuple[MergedText, str]:
+        """Chọn text để phân tích theo type, trả về (text + offsets câu, analysis_scope)"""
+        if request.type in self.comment_types:
+            # For COMMENT types: Only analyze the comment content
+            # Ignore title and description as they are usually context/original post
+            return sentence_spans(request.content or ""), "comment_content_only"
+        
+        # For NON-COMMENT types: Analyze all content (title + content + description)
+        # This includes news articles, reviews, posts, etc.
+        merged = merge_sentences(
+            request.title or "", 
+            request.content or "", 
+            request.description or ""
+        )
+        return merged, "full_content"
+    
+    def select_text(self, request: SentimentRequest) -> Tuple[str, str]:
+        """Chọn text để phân tích theo type, trả về (text, analysis_scope)"""
+        merged, analysis_scope = self._select_merged(request)
+        return merged.text, analysis_scope
+    
+    def namespace_for_model(self, model: Optional[str]) -> str:
+        """Cache namespace cho kết quả do `model` sinh ra (None = LLM_MODEL)"""
+        if not model or model == LLM_MODEL:
+            return self.cache_namespace
+        return namespace_for(self.prompt_version, model)
+    
+    def cache_key_for(self, prepared: PreparedRequest, result: SentimentResponse) -> str:
+        """
+        Cache key để ghi kết quả: theo model thật đã sinh ra kết quả, không trộn output của model
+        khác (endpoint / hedge) vào namespace của LLM_MODEL
+        """
+        return prepared.fingerprint.in_namespace(self.namespace_for_model(result._model)).cache_key
+    
+    def prepare(self, request: SentimentRequest) -> PreparedRequest:
+        """Chọn text và tính fingerprint một lần; dùng chung cho cache, single-flight, result store, log"""
+        merged, analysis_scope = self._select_merged(request)
+        text = merged.text
+        mentioned = self.mentions_keyword(text, request.main_keywords)
+        fingerprint = Fingerprint.build(
+            text, request.type, request.main_keywords, namespace=self.cache_namespace
+        )
+        return PreparedRequest(
+            text=text,
+            analysis_scope=analysis_scope,
+            fingerprint=fingerprint,
+            alert=estimate_alert(text, request.type, request.main_keywords) if mentioned else NO_ALERT,
+            sentences=merged.sentences,
+            mentioned=mentioned
+        )
+    
+    def _trace_input(self, request: SentimentRequest, trace_id: str):
+        """Bắt đầu trace cho request (None nếu tracing tắt); kết thúc bằng tracer.finish()"""
+        return tracer.start(
+            "sentiment_analysis",
+            trace_id,
+            user_id=request.id,
+            session_id=request.index,
+            input={
+                "id": request.id,
+                "type": request.type,
+                "has_keywords": len(request.main_keywords) > 0,
+                "text_length": len(request.title or "") + len(request.content or "") + len(request.description or "")
+            },
+            model=LLM_MODEL
+        )
+    
+    def _trace_output(self, request: SentimentRequest, result: SentimentResponse, **metadata) -> None:
+        """Output + log_level vào trace (giữ reference, serialize ở exporter thread)"""
+        if not tracer.enabled:
+            return
+        tracer.update(
+            output=result,
+            log_level=calculate_log_level(result.sentiment, request.type, result.targeted),
+            **metadata
+        )
+    
+    def _no_mention_result(self, start_time: float, analysis_scope: str) -> SentimentResponse:
+        result = SentimentResponse(**no_mention_result())
+        tracer.update(
+            output=result,
+            processing_time=time.time() - start_time,
+            reason="no_keyword_match",
+            analysis_scope=analysis_scope
+        )
+        return result
+    
+    def _build_result(
+        self, request: SentimentRequest, llm_result: dict, start_time: float, analysis_scope: str
+    ) -> SentimentResponse:
+        """Create response based on LLM result"""
+        result = SentimentResponse(
+            targeted=llm_result.get("targeted", False),
+            sentiment=llm_result["sentiment"],
+            confidence=llm_result["confidence"],
+            keywords=llm_result["keywords"],
+            explanation=llm_result["explanation"]
+        )
+        self._trace_output(
+            request,
+            result,
+            processing_time=time.time() - start_time,
+            is_comment_type=request.type in self.comment_types,
+            analysis_scope=analysis_scope
+        )
+        return result
+    
+    def _error_result(self, error: Exception, start_time: float) -> SentimentResponse:
+        """Handle any unexpected errors"""
+        error_result = SentimentResponse(
+            targeted=False,
+            sentiment="neutral",
+            confidence=0.0,
+            keywords={"positive": [], "negative": []},
+            explanation=f"Lỗi hệ thống: {str(error)}"
+        )
+        tracer.update(
+            output=error_result,
+            error=True,
+            processing_time=time.time() - start_time,
+            error_message=f"Analysis failed: {str(error)}"
+        )
+        return error_result
     
     def analyze(self, request: SentimentRequest) -> SentimentResponse:
-        """Main analysis method với enhanced targeting logic"""
+        """Main analysis method với enhanced targeting logic (sync, dùng cho scripts)"""
         start_time = time.time()
         trace_id = str(uuid.uuid4())
         
+        trace = self._trace_input(request, trace_id)
+        
         try:
-            # Update trace with input metadata if Langfuse is available
-            if LANGFUSE_AVAILABLE:
-                try:
-                    langfuse_context.update_current_trace(
-                        name="sentiment_analysis",
-                        user_id=request.id,
-                        session_id=request.index,
-                        input={
-                            "id": request.id,
-                            "type": request.type,
-                            "has_keywords": len(request.main_keywords) > 0,
-                            "text_length": len((request.title or "") + (request.content or "") + (request.description or ""))
-                        },
-                        metadata={
-                            "trace_id": trace_id,
-                            "model": LLM_MODEL
-                        }
-                    )
-                except Exception as e:
-                    print(f"Langfuse trace update failed: {e}")
-            
             # 1. Select appropriate text based on type
-            if request.type in self.comment_types:
-                # For COMMENT types: Only analyze the comment content
-                # Ignore title and description as they are usually context/original post
-                text = request.content or ""
-                analysis_scope = "comment_content_only"
-            else:
-                # For NON-COMMENT types: Analyze all content (title + content + description)
-                # This includes news articles, reviews, posts, etc.
-                text = self.dedup_merge_text(
-                    request.title or "", 
-                    request.content or "", 
-                    request.description or ""
-                )
-                analysis_scope = "full_content"
+            text, analysis_scope = self.select_text(request)
             
             # 2. Check if text mentions target keywords
             if not self.mentions_keyword(text, request.main_keywords):
-                result = SentimentResponse(
-                    targeted=False,
-                    sentiment="neutral",
-                    confidence=0.3,
-                    keywords={"positive": [], "negative": []},
-                    explanation="Không nhắc đến chủ thể"
-                )
-                
-                # Update trace for non-targeted result if Langfuse is available
-                if LANGFUSE_AVAILABLE:
-                    try:
-                        langfuse_context.update_current_trace(
-                            output=result.dict(),
-                            metadata={
-                                "processing_time": time.time() - start_time,
-                                "targeted": False,
-                                "reason": "no_keyword_match",
-                                "analysis_scope": analysis_scope
-                            }
-                        )
-                    except Exception as e:
-                        print(f"Langfuse trace update failed: {e}")
-                
-                return result
+                return self._no_mention_result(start_time, analysis_scope)
             
             # 3. Call LLM to analyze sentiment and targeting
             llm_result = self.call_llm(
@@ -421,58 +518,74 @@ Return JSON with targeted, sentiment, confidence, keywords, explanation.
             )
             
             # 4. Create response based on LLM result
-            result = SentimentResponse(
-                targeted=llm_result.get("targeted", False),
-                sentiment=llm_result["sentiment"],
-                confidence=llm_result["confidence"],
-                keywords=llm_result["keywords"],
-                explanation=llm_result["explanation"]
-            )
+            return self._build_result(request, llm_result, start_time, analysis_scope)
+            
+        except Exception as e:
+            return self._error_result(e, start_time)
+        finally:
+            tracer.finish(trace)
+    
+    async def analyze_async(
+        self,
+        request: SentimentRequest,
+        prepared: Optional[PreparedRequest] = None,
+        deadline: Optional[Deadline] = None
+    ) -> SentimentResponse:
+        """
+        Async analysis cho API path: giống analyze() nhưng trước khi gọi LLM sẽ lookup
+        result store (L3 cache theo fingerprint) và ghi kết quả mới vào store.
+        Mỗi stage lấy timeout từ deadline của request; hết deadline → DeadlineExceeded
+        """
+        start_time = time.time()
+        trace_id = str(uuid.uuid4())
+        
+        trace = self._trace_input(request, trace_id)
+        
+        try:
+            prepared = prepared or self.prepare(request)
+            text, analysis_scope = prepared.text, prepared.analysis_scope
+            content_hash = prepared.fingerprint.digest
             
-            # Update final trace if Langfuse is available
-            if LANGFUSE_AVAILABLE:
-                try:
-                    processing_time = time.time() - start_time
-                    langfuse_context.update_current_trace(
-                        output=result.dict(),
-                        metadata={
-                            "processing_time": processing_time,
-                            "targeted": result.targeted,
-                            "final_sentiment": result.sentiment,
-                            "final_confidence": result.confidence,
-                            "is_comment_type": request.type in self.comment_types,
-                            "analysis_scope": analysis_scope
-                        }
-                    )
-                except Exception as e:
-                    print(f"Langfuse trace update failed: {e}")
+            if not prepared.mentioned:
+                return self._no_mention_result(start_time, analysis_scope)
             
-            return result
+            # L3: kết quả đã lưu lâu dài trong MongoDB (sống lâu hơn Redis CACHE_TTL)
+            stored = await result_store.lookup(
+                content_hash, LLM_MODEL, self.prompt_version, deadline=deadline
+            )
+            if stored:
+                result = SentimentResponse(**stored)
+                self._trace_output(request, result, source="result_store")
+                return result
             
-        except Exception as e:
-            # Handle any unexpected errors
-            error_result = SentimentResponse(
-                targeted=False,
-                sentiment="neutral",
-                confidence=0.0,
-                keywords={"positive": [], "negative": []},
-                explanation=f"Lỗi hệ thống: {str(e)}"
+            llm_result = await self.call_llm_async(
+                self.sentiment_prompt,
+                text,
+                request.main_keywords,
+                request.type,
+                deadline=deadline
             )
             
-            if LANGFUSE_AVAILABLE:
-                try:
-                    langfuse_context.update_current_trace(
-                        output=error_result.dict(),
-                        metadata={
-                            "processing_time": time.time() - start_time,
-                            "error": True,
-                            "error_message": f"Analysis failed: {str(e)}"
-                        }
-                    )
-                except Exception as trace_error:
-                    print(f"Langfuse trace update failed: {trace_error}")
+            result = self._build_result(request, llm_result, start_time, analysis_scope)
+            result._model = llm_result.get("model") or LLM_MODEL
             
-            return error_result
+            # Không lưu kết quả lỗi LLM vào store
+            if not llm_result.get("error"):
+                result_store.submit(
+                    content_hash, request, result.dict(), result._model, self.prompt_version,
+                    backend=llm_result.get("backend")
+                )
+            
+            return result
+            
+        except asyncio.TimeoutError as e:
+            # DeadlineExceeded: để endpoint trả response timeout
+            tracer.update(error=True, error_message=str(e) or "deadline exceeded")
+            raise
+        except Exception as e:
+            return self._error_result(e, start_time)
+        finally:
+            tracer.finish(trace)
 
 # Global service instance
 sentiment_service = SentimentAnalysisService()
\ No newline at end of file
@@ -0,0 +1,54 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from app.metrics import SINGLE_FLIGHT
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Gộp các request trùng fingerprint đang xử lý đồng thời thành một lần phân tích:
+    request đầu (leader) chạy, các request sau (follower) chờ cùng kết quả.
+    Task chung được shield khỏi timeout / cancel của từng caller và chỉ bị cancel khi
+    không còn ai chờ (không gọi LLM cho kết quả không ai dùng)
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            SINGLE_FLIGHT.labels(role="leader").inc()
+        else:
+            SINGLE_FLIGHT.labels(role="follower").inc()
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+                self._forget(key, call)
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+
+# Global single-flight instance
+single_flight = SingleFlight()
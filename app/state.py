@@ -1,7 +1,8 @@
-from typing import TypedDict, Optional, Dict, List
+from typing import TypedDict, Optional, Dict, List, Tuple
 
 class AgentState(TypedDict):
     input_data: dict
     merged_text: Optional[str]
+    merged_sentences: Optional[List[Tuple[int, int]]]  # offsets câu trong merged_text
     llm_analysis: Optional[Dict]
     final_result: Optional[dict]
\ No newline at end of file
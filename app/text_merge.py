@@ -0,0 +1,97 @@
+import re
+from typing import List, NamedTuple, Tuple
+
+# Câu = đoạn giữa hai dấu kết thúc câu (giống re.split(r"[.!?]") cũ, bỏ đoạn rỗng)
+_SENTENCE = re.compile(r"[^.!?]+")
+_SENTENCE_END = re.compile(r"[.!?]")
+_SEPARATOR = ". "
+
+Span = Tuple[int, int]
+
+
+class MergedText(NamedTuple):
+    """Text đã gộp + offsets (start, end) của từng câu trong text, theo thứ tự"""
+    text: str
+    sentences: Tuple[Span, ...]
+
+    def truncate(self, max_chars: int) -> str:
+        """Cắt text tại ranh giới câu, không vượt max_chars (câu đầu dài hơn max_chars thì cắt cứng)"""
+        if len(self.text) <= max_chars:
+            return self.text
+        end = 0
+        for start, stop in self.sentences:
+            if stop > max_chars:
+                break
+            end = stop
+        return self.text[:end or max_chars]
+
+    def sentence_index(self, offset: int) -> int:
+        """Index câu chứa offset (vd. vị trí keyword match); -1 nếu offset nằm ngoài mọi câu"""
+        low, high = 0, len(self.sentences) - 1
+        while low <= high:
+            middle = (low + high) // 2
+            start, stop = self.sentences[middle]
+            if offset < start:
+                high = middle - 1
+            elif offset >= stop:
+                low = middle + 1
+            else:
+                return middle
+        return -1
+
+    def window(self, offset: int, before: int = 1, after: int = 1) -> str:
+        """Đoạn text gồm câu chứa offset và `before`/`after` câu xung quanh"""
+        index = self.sentence_index(offset)
+        if index < 0:
+            return ""
+        first = self.sentences[max(index - before, 0)][0]
+        last = self.sentences[min(index + after, len(self.sentences) - 1)][1]
+        return self.text[first:last]
+
+
+def _sentence_key(sentence: str) -> str:
+    """Câu đã normalize (lowercase + gộp whitespace) dùng để so trùng"""
+    return " ".join(sentence.lower().split())
+
+
+def merge_sentences(*parts: str) -> MergedText:
+    """
+    Gộp các phần text thành một, bỏ câu trùng (so sánh sau khi normalize) trong một lượt:
+    mỗi part được tách câu một lần, câu đã normalize được giữ trong set (so bằng nội dung, không chỉ
+    bằng hash: va chạm hash không được làm mất câu khác nhau và đổi cache key).
+    Output text giống hệt dedup_merge_text cũ (cache key không đổi)
+    """
+    seen = set()
+    pieces: List[str] = []
+    spans: List[Span] = []
+    position = 0
+    for part in parts:
+        if not part:
+            continue
+        for segment in _SENTENCE_END.split(part):
+            sentence = segment.strip()
+            if not sentence:
+                continue
+            key = _sentence_key(sentence)
+            if key in seen:
+                continue
+            seen.add(key)
+            if pieces:
+                position += len(_SEPARATOR)
+            pieces.append(sentence)
+            spans.append((position, position + len(sentence)))
+            position += len(sentence)
+    return MergedText(_SEPARATOR.join(pieces), tuple(spans))
+
+
+def sentence_spans(text: str) -> MergedText:
+    """Offsets câu cho text đã có sẵn (không dedup, text giữ nguyên)"""
+    spans = []
+    for match in _SENTENCE.finditer(text):
+        start, stop = match.span()
+        segment = match.group()
+        leading = len(segment) - len(segment.lstrip())
+        trailing = len(segment) - len(segment.rstrip())
+        if stop - trailing > start + leading:
+            spans.append((start + leading, stop - trailing))
+    return MergedText(text, tuple(spans))
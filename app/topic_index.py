@@ -0,0 +1,180 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from app.metrics import TOPIC_INDEX_BUILD_SECONDS, TOPIC_INDEX_KEYWORDS
+from app.topics import TopicSnapshot, normalize_keyword
+
+# pyahocorasick (C extension) là optional; không có thì dùng automaton pure Python bên dưới
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick trên keywords đã normalize: quét text một lần, trả về mọi keyword xuất hiện
+    (kể cả keyword lồng nhau / chồng lấn), độ phức tạp theo độ dài text + số match,
+    không phụ thuộc số keyword. Semantics giống TopicEntry.mentions (substring match)
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: Tuple[str, ...] = tuple(sorted({k for k in keywords if k}))
+        self._native = None
+        if AHOCORASICK_AVAILABLE:
+            automaton = ahocorasick.Automaton()
+            for keyword_id, keyword in enumerate(self.keywords):
+                automaton.add_word(keyword, keyword_id)
+            if self.keywords:
+                automaton.make_automaton()
+                self._native = automaton
+            return
+
+        # goto[state]: char → state; output[state]: keyword ids kết thúc tại state (đã gộp theo fail link)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[int, ...]] = [()]
+        for keyword_id, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = next_state
+            self._output[state] += (keyword_id,)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def search(self, text: str) -> Set[int]:
+        """Id các keyword xuất hiện trong text (text đã normalize)"""
+        if self._native is not None:
+            return {keyword_id for _, keyword_id in self._native.iter(text)}
+        if not self.keywords:
+            return set()
+
+        goto, fail, output = self._goto, self._fail, self._output
+        found: Set[int] = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class TopicIndex:
+    """Reverse index keyword → topic ids cho một TopicSnapshot"""
+
+    def __init__(self, snapshot: TopicSnapshot):
+        started = time.perf_counter()
+        self.version = snapshot.version
+        topics_by_keyword: Dict[str, Set[str]] = {}
+        for topic in snapshot.topics.values():
+            for keyword in topic.keywords:
+                normalized = normalize_keyword(keyword)
+                if normalized:
+                    topics_by_keyword.setdefault(normalized, set()).add(topic.topic_id)
+
+        self.automaton = KeywordAutomaton(topics_by_keyword)
+        self._topics: Tuple[FrozenSet[str], ...] = tuple(
+            frozenset(topics_by_keyword[keyword]) for keyword in self.automaton.keywords
+        )
+        self.build_seconds = time.perf_counter() - started
+        TOPIC_INDEX_BUILD_SECONDS.set(self.build_seconds)
+        TOPIC_INDEX_KEYWORDS.set(len(self.automaton.keywords))
+
+    def match(self, normalized_text: str) -> Dict[str, List[str]]:
+        """topic_id → keywords (normalize) xuất hiện trong text"""
+        matches: Dict[str, List[str]] = {}
+        for keyword_id in self.automaton.search(normalized_text):
+            keyword = self.automaton.keywords[keyword_id]
+            for topic_id in self._topics[keyword_id]:
+                matches.setdefault(topic_id, []).append(keyword)
+        for keywords in matches.values():
+            keywords.sort()
+        return matches
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "version": self.version,
+            "keywords": len(self.automaton.keywords),
+            "build_seconds": round(self.build_seconds, 4),
+            "engine": "pyahocorasick" if AHOCORASICK_AVAILABLE else "python",
+        }
+
+
+class TopicIndexCache:
+    """
+    Giữ TopicIndex của snapshot mới nhất. Khi topic registry đổi version, index được build lại
+    trong thread nền (vài trăm ms với hàng chục nghìn keywords); trong lúc đó request dùng index cũ.
+    Chỉ lần build đầu tiên (chưa có index) là build đồng bộ
+    """
+
+    def __init__(self):
+        self._index: Optional[TopicIndex] = None
+        self._lock = threading.Lock()
+        self._building = False
+
+    def get(self, snapshot: TopicSnapshot) -> TopicIndex:
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    self._install(TopicIndex(snapshot), len(snapshot.topics))
+                return self._index
+        if index.version != snapshot.version and not self._building:
+            with self._lock:
+                if not self._building:
+                    self._building = True
+                    threading.Thread(
+                        target=self._rebuild, args=(snapshot,), name="topic-index-build", daemon=True
+                    ).start()
+        return index
+
+    def _rebuild(self, snapshot: TopicSnapshot) -> None:
+        try:
+            self._install(TopicIndex(snapshot), len(snapshot.topics))
+        except Exception as e:
+            logger.error(f"Topic index build failed: {e}")
+        finally:
+            self._building = False
+
+    def _install(self, index: TopicIndex, topics: int) -> None:
+        current = self._index
+        if current is None or index.version > current.version:
+            self._index = index
+        logger.info(
+            f"Topic index built: {topics} topics, "
+            f"{len(index.automaton.keywords)} keywords in {index.build_seconds:.3f}s"
+        )
+
+    def stats(self) -> Dict[str, object]:
+        if self._index is None:
+            return {"version": None}
+        return {**self._index.stats(), "rebuilding": self._building}
+
+
+# Global topic index instance
+topic_index = TopicIndexCache()
@@ -0,0 +1,357 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Pattern, Tuple
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.config import (
+    TOPIC_ACTIVE_FIELD,
+    TOPIC_UPDATED_AT_FIELD,
+    TOPIC_CHANGE_STREAM_ENABLED,
+    TOPIC_POLL_INTERVAL,
+    TOPIC_FULL_RELOAD_INTERVAL,
+    TOPIC_WATCH_RETRY_INTERVAL,
+)
+from app.db import mongo_conn, async_mongo
+
+logger = logging.getLogger(__name__)
+
+# Chỉ lấy các field cần cho request path
+TOPIC_PROJECTION = {
+    "_id": 1,
+    "topic_id": 1,
+    "topic_name": 1,
+    "keywords": 1,
+    TOPIC_ACTIVE_FIELD: 1,
+    TOPIC_UPDATED_AT_FIELD: 1,
+}
+
+# Topic không có field active được coi là active
+ACTIVE_FILTER = {TOPIC_ACTIVE_FIELD: {"$ne": False}}
+
+# MongoDB standalone không hỗ trợ change stream
+_CHANGE_STREAM_UNSUPPORTED_CODES = {40573}
+# Resume token hết hạn / không dùng lại được (oplog đã xoay vòng): ChangeStreamFatalError, ChangeStreamHistoryLost
+_RESUME_TOKEN_LOST_CODES = {280, 286}
+
+# Retry load ban đầu khi MongoDB lỗi lúc startup (giây, tăng gấp đôi tới max)
+_INITIAL_LOAD_BACKOFF = 1.0
+_INITIAL_LOAD_BACKOFF_MAX = 60.0
+
+
+def normalize_keyword(keyword: str) -> str:
+    """Normalize keyword giống cách normalize text khi matching"""
+    return re.sub(r"\s+", " ", keyword.lower()).strip()
+
+
+def compile_keyword_matcher(keywords: Iterable[str]) -> Optional[Pattern]:
+    """
+    Compile danh sách keywords thành một regex alternation (substring match,
+    keyword dài trước) để mỗi lần match chỉ quét text một lần
+    """
+    normalized = {normalize_keyword(k) for k in keywords if k and k.strip()}
+    if not normalized:
+        return None
+    alternatives = sorted(normalized, key=len, reverse=True)
+    return re.compile("|".join(re.escape(k) for k in alternatives))
+
+
+@dataclass(frozen=True)
+class TopicEntry:
+    """Topic đã được preload, kèm keyword matcher đã compile"""
+    topic_id: str
+    topic_name: str
+    keywords: Tuple[str, ...]
+    matcher: Optional[Pattern] = field(default=None, compare=False, repr=False)
+
+    @classmethod
+    def from_document(cls, doc: Dict[str, Any]) -> "TopicEntry":
+        keywords = tuple(k for k in (doc.get("keywords") or []) if isinstance(k, str))
+        return cls(
+            topic_id=str(doc["topic_id"]),
+            topic_name=doc.get("topic_name", ""),
+            keywords=keywords,
+            matcher=compile_keyword_matcher(keywords),
+        )
+
+    def mentions(self, normalized_text: str) -> bool:
+        """Check text (đã lowercase + normalize whitespace) có nhắc đến topic không"""
+        return self.matcher is not None and self.matcher.search(normalized_text) is not None
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Format tương thích với document cũ trả về từ find_one"""
+        return {
+            "topic_id": self.topic_id,
+            "topic_name": self.topic_name,
+            "keywords": list(self.keywords),
+        }
+
+
+@dataclass(frozen=True)
+class TopicSnapshot:
+    """Snapshot bất biến của toàn bộ topics; được thay thế nguyên khối khi refresh"""
+    topics: Mapping[str, TopicEntry]
+    version: int = 0
+    loaded_at: float = 0.0
+    max_updated_at: Any = None
+
+    @classmethod
+    def empty(cls) -> "TopicSnapshot":
+        return cls(topics=MappingProxyType({}))
+
+
+class TopicRegistry:
+    """
+    In-memory registry cho qc_sentiment:
+    - Bulk load toàn bộ topics active lúc startup bằng một query có projection
+    - Giữ snapshot bất biến, request path chỉ đọc snapshot (không chạm network)
+    - Refresh qua MongoDB change stream, fallback polling theo updated-at field
+    """
+
+    def __init__(self):
+        self._snapshot = TopicSnapshot.empty()
+        self._object_ids: Dict[Any, str] = {}
+        self._write_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._loaded = False
+        self._change_stream_supported = TOPIC_CHANGE_STREAM_ENABLED
+        self._resume_token = None
+        self._last_full_reload = 0.0
+        self._refresh_mode = "none"
+
+    @property
+    def snapshot(self) -> TopicSnapshot:
+        return self._snapshot
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self, topic_id: str) -> Optional[TopicEntry]:
+        """Lookup topic từ snapshot hiện tại - không có network I/O"""
+        return self._snapshot.topics.get(topic_id)
+
+    def load(self) -> TopicSnapshot:
+        """Full reload qua sync client (scripts / CLI)"""
+        started = time.time()
+        docs = mongo_conn.topics_col.find(ACTIVE_FILTER, TOPIC_PROJECTION)
+        snapshot = self._install_full(docs)
+        logger.info(f"Topic registry loaded {len(snapshot.topics)} topics in {time.time() - started:.3f}s")
+        return snapshot
+
+    async def load_async(self) -> TopicSnapshot:
+        """Full reload qua async client: một query duy nhất lấy toàn bộ topics active"""
+        started = time.time()
+        docs = await async_mongo.find(
+            "qc_sentiment", ACTIVE_FILTER, TOPIC_PROJECTION, stage="db.topics.load"
+        )
+        snapshot = self._install_full(docs)
+        logger.info(f"Topic registry loaded {len(snapshot.topics)} topics in {time.time() - started:.3f}s")
+        return snapshot
+
+    async def start(self) -> None:
+        """
+        Load snapshot ban đầu và luôn chạy background refresh task. Load lỗi (MongoDB chưa sẵn sàng)
+        không làm hỏng startup: refresh task retry load ban đầu với backoff
+        """
+        try:
+            await self.load_async()
+        except Exception as e:
+            logger.error(f"Topic registry initial load failed, retrying in background: {e}")
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._refresh_loop(), name="topic-registry-refresh")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "loaded": self._loaded,
+            "topics": len(snapshot.topics),
+            "version": snapshot.version,
+            "loaded_at": snapshot.loaded_at,
+            "refresh_mode": self._refresh_mode,
+        }
+
+    # ------------------------------------------------------------------
+    # Refresh
+    # ------------------------------------------------------------------
+    async def _initial_load(self) -> None:
+        """Retry full load tới khi thành công (backoff tăng dần)"""
+        backoff = _INITIAL_LOAD_BACKOFF
+        while not self._loaded:
+            await asyncio.sleep(backoff)
+            try:
+                await self.load_async()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                backoff = min(backoff * 2, _INITIAL_LOAD_BACKOFF_MAX)
+                logger.warning(f"Topic registry initial load failed, retry in {backoff:.0f}s: {e}")
+
+    async def _refresh_loop(self) -> None:
+        await self._initial_load()
+        while True:
+            if self._change_stream_supported:
+                try:
+                    self._refresh_mode = "change_stream"
+                    await self._watch()
+                except OperationFailure as e:
+                    if e.code in _CHANGE_STREAM_UNSUPPORTED_CODES:
+                        logger.warning("Change stream không được hỗ trợ, chuyển sang polling")
+                        self._change_stream_supported = False
+                    elif e.code in _RESUME_TOKEN_LOST_CODES or e.has_error_label("NonResumableChangeStreamError"):
+                        # Token cũ không resume được nữa: mở stream mới, full reload để bù thay đổi bị lỡ
+                        logger.warning(f"Topic change stream resume token lost, full reload: {e}")
+                        self._resume_token = None
+                        self._last_full_reload = 0.0
+                    else:
+                        logger.warning(f"Topic change stream error: {e}")
+                except PyMongoError as e:
+                    logger.warning(f"Topic change stream error: {e}")
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Unexpected topic change stream error: {e}")
+
+            # Polling fallback; nếu change stream được hỗ trợ thì thử lại sau một khoảng
+            self._refresh_mode = "polling"
+            poll_until = time.time() + TOPIC_WATCH_RETRY_INTERVAL
+            while True:
+                await self._poll_once()
+                if self._change_stream_supported and time.time() >= poll_until:
+                    break
+                await asyncio.sleep(TOPIC_POLL_INTERVAL)
+
+    async def _watch(self) -> None:
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+        async with async_mongo.topics_col.watch(
+            pipeline,
+            full_document="updateLookup",
+            resume_after=self._resume_token,
+        ) as stream:
+            # Bắt kịp các thay đổi có thể bị lỡ trước khi stream mở
+            await self._poll_once()
+            async for change in stream:
+                self._resume_token = stream.resume_token
+                self._apply_change(change)
+
+    def _apply_change(self, change: Dict[str, Any]) -> None:
+        operation = change.get("operationType")
+        object_id = (change.get("documentKey") or {}).get("_id")
+        doc = change.get("fullDocument")
+
+        if operation == "delete" or doc is None:
+            self._apply(upserts=[], deleted_object_ids=[object_id])
+        else:
+            self._apply(upserts=[doc], deleted_object_ids=[])
+
+    async def _poll_once(self) -> None:
+        try:
+            if time.time() - self._last_full_reload >= TOPIC_FULL_RELOAD_INTERVAL:
+                # Polling theo updated-at không thấy được document bị xoá
+                await self.load_async()
+                return
+
+            since = self._snapshot.max_updated_at
+            if since is None:
+                return
+            docs = await async_mongo.find(
+                "qc_sentiment",
+                {TOPIC_UPDATED_AT_FIELD: {"$gt": since}},
+                TOPIC_PROJECTION,
+                stage="db.topics.poll",
+            )
+            if docs:
+                self._apply(upserts=docs, deleted_object_ids=[])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Topic polling refresh failed: {e}")
+
+    def _install_full(self, docs: Iterable[Dict[str, Any]]) -> TopicSnapshot:
+        topics: Dict[str, TopicEntry] = {}
+        object_ids: Dict[Any, str] = {}
+        max_updated_at = None
+        for doc in docs:
+            if not doc.get("topic_id"):
+                continue
+            entry = TopicEntry.from_document(doc)
+            topics[entry.topic_id] = entry
+            object_ids[doc.get("_id")] = entry.topic_id
+            max_updated_at = self._max_updated_at(max_updated_at, doc)
+
+        with self._write_lock:
+            self._object_ids = object_ids
+            self._snapshot = TopicSnapshot(
+                topics=MappingProxyType(topics),
+                version=self._snapshot.version + 1,
+                loaded_at=time.time(),
+                max_updated_at=max_updated_at,
+            )
+            self._loaded = True
+            self._last_full_reload = time.time()
+        return self._snapshot
+
+    def _apply(self, upserts: List[Dict[str, Any]], deleted_object_ids: List[Any]) -> None:
+        """Copy-on-write: build dict mới rồi swap snapshot"""
+        with self._write_lock:
+            topics = dict(self._snapshot.topics)
+            object_ids = dict(self._object_ids)
+            max_updated_at = self._snapshot.max_updated_at
+
+            for object_id in deleted_object_ids:
+                topic_id = object_ids.pop(object_id, None)
+                if topic_id is not None:
+                    topics.pop(topic_id, None)
+
+            for doc in upserts:
+                max_updated_at = self._max_updated_at(max_updated_at, doc)
+                object_id = doc.get("_id")
+                previous_topic_id = object_ids.pop(object_id, None)
+                if previous_topic_id is not None:
+                    topics.pop(previous_topic_id, None)
+                if not doc.get("topic_id") or doc.get(TOPIC_ACTIVE_FIELD) is False:
+                    continue
+                entry = TopicEntry.from_document(doc)
+                topics[entry.topic_id] = entry
+                object_ids[object_id] = entry.topic_id
+
+            self._object_ids = object_ids
+            self._snapshot = TopicSnapshot(
+                topics=MappingProxyType(topics),
+                version=self._snapshot.version + 1,
+                loaded_at=time.time(),
+                max_updated_at=max_updated_at,
+            )
+
+        logger.debug(f"Topic registry refreshed: {len(upserts)} upserts, {len(deleted_object_ids)} deletes")
+
+    @staticmethod
+    def _max_updated_at(current: Any, doc: Dict[str, Any]) -> Any:
+        updated_at = doc.get(TOPIC_UPDATED_AT_FIELD)
+        if updated_at is None:
+            return current
+        if current is None:
+            return updated_at
+        try:
+            return max(current, updated_at)
+        except TypeError:
+            return current
+
+
+# Global registry instance
+topic_registry = TopicRegistry()
@@ -0,0 +1,320 @@
+import atexit
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.config import (
+    LANGFUSE_SECRET_KEY,
+    LANGFUSE_PUBLIC_KEY,
+    LANGFUSE_HOST,
+    LANGFUSE_SAMPLE_RATE,
+    LANGFUSE_SAMPLE_ALWAYS_LEVEL,
+    LANGFUSE_BUFFER_SIZE,
+    LANGFUSE_EXPORT_BATCH,
+    LANGFUSE_EXPORT_INTERVAL,
+    LANGFUSE_MAX_SPANS,
+    LANGFUSE_MAX_METADATA,
+    LANGFUSE_MAX_FIELD_CHARS,
+)
+from app.metrics import TRACES, TRACE_SPANS_DROPPED, TRACE_BUFFERED
+
+# Langfuse là optional: không có package / key thì tracer tắt, mọi call là no-op
+try:
+    from langfuse import Langfuse
+    LANGFUSE_AVAILABLE = True
+except ImportError:
+    LANGFUSE_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Label children bind sẵn (labels() mỗi request tốn hơn cả phần ghi trace)
+_SAMPLED_OUT = TRACES.labels(status="sampled_out")
+_BUFFERED = TRACES.labels(status="buffered")
+_DROPPED = TRACES.labels(status="dropped")
+_SPAN_CAP = TRACE_SPANS_DROPPED.labels(reason="span_cap")
+_METADATA_CAP = TRACE_SPANS_DROPPED.labels(reason="metadata_cap")
+_BUFFER_FULL = TRACE_SPANS_DROPPED.labels(reason="buffer_full")
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("sentiment_trace", default=None)
+
+
+class Trace:
+    """
+    Trace của một request, chỉ giữ reference (không serialize, không I/O trên request path).
+    Số span / metadata key có giới hạn cứng; phần vượt bị bỏ và đếm vào metric
+    """
+
+    __slots__ = (
+        "id", "name", "user_id", "session_id", "input", "output", "metadata",
+        "spans", "error", "log_level", "started", "ended", "_token"
+    )
+
+    def __init__(self, trace_id: str, name: str, user_id: Optional[str], session_id: Optional[str], input: Any):
+        self.id = trace_id
+        self.name = name
+        self.user_id = user_id
+        self.session_id = session_id
+        self.input = input
+        self.output: Any = None
+        self.metadata: Dict[str, Any] = {}
+        self.spans: List[Tuple[str, float, float, Dict[str, Any]]] = []
+        self.error = False
+        self.log_level = 0
+        self.started = time.time()
+        self.ended = 0.0
+        self._token = None
+
+    def add_metadata(self, metadata: Dict[str, Any]) -> None:
+        room = LANGFUSE_MAX_METADATA - len(self.metadata)
+        if len(metadata) <= room or all(key in self.metadata for key in metadata):
+            self.metadata.update(metadata)
+            return
+        for key, value in metadata.items():
+            if key in self.metadata or len(self.metadata) < LANGFUSE_MAX_METADATA:
+                self.metadata[key] = value
+            else:
+                _METADATA_CAP.inc()
+
+
+class TraceSampler:
+    """
+    Tail sampling lúc request kết thúc: luôn giữ trace lỗi và trace có log_level >= always_level,
+    còn lại giữ theo tỉ lệ rate
+    """
+
+    def __init__(self, rate: float = LANGFUSE_SAMPLE_RATE, always_level: int = LANGFUSE_SAMPLE_ALWAYS_LEVEL):
+        self.rate = rate
+        self.always_level = always_level
+
+    def decide(self, trace: Trace) -> Optional[str]:
+        """Lý do giữ trace (error / alert / rate), None nếu bỏ"""
+        if trace.error:
+            return "error"
+        if trace.log_level >= self.always_level:
+            return "alert"
+        if self.rate > 0 and random.random() < self.rate:
+            return "rate"
+        return None
+
+
+def _clip(value: Any, depth: int = 0) -> Any:
+    """Cắt string dài / container lớn trước khi gửi (chạy trên exporter thread)"""
+    if hasattr(value, "model_dump"):
+        value = value.model_dump()
+    if isinstance(value, str):
+        return value if len(value) <= LANGFUSE_MAX_FIELD_CHARS else value[:LANGFUSE_MAX_FIELD_CHARS] + "…"
+    if depth >= 3:
+        return repr(value)[:LANGFUSE_MAX_FIELD_CHARS]
+    if isinstance(value, dict):
+        return {str(k): _clip(v, depth + 1) for k, v in list(value.items())[:LANGFUSE_MAX_METADATA]}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [_clip(v, depth + 1) for v in list(value)[:LANGFUSE_MAX_METADATA]]
+    return value
+
+
+def _timestamp(seconds: float) -> datetime:
+    return datetime.fromtimestamp(seconds, tz=timezone.utc)
+
+
+class Tracer:
+    """
+    Langfuse tracing không block request:
+    - request path chỉ ghi vào Trace trong contextvar (vài attribute / dict update)
+    - finish() quyết định sampling, trace được giữ vào ring buffer (deque có maxlen)
+    - thread nền export theo batch qua Langfuse SDK rồi flush; Langfuse chậm / lỗi chỉ làm
+      buffer đầy → trace cũ nhất bị drop (đếm metric), request không bao giờ chờ
+    """
+
+    def __init__(self, sampler: Optional[TraceSampler] = None, client: Any = None):
+        self.sampler = sampler or TraceSampler()
+        self.client = client
+        if self.client is None and LANGFUSE_AVAILABLE and LANGFUSE_SECRET_KEY and LANGFUSE_PUBLIC_KEY:
+            try:
+                self.client = Langfuse(
+                    secret_key=LANGFUSE_SECRET_KEY,
+                    public_key=LANGFUSE_PUBLIC_KEY,
+                    host=LANGFUSE_HOST
+                )
+            except Exception as e:
+                logger.warning(f"Failed to initialize Langfuse: {e}")
+        self.enabled = self.client is not None
+        self._buffer: Deque[Trace] = deque(maxlen=max(LANGFUSE_BUFFER_SIZE, 1))
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closing = False
+
+    # --- request path ---
+
+    def start(
+        self,
+        name: str,
+        trace_id: str,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        input: Any = None,
+        **metadata: Any
+    ) -> Optional[Trace]:
+        """Bắt đầu trace cho request hiện tại (context hiện tại); None nếu tracing tắt"""
+        if not self.enabled:
+            return None
+        trace = Trace(trace_id, name, user_id, session_id, input)
+        if metadata:
+            trace.add_metadata(metadata)
+        trace._token = _current.set(trace)
+        return trace
+
+    def update(self, output: Any = None, error: bool = False, log_level: Optional[int] = None, **metadata: Any) -> None:
+        """Ghi output / metadata vào trace của request hiện tại (no-op nếu không có)"""
+        trace = _current.get()
+        if trace is None:
+            return
+        if output is not None:
+            trace.output = output
+        if error:
+            trace.error = True
+        if log_level is not None:
+            trace.log_level = log_level
+        if metadata:
+            trace.add_metadata(metadata)
+
+    def span(self, name: str, started: float, ended: Optional[float] = None, **metadata: Any) -> None:
+        """Ghi một span (vd. LLM call) vào trace hiện tại; quá LANGFUSE_MAX_SPANS thì bỏ"""
+        trace = _current.get()
+        if trace is None:
+            return
+        if len(trace.spans) >= LANGFUSE_MAX_SPANS:
+            _SPAN_CAP.inc()
+            return
+        trace.spans.append((name, started, ended or time.time(), metadata))
+
+    def finish(self, trace: Optional[Trace]) -> None:
+        """Kết thúc trace: sampling rồi đưa vào ring buffer, không I/O"""
+        if trace is None:
+            return
+        if trace._token is not None:
+            try:
+                _current.reset(trace._token)
+            except ValueError:
+                # finish ở context khác context start (vd. task khác): chỉ clear
+                _current.set(None)
+            trace._token = None
+        trace.ended = time.time()
+
+        reason = self.sampler.decide(trace)
+        if reason is None:
+            _SAMPLED_OUT.inc()
+            return
+        trace.metadata["sampled_by"] = reason
+
+        if len(self._buffer) >= self._buffer.maxlen:
+            # deque(maxlen) tự bỏ trace cũ nhất khi append
+            _DROPPED.inc()
+            _BUFFER_FULL.inc(1 + len(self._buffer[0].spans))
+        self._buffer.append(trace)
+        _BUFFERED.inc()
+        if self._thread is None:
+            self._start_thread()
+        elif len(self._buffer) >= LANGFUSE_EXPORT_BATCH:
+            self._wakeup.set()
+
+    # --- exporter thread ---
+
+    def _start_thread(self) -> None:
+        with self._lock:
+            if self._thread is not None or self._closing:
+                return
+            self._thread = threading.Thread(target=self._run, name="langfuse-export", daemon=True)
+            self._thread.start()
+            # Scripts (sync analyze) không có lifespan: flush nốt khi process thoát
+            atexit.register(self.shutdown)
+
+    def start_exporter(self) -> None:
+        if self.enabled:
+            self._closing = False
+            self._start_thread()
+
+    def _run(self) -> None:
+        while not self._closing:
+            self._wakeup.wait(LANGFUSE_EXPORT_INTERVAL)
+            self._wakeup.clear()
+            self._export_all()
+
+    def _export_all(self) -> None:
+        while self._buffer:
+            batch = []
+            while self._buffer and len(batch) < LANGFUSE_EXPORT_BATCH:
+                try:
+                    batch.append(self._buffer.popleft())
+                except IndexError:
+                    break
+            TRACE_BUFFERED.set(len(self._buffer))
+            if batch:
+                self._export(batch)
+
+    def _export(self, batch: List[Trace]) -> None:
+        exported = 0
+        for trace in batch:
+            try:
+                client_trace = self.client.trace(
+                    id=trace.id,
+                    name=trace.name,
+                    user_id=trace.user_id,
+                    session_id=trace.session_id,
+                    input=_clip(trace.input),
+                    output=_clip(trace.output),
+                    metadata=_clip({
+                        **trace.metadata,
+                        "log_level": trace.log_level,
+                        "error": trace.error,
+                        "duration": round(trace.ended - trace.started, 4),
+                    }),
+                    timestamp=_timestamp(trace.started),
+                )
+                for name, started, ended, metadata in trace.spans:
+                    client_trace.span(
+                        name=name,
+                        start_time=_timestamp(started),
+                        end_time=_timestamp(ended),
+                        metadata=_clip(metadata),
+                    )
+                exported += 1
+            except Exception as e:
+                TRACES.labels(status="failed").inc()
+                TRACE_SPANS_DROPPED.labels(reason="export_error").inc(1 + len(trace.spans))
+                logger.warning(f"Langfuse export failed for trace {trace.id}: {e}")
+        try:
+            self.client.flush()
+        except Exception as e:
+            logger.warning(f"Langfuse flush failed: {e}")
+        TRACES.labels(status="exported").inc(exported)
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Dừng exporter thread, export nốt trace còn trong buffer (tối đa timeout giây)"""
+        self._closing = True
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        self._thread = None
+        if self._buffer and self.enabled:
+            self._export_all()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sampler.rate,
+            "always_level": self.sampler.always_level,
+            "buffered": len(self._buffer),
+            "buffer_size": self._buffer.maxlen,
+            "exporter_running": self._thread is not None and self._thread.is_alive(),
+        }
+
+
+# Global tracer instance
+tracer = Tracer()
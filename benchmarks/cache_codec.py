@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+So sánh format value trong Redis: bytes/entry và thời gian encode/decode
+
+- json_legacy:   json.dumps(result) như trước (ensure_ascii → tiếng Việt bị escape \\uXXXX)
+- msgpack:       tham khảo, nếu có package msgpack
+- compact:       app/cache_codec.py (header cố định + strings length-prefixed)
+- compact+zstd:  explanation nén zstd không dictionary
+- compact+dict:  explanation nén zstd với dictionary train trên một nửa samples, đo trên nửa còn lại
+
+    python benchmarks/cache_codec.py
+    python benchmarks/cache_codec.py --samples results.jsonl          # kết quả thật (vd. export sentiment_results)
+    python benchmarks/cache_codec.py --samples results.jsonl --train zstd_explanations.dict
+
+File dictionary dùng với CACHE_COMPRESSION=zstd CACHE_ZSTD_DICT=zstd_explanations.dict.
+Đổi dictionary → value nén bằng dictionary cũ bị coi như cache miss.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import timeit
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+# Ước tính overhead mỗi key trong Redis (dictEntry + robj + SDS header + expire entry), bytes
+REDIS_KEY_OVERHEAD = 80
+CACHE_KEY_LENGTH = len("sentiment:0123abcd:") + 32
+
+_ASPECTS = [
+    "chất lượng sản phẩm", "giá cả", "dịch vụ giao hàng", "thái độ nhân viên", "thời lượng pin",
+    "chế độ bảo hành", "thời gian chờ tài xế", "ứng dụng di động", "phần mềm sau cập nhật", "độ hoàn thiện",
+]
+_OPENINGS = [
+    "Người dùng bày tỏ sự {feeling} về {aspect} của {brand}",
+    "Bài viết đề cập trực tiếp tới {brand} và {feeling} với {aspect}",
+    "Tác giả chia sẻ trải nghiệm cá nhân, thể hiện sự {feeling} đối với {aspect} của {brand}",
+    "Bình luận nhắc tới {brand}, nội dung chủ yếu nói về {aspect} với thái độ {feeling}",
+]
+_DETAILS = [
+    ", đồng thời so sánh với đối thủ cùng phân khúc.",
+    ", tuy nhiên vẫn ghi nhận một số điểm tích cực khác.",
+    ". Các từ khoá như '{kw}' cho thấy cảm xúc rõ ràng.",
+    ", kèm theo lời khuyên cho người mua khác.",
+    ".",
+]
+_FEELINGS = {"positive": ["hài lòng", "hào hứng", "tin tưởng"], "negative": ["thất vọng", "bức xúc", "không hài lòng"]}
+_BRANDS = ["VinFast", "Be", "Shopee", "Viettel", "Grab", "Thế Giới Di Động"]
+_KEYWORDS = {
+    "positive": ["đáng tiền", "nhiệt tình", "giao nhanh", "chắc tay", "bền", "mượt"],
+    "negative": ["giật lag", "thất vọng", "pin yếu", "chờ lâu", "đắt", "lỗi"],
+}
+
+
+def synthetic_results(count: int, seed: int = 42) -> List[Dict]:
+    """Kết quả giả lập giống output LLM thật (explanation tiếng Việt 1-2 câu)"""
+    rng = random.Random(seed)
+    results = []
+    for _ in range(count):
+        sentiment = rng.choices(["positive", "negative", "neutral"], weights=[3, 4, 3])[0]
+        if sentiment == "neutral":
+            results.append({
+                "targeted": False,
+                "sentiment": "neutral",
+                "confidence": rng.choice([0.3, 0.4, 0.5]),
+                "keywords": {"positive": [], "negative": []},
+                "explanation": rng.choice([
+                    "Không có nội dung liên quan đến từ khóa chính",
+                    f"Bài viết chỉ nhắc tới {rng.choice(_BRANDS)} như thông tin, không thể hiện cảm xúc rõ ràng.",
+                ]),
+            })
+            continue
+        keywords = rng.sample(_KEYWORDS[sentiment], rng.randint(1, 3))
+        explanation = rng.choice(_OPENINGS).format(
+            feeling=rng.choice(_FEELINGS[sentiment]), aspect=rng.choice(_ASPECTS), brand=rng.choice(_BRANDS)
+        ) + rng.choice(_DETAILS).format(kw=keywords[0])
+        results.append({
+            "targeted": True,
+            "sentiment": sentiment,
+            "confidence": round(rng.uniform(0.6, 0.95), 2),
+            "keywords": {sentiment: keywords, ("negative" if sentiment == "positive" else "positive"): []},
+            "explanation": explanation,
+        })
+    return results
+
+
+def load_samples(path: Path) -> List[Dict]:
+    """JSONL các result (field 'result' nếu là record của result store)"""
+    fields = ("targeted", "sentiment", "confidence", "keywords", "explanation")
+    samples = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            record = json.loads(line)
+            record = record.get("result", record)
+            samples.append({k: record[k] for k in fields if k in record})
+    return samples
+
+
+def measure(name: str, encode, decode, results: List[Dict]) -> Dict:
+    encoded = [encode(r) for r in results]
+    sizes = [len(e) for e in encoded]
+    number = 20
+    encode_time = min(timeit.repeat(lambda: [encode(r) for r in results], number=number, repeat=5))
+    decode_time = min(timeit.repeat(lambda: [decode(e) for e in encoded], number=number, repeat=5))
+    per_entry = statistics.mean(sizes)
+    return {
+        "format": name,
+        "bytes_mean": per_entry,
+        "bytes_p95": sorted(sizes)[int(len(sizes) * 0.95) - 1],
+        "encode_us": encode_time / number / len(results) * 1e6,
+        "decode_us": decode_time / number / len(results) * 1e6,
+        "entries_per_gb": int(2 ** 30 / (per_entry + CACHE_KEY_LENGTH + REDIS_KEY_OVERHEAD)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache value encoding benchmark")
+    parser.add_argument("--samples", type=Path, default=None, help="JSONL kết quả thật; mặc định dữ liệu giả lập")
+    parser.add_argument("--count", type=int, default=2000, help="Số kết quả giả lập")
+    parser.add_argument("--dict-size", type=int, default=16 * 1024)
+    parser.add_argument("--train", type=Path, default=None, help="Ghi zstd dictionary train trên toàn bộ samples")
+    args = parser.parse_args()
+
+    from app.cache_codec import CacheCodec, ZSTD_AVAILABLE, train_dictionary
+
+    results = load_samples(args.samples) if args.samples else synthetic_results(args.count)
+    train, test = results[::2], results[1::2]
+    expiry = 1_900_000_000.0
+
+    formats = [("json_legacy", lambda r: json.dumps(r).encode(), json.loads)]
+    if MSGPACK_AVAILABLE:
+        formats.append(("msgpack", msgpack.packb, msgpack.unpackb))
+    compact = CacheCodec(compression="none")
+    formats.append(("compact", lambda r: compact.encode(r, 1.2, expiry), compact.decode))
+
+    dict_path = None
+    if ZSTD_AVAILABLE:
+        plain_zstd = CacheCodec(compression="zstd", dict_path="")
+        formats.append(("compact+zstd", lambda r: plain_zstd.encode(r, 1.2, expiry), plain_zstd.decode))
+        dict_path = ROOT / "benchmarks" / "results" / "zstd_bench.dict"
+        dict_path.parent.mkdir(parents=True, exist_ok=True)
+        dict_path.write_bytes(train_dictionary([r.get("explanation", "") for r in train], args.dict_size))
+        with_dict = CacheCodec(compression="zstd", dict_path=str(dict_path))
+        formats.append(("compact+dict", lambda r: with_dict.encode(r, 1.2, expiry), with_dict.decode))
+    else:
+        print("zstandard không có: bỏ qua các format nén")
+
+    print(f"{len(test)} entries ({'samples' if args.samples else 'synthetic'}), dict train trên {len(train)} entries")
+    print(f"{'format':<14}{'bytes':>8}{'p95':>8}{'encode µs':>11}{'decode µs':>11}{'entries/GB':>13}")
+    for name, encode, decode in formats:
+        row = measure(name, encode, decode, test)
+        print(
+            f"{row['format']:<14}{row['bytes_mean']:>8.1f}{row['bytes_p95']:>8}"
+            f"{row['encode_us']:>11.2f}{row['decode_us']:>11.2f}{row['entries_per_gb']:>13,}"
+        )
+    print(f"(entries/GB ước tính với key {CACHE_KEY_LENGTH} bytes + ~{REDIS_KEY_OVERHEAD} bytes overhead Redis mỗi key)")
+
+    if dict_path is not None:
+        dict_path.unlink(missing_ok=True)
+    if args.train:
+        args.train.write_bytes(train_dictionary([r.get("explanation", "") for r in results], args.dict_size))
+        print(f"\nSaved zstd dictionary to {args.train}")
+
+
+if __name__ == "__main__":
+    main()
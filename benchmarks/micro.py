@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks cho CPU hot path chạy trên mọi request: keyword matching, merge text,
+normalize, cache key, parse JSON từ LLM, format_output, pydantic models.
+Input tiếng Việt thực tế với độ dài (short / medium / long) và số keywords (1 / 5 / 20) khác nhau.
+
+Dùng pyperf nếu có (khuyến nghị, chạy nhiều process và tự calibrate):
+    python benchmarks/micro.py --fast -o benchmarks/results/micro_before.json
+    python benchmarks/micro.py --fast -o benchmarks/results/micro_after.json --filter mentions_keyword
+    python benchmarks/micro.py --compare benchmarks/results/micro_before.json benchmarks/results/micro_after.json
+    (hoặc: python -m pyperf compare_to micro_before.json micro_after.json --table)
+
+Không có pyperf → fallback timeit trong một process (--quick để chạy nhanh), cùng format --compare
+"""
+import argparse
+import hashlib
+import json
+import re
+import statistics
+import sys
+import timeit
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+try:
+    import pyperf
+    PYPERF_AVAILABLE = True
+except ImportError:
+    PYPERF_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# ---------------------------------------------------------------------------
+# Inputs
+# ---------------------------------------------------------------------------
+SENTENCES = [
+    "Mình vừa mua máy lọc không khí về dùng thử được hai tuần",
+    "Nhân viên tư vấn nhiệt tình, giao hàng nhanh, đóng gói cẩn thận",
+    "Tuy nhiên pin hơi yếu, sạc đầy chỉ dùng được khoảng nửa ngày",
+    "Giá hiện tại khoảng mười mấy triệu, hơi cao so với mặt bằng chung",
+    "Ai có kinh nghiệm dùng lâu rồi cho mình xin ý kiến với!",
+    "Dịch vụ bảo hành ổn, gọi tổng đài là có người nghe máy ngay",
+    "Hôm qua đặt xe mà chờ gần ba mươi phút mới có tài xế nhận chuyến",
+    "Chất lượng hoàn thiện tốt hơn mình nghĩ, cầm rất chắc tay",
+    "Cập nhật phần mềm xong thì máy hay bị giật lag, khá thất vọng",
+    "Nói chung đáng tiền, sẽ giới thiệu cho bạn bè và người thân",
+]
+
+KEYWORD_SETS = {
+    "kw1": ["vinfast"],
+    "kw5": ["vinfast", "vf8", "vin fast", "vf e34", "xe điện vinfast"],
+    "kw20": [
+        "vinfast", "vf8", "vin fast", "vf e34", "xe điện vinfast", "vf9", "vf5 plus", "vf3",
+        "klara", "evo200", "feliz", "theon s", "vento s", "lux a2.0", "lux sa2.0", "fadil",
+        "president", "vinfast ec van", "trạm sạc vinfast", "vinfast global",
+    ],
+}
+
+
+def build_text(length: str, mention: bool) -> str:
+    count = {"short": 1, "medium": 8, "long": 80}[length]
+    parts = [SENTENCES[i % len(SENTENCES)] for i in range(count)]
+    if mention:
+        # Keyword nằm cuối text → trường hợp xấu nhất cho substring scan
+        parts[-1] = parts[-1] + " của VinFast"
+    return ". ".join(parts) + "."
+
+
+TEXTS = {
+    (length, mention): build_text(length, mention)
+    for length in ("short", "medium", "long")
+    for mention in (True, False)
+}
+
+LLM_RESPONSES = {
+    "clean": json.dumps({
+        "targeted": True,
+        "sentiment": "negative",
+        "confidence": 0.82,
+        "keywords": {"positive": [], "negative": ["giật lag", "thất vọng"]},
+        "explanation": "Người dùng phàn nàn về lỗi phần mềm sau cập nhật",
+    }, ensure_ascii=False),
+}
+LLM_RESPONSES["wrapped"] = "Đây là kết quả phân tích:\n```json\n" + LLM_RESPONSES["clean"] + "\n```\nHy vọng hữu ích."
+LLM_RESPONSES["invalid"] = "Xin lỗi, tôi không thể phân tích nội dung này {targeted: true"
+
+
+def legacy_cache_key(data: Dict) -> str:
+    """Cache key cũ (json.dumps sort_keys + md5) để so sánh với fingerprint"""
+    cache_data = {
+        "index": data.get("index", ""),
+        "merged_text": data.get("merged_text", ""),
+        "type": data.get("type", ""),
+        "main_keywords": sorted(data.get("main_keywords", [])),
+    }
+    return f"sentiment:{hashlib.md5(json.dumps(cache_data, sort_keys=True).encode()).hexdigest()}"
+
+
+def legacy_dedup_merge_text(*parts: str) -> str:
+    """dedup_merge_text cũ (re.split + re.sub normalize + set các câu đã normalize) để so sánh"""
+    seen = set()
+    merged = []
+    for part in parts:
+        if not part:
+            continue
+        for s in re.split(r"[.!?]", part):
+            s_clean = re.sub(r"\s+", " ", s.lower()).strip()
+            if s_clean and s_clean not in seen:
+                seen.add(s_clean)
+                merged.append(s.strip())
+    return ". ".join(merged)
+
+
+def drive(coroutine):
+    """Chạy coroutine không await gì (vd. keyword-miss path của run_analysis) mà không cần event loop"""
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coroutine.close()
+    raise RuntimeError("coroutine suspended: path không còn là short-circuit")
+
+
+def request_body(length: str, keywords: str = "kw5") -> Dict:
+    text = TEXTS[(length, True)]
+    return {
+        "id": "bench_0001",
+        "index": "6641ccbdf4901a7ae602197f",
+        "title": SENTENCES[0],
+        "content": text,
+        "description": SENTENCES[3],
+        "type": "fbGroupTopic",
+        "main_keywords": KEYWORD_SETS[keywords],
+    }
+
+
+# ---------------------------------------------------------------------------
+# Cases
+# ---------------------------------------------------------------------------
+def synthetic_topic_snapshot(count: int):
+    """count topics, mỗi topic 5 keywords; topic 0 là bộ keyword VinFast dùng trong TEXTS"""
+    from types import MappingProxyType
+    from app.topics import TopicEntry, TopicSnapshot
+
+    docs = [{"topic_id": "0", "topic_name": "vinfast", "keywords": KEYWORD_SETS["kw5"]}]
+    for i in range(1, count):
+        docs.append({
+            "topic_id": str(i),
+            "topic_name": f"brand {i}",
+            "keywords": [f"brand{i}", f"brand {i}", f"sản phẩm brand{i}", f"b{i} shop", f"brand{i} official"],
+        })
+    topics = {doc["topic_id"]: TopicEntry.from_document(doc) for doc in docs}
+    return TopicSnapshot(topics=MappingProxyType(topics), version=1)
+
+
+def build_cases() -> List[Tuple[str, Callable, tuple]]:
+    """Danh sách (tên, hàm, args); import app lười để --help không cần dependencies"""
+    from app.services.sentiment_service import SentimentAnalysisService, sentiment_service
+    from app.cache import cache
+    from app.fingerprint import Fingerprint
+    from app.topics import compile_keyword_matcher
+    from app.topic_index import TopicIndex
+    from app.nodes.analyze_with_llm import parse_llm_response
+    from app.nodes.format_output import format_output
+    from app.schemas import SentimentRequest, SentimentResponse
+
+    service = SentimentAnalysisService
+    cases: List[Tuple[str, Callable, tuple]] = []
+
+    for length in ("short", "medium", "long"):
+        text = TEXTS[(length, True)]
+        cases.append((f"normalize/{length}", service.normalize, (text,)))
+        cases.append((f"dedup_merge_text/{length}", service.dedup_merge_text, (SENTENCES[0], text, SENTENCES[3])))
+        cases.append((f"dedup_merge_text_legacy/{length}", legacy_dedup_merge_text, (SENTENCES[0], text, SENTENCES[3])))
+        cache_data = {
+            "index": "6641ccbdf4901a7ae602197f",
+            "merged_text": text,
+            "type": "fbGroupTopic",
+            "main_keywords": KEYWORD_SETS["kw5"],
+        }
+        cases.append((f"cache_key/{length}", cache._generate_cache_key, (cache_data,)))
+        cases.append((f"cache_key_legacy_md5/{length}", legacy_cache_key, (cache_data,)))
+        for kw_name in ("kw1", "kw20"):
+            cases.append((
+                f"fingerprint/{length}/{kw_name}",
+                Fingerprint.build,
+                (text, "fbGroupTopic", KEYWORD_SETS[kw_name], "ns"),
+            ))
+
+    for length in ("short", "medium", "long"):
+        for kw_name, keywords in KEYWORD_SETS.items():
+            for mention in (True, False):
+                label = "hit" if mention else "miss"
+                text = TEXTS[(length, mention)]
+                cases.append((f"mentions_keyword/{length}/{kw_name}/{label}", service.mentions_keyword, (text, keywords)))
+                matcher = compile_keyword_matcher(keywords)
+                normalized = service.normalize(text)
+                cases.append((f"topic_matcher/{length}/{kw_name}/{label}", matcher.search, (normalized,)))
+
+    # /topics/match: một automaton cho mọi topic vs match từng topic (N lần quét text)
+    for topic_count in (100, 2000):
+        snapshot = synthetic_topic_snapshot(topic_count)
+        index = TopicIndex(snapshot)
+        entries = list(snapshot.topics.values())
+        for length in ("medium", "long"):
+            normalized = service.normalize(TEXTS[(length, True)])
+            cases.append((f"topic_index/{length}/{topic_count}topics", index.match, (normalized,)))
+            cases.append((
+                f"topic_loop/{length}/{topic_count}topics",
+                lambda text, entries=entries: [e.topic_id for e in entries if e.mentions(text)],
+                (normalized,),
+            ))
+
+    # Fuzzy matching chỉ chạy khi exact / word-boundary match thất bại
+    for length in ("short", "medium", "long"):
+        normalized = service.normalize(TEXTS[(length, False)])
+        cases.append((f"fuzzy_keyword_match/{length}/multiword", service._fuzzy_keyword_match, (normalized, "xe điện vinfast")))
+        cases.append((f"fuzzy_keyword_match/{length}/mapped", service._fuzzy_keyword_match, (normalized, "be app")))
+
+    # Keyword miss (path phổ biến nhất): run_analysis trả kết quả tính sẵn, không qua scheduler / cache.
+    # 1e6 / µs = request/giây/core cho phần việc trong app (chưa tính HTTP server)
+    from app.api import run_analysis
+    from app.services.sentiment_service import no_mention_result
+    for length in ("short", "medium", "long"):
+        miss = SentimentRequest(**{**request_body(length, "kw1"), "content": TEXTS[(length, False)]})
+        cases.append((f"keyword_miss/run_analysis/{length}", lambda r=miss: drive(run_analysis(None, r, None)), ()))
+    # Việc cũ mỗi request trên path này: dựng SentimentResponse → dict → serialize
+    cases.append((
+        "keyword_miss/pydantic_response",
+        lambda: orjson.dumps(SentimentResponse(**no_mention_result()).model_dump()) if ORJSON_AVAILABLE
+        else json.dumps(SentimentResponse(**no_mention_result()).model_dump()),
+        (),
+    ))
+
+    for kind, raw in LLM_RESPONSES.items():
+        cases.append((f"extract_json/{kind}", sentiment_service.extract_json, (raw,)))
+        cases.append((f"parse_llm_response/{kind}", parse_llm_response, (raw,)))
+
+    llm_targeted = json.loads(LLM_RESPONSES["clean"])
+    states = {
+        "targeted_negative": {"input_data": {"type": "fbGroupTopic"}, "llm_analysis": dict(llm_targeted, index="x")},
+        "not_targeted": {"input_data": {"type": "newsComment"}, "llm_analysis": {"targeted": False, "index": "x"}},
+    }
+    for name, state in states.items():
+        cases.append((f"format_output/{name}", format_output, (state,)))
+
+    for length in ("short", "long"):
+        body = request_body(length)
+        raw = json.dumps(body, ensure_ascii=False)
+        cases.append((f"pydantic/SentimentRequest/{length}", lambda b=body: SentimentRequest(**b), ()))
+        cases.append((f"pydantic/SentimentRequest_json/{length}", SentimentRequest.model_validate_json, (raw,)))
+        # Request parsing: body param mặc định của FastAPI (json.loads → model) vs parse_body
+        cases.append((f"request/json_loads_model/{length}", lambda r=raw: SentimentRequest(**json.loads(r)), ()))
+        cases.append((f"request/model_validate_json/{length}", SentimentRequest.model_validate_json, (raw,)))
+    response = SentimentResponse(**llm_targeted)
+    cases.append(("pydantic/SentimentResponse", lambda r=llm_targeted: SentimentResponse(**r), ()))
+    # Response: response_model (validate lại + json.dumps) vs dict → orjson (ORJSONResponse)
+    cases.append((
+        "response/model_json_dumps",
+        lambda r=llm_targeted: json.dumps(SentimentResponse(**r).model_dump(mode="json"), ensure_ascii=False).encode(),
+        (),
+    ))
+    if ORJSON_AVAILABLE:
+        cases.append(("response/orjson_dict", orjson.dumps, (llm_targeted,)))
+    cases.append(("pydantic/SentimentResponse_dump", response.model_dump, ()))
+    cases.append(("pydantic/SentimentResponse_dump_json", response.model_dump_json, ()))
+
+    return cases
+
+
+# ---------------------------------------------------------------------------
+# Runners
+# ---------------------------------------------------------------------------
+def run_timeit(cases, quick: bool) -> Dict[str, Dict]:
+    """Fallback không có pyperf: autorange + lặp lại, báo cáo theo µs / call"""
+    repeat = 3 if quick else 7
+    results = {}
+    for name, func, args in cases:
+        timer = timeit.Timer(lambda: func(*args))
+        number, _ = timer.autorange()
+        if quick:
+            number = max(1, number // 5)
+        values = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+        results[name] = {"mean": statistics.mean(values), "min": min(values), "stdev": statistics.pstdev(values)}
+        print(f"{name:<60}{results[name]['mean'] * 1e6:>12.3f} µs ± {results[name]['stdev'] * 1e6:.3f}")
+    return results
+
+
+def load_results(path: Path) -> Dict[str, float]:
+    """Đọc kết quả (pyperf JSON hoặc format fallback) → {name: mean seconds}"""
+    data = json.loads(path.read_text())
+    if isinstance(data.get("benchmarks"), list):
+        # pyperf: mỗi benchmark có nhiều runs, mỗi run nhiều values
+        means = {}
+        for bench in data["benchmarks"]:
+            name = bench.get("metadata", {}).get("name") or data.get("metadata", {}).get("name")
+            values = [v for run in bench.get("runs", []) for v in run.get("values", [])]
+            if name and values:
+                means[name] = statistics.mean(values)
+        return means
+    return {name: result["mean"] for name, result in data.get("benchmarks", {}).items()}
+
+
+def compare(before_path: Path, after_path: Path) -> None:
+    before, after = load_results(before_path), load_results(after_path)
+    print(f"{'benchmark':<60}{'before µs':>12}{'after µs':>12}{'speedup':>10}")
+    for name in sorted(set(before) & set(after)):
+        old, new = before[name], after[name]
+        print(f"{name:<60}{old * 1e6:>12.3f}{new * 1e6:>12.3f}{old / new:>9.2f}x")
+    only = sorted(set(before) ^ set(after))
+    if only:
+        print(f"\nChỉ có ở một bên: {', '.join(only)}")
+
+
+def main():
+    if "--compare" in sys.argv:
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--compare", nargs=2, type=Path, metavar=("BEFORE", "AFTER"), required=True)
+        args = parser.parse_args()
+        compare(*args.compare)
+        return
+
+    if PYPERF_AVAILABLE:
+        def add_cmdline_args(cmd, args):
+            if args.filter:
+                cmd.extend(("--filter", args.filter))
+
+        runner = pyperf.Runner(add_cmdline_args=add_cmdline_args)
+        runner.argparser.add_argument("--filter", default="", help="Chỉ chạy benchmark có tên chứa chuỗi này")
+        args = runner.parse_args()
+        for name, func, call_args in build_cases():
+            if args.filter in name:
+                runner.bench_func(name, func, *call_args)
+        return
+
+    parser = argparse.ArgumentParser(description="CPU hot path micro-benchmarks (fallback timeit)")
+    parser.add_argument("--filter", default="")
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("-o", "--output", type=Path, default=None)
+    args, _ = parser.parse_known_args()
+    print("pyperf không có, dùng timeit fallback (kết quả kém ổn định hơn)")
+    cases = [case for case in build_cases() if args.filter in case[0]]
+    results = run_timeit(cases, args.quick)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps({"runner": "timeit", "benchmarks": results}, indent=2))
+        print(f"\nSaved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Deterministic replay benchmark cho Sentiment Analysis API
+
+Chạy app in-process (httpx ASGITransport, không qua network / nginx) với LLM là mock
+OpenAI-compatible server local (mock_llm_server.py), replay traffic corpus đã ghi lại và
+đo throughput, p50/p95/p99, CPU/request cho từng path:
+
+- keyword_miss: text không nhắc tới keyword → trả về ngay, không gọi LLM
+- llm:          cache trống → gọi LLM (mock)
+- cache_hit:    replay lại các request của phase llm → trả từ cache
+- replay:       toàn bộ corpus theo thứ tự ghi lại (mix các path)
+
+    python benchmarks/replay.py --output benchmarks/results/baseline.json
+    python benchmarks/replay.py --compare benchmarks/results/baseline.json
+    python benchmarks/replay.py --mock-distribution lognormal --mock-latency 0.8 --mock-error-rate 0.02
+
+CPU/request là CPU time của process benchmark (app + client in-process), không tính mock server.
+Mặc định Redis bị tắt (cache in-memory) để kết quả không phụ thuộc môi trường; dùng --redis để bật.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_CORPUS = ROOT / "benchmarks" / "corpus" / "traffic.jsonl"
+
+# Các chỉ số so sánh với baseline: (key, chiều "tốt hơn")
+COMPARED_METRICS = [
+    ("throughput_rps", "higher"),
+    ("p50_ms", "lower"),
+    ("p95_ms", "lower"),
+    ("p99_ms", "lower"),
+    ("cpu_per_request_ms", "lower"),
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def load_corpus(path: Path, limit: Optional[int] = None) -> List[Dict]:
+    """
+    Mỗi dòng là {"ts": ..., "endpoint": "/analyze", "body": {...}} hoặc trực tiếp request body
+    (ví dụ export từ access log). Dòng không phải request hợp lệ bị bỏ qua
+    """
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            body = record.get("body", record)
+            if not isinstance(body, dict) or "id" not in body or "type" not in body:
+                continue
+            items.append({
+                "ts": float(record.get("ts", len(items))),
+                "endpoint": record.get("endpoint", "/analyze"),
+                "body": body,
+            })
+            if limit and len(items) >= limit:
+                break
+    return items
+
+
+def content_key(body: Dict) -> str:
+    """Request trùng nội dung (khác id) cho cùng kết quả / cache key"""
+    return json.dumps({k: v for k, v in body.items() if k != "id"}, sort_keys=True, ensure_ascii=False)
+
+
+def unique(items: List[Dict]) -> List[Dict]:
+    seen = set()
+    result = []
+    for item in items:
+        key = content_key(item["body"])
+        if key not in seen:
+            seen.add(key)
+            result.append(item)
+    return result
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    if not ordered:
+        return 0.0
+    # Nearest-rank percentile
+    index = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: List[float], wall: float, cpu: float, statuses: Dict[str, int]) -> Dict:
+    ordered = sorted(latencies)
+    count = len(ordered)
+    return {
+        "requests": count,
+        "statuses": statuses,
+        "wall_s": round(wall, 4),
+        "throughput_rps": round(count / wall, 2) if wall > 0 else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        "cpu_per_request_ms": round(cpu / count * 1000, 4) if count else 0.0,
+    }
+
+
+def git_revision() -> Dict:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, text=True).strip())
+        return {"commit": commit, "dirty": dirty}
+    except Exception:
+        return {"commit": None, "dirty": None}
+
+
+def start_mock_server(args, port: int) -> subprocess.Popen:
+    command = [
+        sys.executable, str(ROOT / "mock_llm_server.py"),
+        "--host", "127.0.0.1",
+        "--port", str(port),
+        "--name", "bench-mock",
+        "--distribution", args.mock_distribution,
+        "--latency", str(args.mock_latency),
+        "--jitter", str(args.mock_jitter),
+        "--tail-rate", str(args.mock_tail_rate),
+        "--tail-latency", str(args.mock_tail_latency),
+        "--error-rate", str(args.mock_error_rate),
+        "--completion-tokens", str(args.mock_completion_tokens),
+        "--seed", str(args.seed),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Mock LLM server exited: {process.stderr.read().decode()}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Mock LLM server did not start in time")
+
+
+def configure_environment(args, llm_url: str) -> None:
+    """Phải gọi trước khi import app (config đọc env lúc import)"""
+    os.environ.update({
+        "OPENAI_URI": llm_url,
+        "OPENAI_API_KEY": os.environ.get("BENCH_OPENAI_API_KEY", "bench"),
+        "LLM_MODEL": os.environ.get("BENCH_LLM_MODEL", "mock-model"),
+        "OPENAI_MAX_RETRIES": "0",
+        "LLM_ENDPOINTS": "",
+        "RATE_LIMIT_ENABLED": "false",
+        "RESULT_STORE_ENABLED": "false",
+        "LANGFUSE_SECRET_KEY": "",
+        "LANGFUSE_PUBLIC_KEY": "",
+        "LOG_LEVEL": "WARNING",
+    })
+    if not args.redis:
+        # Port không có Redis → cache fallback in-memory
+        os.environ["REDIS_URL"] = "redis://127.0.0.1:1"
+    sys.path.insert(0, str(ROOT))
+
+
+async def run_phase(client, items: List[Dict], concurrency: int, paced: bool = False, speed: float = 1.0) -> Dict:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+
+    started = time.perf_counter()
+    first_ts = items[0]["ts"] if items else 0.0
+
+    async def worker():
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if paced:
+                # Giữ khoảng cách thời gian như traffic ghi lại (chia theo speed)
+                delay = (item["ts"] - first_ts) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            request_started = time.perf_counter()
+            try:
+                response = await client.post(item["endpoint"], json=item["body"])
+                status = str(response.status_code)
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - request_started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    cpu_started = time.process_time()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    return summarize(latencies, wall, cpu, statuses)
+
+
+def with_round(items: List[Dict], round_index: int) -> List[Dict]:
+    return [dict(item, body=dict(item["body"], id=f"{item['body']['id']}_r{round_index}")) for item in items]
+
+
+async def run_benchmark(args, corpus: List[Dict]) -> Dict:
+    import httpx
+    from app.api import app
+    from app.cache import cache
+    from app.http_pool import http_pool
+    from app.services.sentiment_service import sentiment_service
+    from app.schemas import SentimentRequest
+
+    # Phân loại path theo đúng logic keyword gate của service
+    def mentions(item: Dict) -> bool:
+        request = SentimentRequest(**item["body"])
+        text, _ = sentiment_service.select_text(request)
+        return sentiment_service.mentions_keyword(text, request.main_keywords)
+
+    miss_items = unique([item for item in corpus if not mentions(item)])
+    llm_items = unique([item for item in corpus if mentions(item)])
+
+    transport = httpx.ASGITransport(app=app)
+    phases: Dict[str, Dict] = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+        # Warmup: import lười, JIT cache của regex, connection tới mock server
+        cache.clear()
+        await run_phase(client, (llm_items + miss_items)[:args.warmup], args.concurrency)
+
+        def merge(name: str, results: List[Dict]) -> None:
+            # Gộp nhiều round: cộng requests / wall / statuses, lấy trung vị của percentiles
+            merged = dict(results[0])
+            if len(results) > 1:
+                merged["requests"] = sum(r["requests"] for r in results)
+                merged["wall_s"] = round(sum(r["wall_s"] for r in results), 4)
+                merged["throughput_rps"] = round(merged["requests"] / merged["wall_s"], 2)
+                statuses: Dict[str, int] = {}
+                for r in results:
+                    for status, count in r["statuses"].items():
+                        statuses[status] = statuses.get(status, 0) + count
+                merged["statuses"] = statuses
+                for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms", "cpu_per_request_ms"):
+                    values = sorted(r[key] for r in results)
+                    merged[key] = values[len(values) // 2]
+            phases[name] = merged
+
+        for name, items, clear_before in (
+            ("keyword_miss", miss_items, True),
+            ("llm", llm_items, True),
+            ("cache_hit", llm_items, False),
+        ):
+            if not items:
+                continue
+            results = []
+            for round_index in range(args.rounds):
+                # cache_hit dùng cache đã được phase llm làm nóng
+                if clear_before:
+                    cache.clear()
+                results.append(await run_phase(client, with_round(items, round_index), args.concurrency))
+            merge(name, results)
+
+        results = []
+        for round_index in range(args.rounds):
+            cache.clear()
+            results.append(await run_phase(
+                client, with_round(corpus, round_index), args.concurrency, paced=args.paced, speed=args.speed
+            ))
+        merge("replay", results)
+
+    await http_pool.aclose()
+    return phases
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Trả về danh sách regression vượt ngưỡng (tương đối) so với baseline"""
+    regressions = []
+    print(f"\n{'phase':<14}{'metric':<22}{'baseline':>12}{'current':>12}{'change':>10}")
+    for phase, metrics in current["phases"].items():
+        base = baseline.get("phases", {}).get(phase)
+        if not base:
+            continue
+        for key, better in COMPARED_METRICS:
+            old, new = base.get(key), metrics.get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change < -threshold if better == "higher" else change > threshold
+            marker = "  REGRESSION" if worse else ""
+            print(f"{phase:<14}{key:<22}{old:>12.3f}{new:>12.3f}{change:>+9.1%}{marker}")
+            if worse:
+                regressions.append(f"{phase}.{key}: {old} → {new} ({change:+.1%})")
+    return regressions
+
+
+def print_summary(phases: Dict) -> None:
+    print(f"\n{'phase':<14}{'requests':>9}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'cpu/req ms':>12}  statuses")
+    for name, m in phases.items():
+        print(
+            f"{name:<14}{m['requests']:>9}{m['throughput_rps']:>10.1f}{m['p50_ms']:>10.2f}"
+            f"{m['p95_ms']:>10.2f}{m['p99_ms']:>10.2f}{m['cpu_per_request_ms']:>12.3f}  {m['statuses']}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic replay benchmark với mock LLM server")
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS)
+    parser.add_argument("--limit", type=int, default=None, help="Chỉ dùng N request đầu của corpus")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=3, help="Số lần lặp mỗi phase")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--paced", action="store_true", help="Replay phase theo timestamp của corpus")
+    parser.add_argument("--speed", type=float, default=1.0, help="Hệ số tăng tốc khi --paced")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--redis", action="store_true", help="Dùng REDIS_URL hiện tại thay vì cache in-memory")
+    parser.add_argument("--llm-url", default=None, help="Dùng LLM server có sẵn thay vì tự chạy mock")
+    parser.add_argument("--mock-distribution", choices=["uniform", "lognormal", "fixed"], default="lognormal")
+    parser.add_argument("--mock-latency", type=float, default=0.3)
+    parser.add_argument("--mock-jitter", type=float, default=0.3)
+    parser.add_argument("--mock-tail-rate", type=float, default=0.01)
+    parser.add_argument("--mock-tail-latency", type=float, default=3.0)
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    parser.add_argument("--mock-completion-tokens", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None, help="Ghi kết quả JSON (baseline)")
+    parser.add_argument("--compare", type=Path, default=None, help="So sánh với baseline JSON")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Ngưỡng regression tương đối")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus, args.limit)
+    if not corpus:
+        sys.exit(f"Corpus rỗng: {args.corpus}")
+
+    mock = None
+    llm_url = args.llm_url
+    if llm_url is None:
+        port = free_port()
+        mock = start_mock_server(args, port)
+        llm_url = f"http://127.0.0.1:{port}/v1"
+
+    try:
+        configure_environment(args, llm_url)
+        # Trước khi import app: basicConfig(INFO) của app không ghi đè, log mỗi request không làm nhiễu số đo
+        logging.basicConfig(level=logging.WARNING)
+        phases = asyncio.run(run_benchmark(args, corpus))
+    finally:
+        if mock is not None:
+            mock.terminate()
+            mock.wait(timeout=10)
+
+    result = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "corpus": str(args.corpus),
+            "corpus_size": len(corpus),
+            "args": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+        },
+        "phases": phases,
+    }
+    print_summary(phases)
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(result, indent=2, ensure_ascii=False))
+        print(f"\nSaved results to {args.output}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        print(f"\nCompare with {args.compare} (git {baseline.get('meta', {}).get('git', {}).get('commit')})")
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nNo regressions above threshold")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Mock OpenAI-compatible LLM server cho test / benchmark LLM router (không tốn tiền LLM)
+
+    python mock_llm_server.py --port 9001 --latency 0.8 --error-rate 0.05
+    LLM_ENDPOINTS='[{"name": "mock-a", "base_url": "http://localhost:9001/v1", "api_key": "x"}]'
+
+Hỗ trợ POST /v1/chat/completions (non-streaming), GET /v1/models, GET /health và
+POST /admin/config để đổi latency / error rate lúc đang chạy (giả lập backend xuống cấp)
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Mock OpenAI-compatible LLM")
+
+# Cấu hình hiện tại (đổi được qua /admin/config)
+settings = {
+    "name": "mock",
+    "model": "mock-model",
+    "distribution": "uniform",  # uniform | lognormal | fixed
+    "latency": 0.5,  # giây, trung bình (lognormal: median)
+    "jitter": 0.2,  # uniform: ± giây, lognormal: sigma
+    "tail_rate": 0.01,  # tỉ lệ request chậm bất thường
+    "tail_latency": 5.0,
+    "error_rate": 0.0,
+    "error_status": 503,
+    "completion_tokens": 0,  # 0 = theo độ dài JSON; > 0 = pad response tới ~N tokens
+}
+
+stats = {"requests": 0, "errors": 0, "in_flight": 0}
+
+POSITIVE_WORDS = ("tốt", "hài lòng", "tuyệt", "đáng tiền", "thích")
+NEGATIVE_WORDS = ("tệ", "hỏng", "kém", "lỗi", "thất vọng")
+
+
+def fake_analysis(prompt: str) -> dict:
+    """Kết quả sentiment giả nhưng ổn định theo nội dung prompt"""
+    text = prompt.lower()
+    positive = [w for w in POSITIVE_WORDS if w in text]
+    negative = [w for w in NEGATIVE_WORDS if w in text]
+    if positive and not negative:
+        sentiment = "positive"
+    elif negative and not positive:
+        sentiment = "negative"
+    else:
+        sentiment = "neutral"
+    return {
+        "targeted": sentiment != "neutral",
+        "sentiment": sentiment,
+        "confidence": 0.8 if sentiment != "neutral" else 0.4,
+        "keywords": {"positive": positive, "negative": negative},
+        "explanation": f"Kết quả giả lập từ {settings['name']}",
+    }
+
+
+def simulated_latency() -> float:
+    if random.random() < settings["tail_rate"]:
+        return settings["tail_latency"]
+    if settings["distribution"] == "fixed":
+        return settings["latency"]
+    if settings["distribution"] == "lognormal":
+        return random.lognormvariate(math.log(max(settings["latency"], 1e-6)), settings["jitter"])
+    return max(0.0, settings["latency"] + random.uniform(-settings["jitter"], settings["jitter"]))
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    stats["in_flight"] += 1
+    try:
+        await asyncio.sleep(simulated_latency())
+
+        if random.random() < settings["error_rate"]:
+            stats["errors"] += 1
+            return JSONResponse(
+                status_code=settings["error_status"],
+                content={"error": {"message": "Simulated backend error", "type": "server_error"}},
+            )
+
+        prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        content = json.dumps(fake_analysis(prompt), ensure_ascii=False)
+        if settings["completion_tokens"] * 4 > len(content):
+            # Pad sau JSON để giả lập response dài (client vẫn parse được JSON)
+            content += "\n" + " " * (settings["completion_tokens"] * 4 - len(content) - 1)
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", settings["model"]),
+            "system_fingerprint": settings["name"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+    finally:
+        stats["in_flight"] -= 1
+
+
+@app.get("/v1/models")
+def models():
+    return {"object": "list", "data": [{"id": settings["model"], "object": "model", "owned_by": settings["name"]}]}
+
+
+@app.get("/health")
+def health():
+    return {"status": "healthy", "settings": settings, "stats": stats}
+
+
+@app.post("/admin/config")
+async def update_config(request: Request):
+    """Đổi latency / error rate lúc đang chạy, ví dụ {"error_rate": 1.0} để giả lập backend chết"""
+    updates = await request.json()
+    for key, value in updates.items():
+        if key in settings:
+            settings[key] = type(settings[key])(value)
+    return settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible LLM server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--name", default="mock", help="Tên backend (trả về trong system_fingerprint)")
+    parser.add_argument("--model", default="mock-model")
+    parser.add_argument("--distribution", choices=["uniform", "lognormal", "fixed"], default="uniform")
+    parser.add_argument("--latency", type=float, default=0.5, help="Latency trung bình / median (giây)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="uniform: ± giây, lognormal: sigma")
+    parser.add_argument("--tail-rate", type=float, default=0.01)
+    parser.add_argument("--tail-latency", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--completion-tokens", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    settings.update({
+        "name": args.name,
+        "model": args.model,
+        "distribution": args.distribution,
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "tail_rate": args.tail_rate,
+        "tail_latency": args.tail_latency,
+        "error_rate": args.error_rate,
+        "error_status": args.error_status,
+        "completion_tokens": args.completion_tokens,
+    })
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
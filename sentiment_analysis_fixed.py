@@ -1,10 +1,10 @@
 import json
 import re
-import requests
 from fastapi import FastAPI
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 from app.config import LLM_MODEL, OPENAI_API_KEY, OPENAI_URI
+from app.http_pool import http_pool
 
 COMMENT_TYPES = {
     "fbPageComment", "fbGroupComment", "fbUserComment", "forumComment",
@@ -137,7 +137,8 @@ def call_llm(prompt: str) -> dict:
         "Authorization": f"Bearer {OPENAI_API_KEY}",
         "Content-Type": "application/json"
     }
-    resp = requests.post(url, headers=headers, json=payload, timeout=30)
+    # Dùng connection pool chung (keep-alive) thay vì mở TCP/TLS mới cho mỗi call
+    resp = http_pool.sync_client.post(url, headers=headers, json=payload, timeout=30)
     print(resp.text)
     if resp.status_code != 200:
         raise LLMError(f"LLM HTTP {resp.status_code}: {resp.text}")